@@ -8,13 +8,79 @@ import plotly.graph_objects as go
 from datetime import datetime
 import numpy as np
 import os
+import io
+import hashlib
+import json
+import calendar
+import threading
+from types import MappingProxyType
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Try to import openpyxl for Excel support
 try:
     import openpyxl
 except ImportError:
+    openpyxl = None
     st.warning("openpyxl not installed. Excel files won't be supported. Install with: pip install openpyxl")
 
+# Try to import xlrd for legacy .xls workbooks (pandas reads them through it)
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+# Try to import pyarrow for the cleaned-data snapshot cache
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Local directory holding cleaned snapshots of the main load file (Arrow IPC, memory-mappable)
+SNAPSHOT_DIR = os.path.join(".dashboard_cache", "snapshots")
+
+# Persisted load history for incremental mode: every merged export, deduplicated by LOAD ID and
+# partitioned into one Arrow file per Tuesday-anchored WEEK so date-limited views read only their weeks
+STORE_DIR = os.path.join(".dashboard_cache", "store")
+STORE_PARTITION_DIR = os.path.join(STORE_DIR, "weeks")
+STORE_INDEX_PATH = os.path.join(STORE_DIR, "load_index.arrow")
+STORE_MANIFEST_PATH = os.path.join(STORE_DIR, "manifest.json")
+STORE_IDLE_GAPS_PATH = os.path.join(STORE_DIR, "idle_gaps.arrow")
+
+# Bump whenever the cleaning logic in load_data() changes so old snapshots are not reused
+CLEANING_VERSION = "8"
+
+# Default memory ceilings (MB) for memoized KPI results and cached figure specs; adjustable from the sidebar cache panel
+KPI_RESULT_CACHE_MAX_MB = 256
+FIGURE_CACHE_MAX_MB = 128
+
+# Columns of the TMS export the dashboard works with and how each one is typed at ingest.
+# 'category' columns become pandas categoricals with sorted categories, so the same name always
+# gets the same integer code and groupbys/filters run on codes instead of Python strings.
+# Every other export column is skipped at ingest and only read when the detailed data table asks for it.
+LOAD_SCHEMA = {
+    'LOAD ID': 'text',
+    'FC NAME': 'category',
+    'DRIVER NAME': 'category',
+    'DRIVER ID': 'category',
+    'BROKER NAME': 'category',
+    'TRAILER': 'category',
+    'LOAD STATUS': 'category',
+    'CITY TO': 'category',
+    'PICK-UP DATE': 'datetime',
+    'DELIVERY DATE': 'datetime',
+    'DATE UPLOADED TO THE SYSTEM': 'datetime',
+    'BROKER RATE (FC) [$]': 'currency',
+    'DRIVER RATE [$]': 'currency',
+    'FULL MILES TOTAL': 'number',
+}
+
+# Use pyarrow's multithreaded CSV reader when available, otherwise pandas' C parser
+CSV_ENGINE = 'pyarrow' if feather is not None else 'c'
+
+# Dispatch weeks run Tuesday through Monday and are bucketed by DELIVERY DATE
+WEEK_START_WEEKDAY = 1  # 0=Monday, 1=Tuesday, ..., 6=Sunday
+
 # State abbreviation to full name mapping
 STATE_ABBR_TO_FULL = {
     'AL': 'ALABAMA', 'AK': 'ALASKA', 'AZ': 'ARIZONA', 'AR': 'ARKANSAS', 'CA': 'CALIFORNIA',
@@ -29,6 +95,7 @@ STATE_ABBR_TO_FULL = {
     'TX': 'TEXAS', 'UT': 'UTAH', 'VT': 'VERMONT', 'VA': 'VIRGINIA', 'WA': 'WASHINGTON',
     'WV': 'WEST VIRGINIA', 'WI': 'WISCONSIN', 'WY': 'WYOMING'
 }
+STATE_FULL_TO_ABBR = {v: k for k, v in STATE_ABBR_TO_FULL.items()}
 
 st.set_page_config(page_title="JC Dispatch Operational & Performance Dashboard", layout="wide")
 
@@ -129,6 +196,14 @@ else:
     st.sidebar.warning("⚠️ Converted files not found. Run convert_trucking_data.py first.")
     use_converted_files = False
 
+# Incremental mode: upload only the latest export and merge it into the saved load history
+incremental_mode = st.sidebar.checkbox(
+    "Incremental mode (append to saved load history)",
+    value=False,
+    help="Upload only the newest export. Its loads are merged into the local load history by LOAD ID - "
+         "the latest upload wins, so cancellations and rate corrections replace older rows."
+)
+
 # Main data file upload (required for operational data)
 uploaded_file = st.sidebar.file_uploader(
     "Upload your main operational data file (CSV/Excel)",
@@ -139,6 +214,9 @@ uploaded_file = st.sidebar.file_uploader(
 if uploaded_file is not None:
     file_to_use = uploaded_file
     st.sidebar.success(f"✅ File uploaded: {uploaded_file.name}")
+elif incremental_mode and os.path.exists(STORE_MANIFEST_PATH):
+    file_to_use = None
+    st.sidebar.info("📚 No new export uploaded - using the saved load history")
 else:
     st.sidebar.error("Please upload your main operational data file.")
     st.stop()
@@ -149,6 +227,7 @@ st.sidebar.markdown("---")
 
 # Date range filter (will be populated after data loads)
 date_filter_enabled = st.sidebar.checkbox("Enable Date Range Filter", value=False)
+date_filter_container = st.sidebar.container()
 
 # Trucking Made Successful Reference Data
 st.sidebar.title("📊 Reference Data")
@@ -199,89 +278,648 @@ load_history_file = st.sidebar.file_uploader(
 )
 
 # --- Load Data ---
+def get_content_hash(file_bytes):
+    """Hash the raw file bytes together with the cleaning version to key cleaned snapshots"""
+    digest = hashlib.sha256(file_bytes)
+    digest.update(f"cleaning-v{CLEANING_VERSION}".encode())
+    return digest.hexdigest()
+
+def get_snapshot_path(content_hash):
+    return os.path.join(SNAPSHOT_DIR, f"{content_hash}.arrow")
+
+def read_arrow_file(path):
+    """Memory-map an Arrow file written by write_arrow_file(), or return None if it is missing"""
+    if feather is None or not os.path.exists(path):
+        return None
+    try:
+        return feather.read_table(path, memory_map=True).to_pandas()
+    except Exception as e:
+        # A damaged cache file is not fatal - callers fall back to rebuilding it
+        st.sidebar.warning(f"⚠️ Ignoring unreadable cache file {os.path.basename(path)}: {e}")
+        return None
+
+def save_arrow_file(frame, path):
+    """Persist a DataFrame as an uncompressed Arrow file so it can be memory-mapped later"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so a concurrent session never reads a partial file
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    feather.write_feather(frame.reset_index(drop=True), temp_path, compression='uncompressed')
+    os.replace(temp_path, path)
+
+def write_arrow_file(frame, path):
+    """save_arrow_file() that reports failures in the sidebar instead of raising"""
+    if feather is None:
+        return
+    try:
+        save_arrow_file(frame, path)
+    except Exception as e:
+        st.sidebar.warning(f"⚠️ Could not write cache file {os.path.basename(path)}: {e}")
+
+def read_snapshot(content_hash):
+    """Memory-map a cleaned snapshot if one exists for this content hash"""
+    return read_arrow_file(get_snapshot_path(content_hash))
+
+def write_snapshot(load_data, content_hash):
+    write_arrow_file(load_data, get_snapshot_path(content_hash))
+
+def get_raw_snapshot_path(file_bytes):
+    """Location of the converted (uncleaned, all-text) Arrow copy of an Excel upload"""
+    return os.path.join(SNAPSHOT_DIR, f"{hashlib.sha256(file_bytes).hexdigest()}.raw.arrow")
+
+def is_arrow_source(file_source):
+    return isinstance(file_source, str) and file_source.endswith('.arrow')
+
+def read_load_file_columns(file_source):
+    """Read only the header row of the main load file"""
+    if is_arrow_source(file_source):
+        return feather.read_table(file_source, memory_map=True).schema.names
+    if hasattr(file_source, 'seek'):
+        file_source.seek(0)
+    return pd.read_csv(file_source, nrows=0).columns.tolist()
+
+def read_load_file(file_source, columns):
+    """Read the given columns of the main load file as text; typing happens in load_data()"""
+    if is_arrow_source(file_source):
+        # Converted Excel uploads are already stored column-wise as text
+        return feather.read_table(file_source, columns=columns, memory_map=True).to_pandas()
+    if hasattr(file_source, 'seek'):
+        file_source.seek(0)
+    return pd.read_csv(file_source, usecols=columns, dtype={col: str for col in columns}, engine=CSV_ENGINE)
+
+def convert_excel_upload(file_bytes, file_name, raw_path, progress):
+    """Background job: convert an Excel workbook to a raw Arrow snapshot with every column as text"""
+    if file_name.lower().endswith('.xlsx'):
+        # Stream rows in read-only mode so progress can be reported while the workbook is parsed
+        workbook = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            progress['total_rows'] = max((sheet.max_row or 1) - 1, 0)
+            rows = sheet.iter_rows(values_only=True)
+            header = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(next(rows, ()))]
+            records = []
+            for row in rows:
+                records.append(row[:len(header)])
+                if len(records) % 5000 == 0:
+                    progress['rows'] = len(records)
+        finally:
+            workbook.close()
+        raw_data = pd.DataFrame.from_records(records, columns=header).dropna(how='all')
+    else:
+        # Legacy .xls workbooks go through pandas (xlrd); no row-level progress is available
+        raw_data = pd.read_excel(io.BytesIO(file_bytes))
+    
+    # Keep every value as text so load_data() types Excel uploads exactly like CSV uploads
+    for col in raw_data.columns:
+        raw_data[col] = raw_data[col].map(lambda value: None if pd.isna(value) else str(value)).astype(object)
+    save_arrow_file(raw_data, raw_path)
+    progress['rows'] = len(raw_data)
+
+@st.cache_resource
+def get_excel_conversions():
+    """Process-wide background worker and job table for Excel conversions, shared by all sessions"""
+    return {'executor': ThreadPoolExecutor(max_workers=2), 'jobs': {}}
+
+def start_excel_conversion(file_bytes, file_name, raw_path):
+    """Start (or join) the background conversion of an Excel upload"""
+    conversions = get_excel_conversions()
+    job = conversions['jobs'].get(raw_path)
+    if job is None:
+        job = {'file_name': file_name, 'rows': 0, 'total_rows': None}
+        job['future'] = conversions['executor'].submit(convert_excel_upload, file_bytes, file_name, raw_path, job)
+        conversions['jobs'][raw_path] = job
+    return job
+
+@st.fragment(run_every=1)
+def show_excel_conversion_progress(job, raw_path):
+    """Sidebar progress for a running Excel conversion; reruns the app once the snapshot is ready"""
+    if job['future'].done():
+        get_excel_conversions()['jobs'].pop(raw_path, None)
+        if job['future'].exception() is not None:
+            st.error(f"❌ Error converting {job['file_name']}: {job['future'].exception()}")
+            return
+        st.rerun()
+    
+    if job['total_rows']:
+        st.progress(min(job['rows'] / job['total_rows'], 1.0),
+                    text=f"⏳ Converting {job['file_name']}: {job['rows']:,} of {job['total_rows']:,} rows")
+    else:
+        st.progress(0.0, text=f"⏳ Converting {job['file_name']}...")
+
+def category_contains(series, pattern):
+    """Case-insensitive substring match on a categorical column, evaluated once per category"""
+    category_matches = series.cat.categories.str.contains(pattern, case=False, regex=False)
+    # Missing values have code -1, which picks the trailing False
+    lookup = np.append(np.asarray(category_matches, dtype=bool), False)
+    return pd.Series(lookup[series.cat.codes.to_numpy()], index=series.index)
+
+@st.cache_resource
+def get_city_state_cache():
+    """Process-wide CITY TO -> state code cache shared by every session and upload"""
+    return {}
+
+def resolve_city_states(cities):
+    """State code per city string (format: "CITY, ST"), running the regex only for cities not seen before"""
+    city_states = get_city_state_cache()
+    new_cities = [city for city in cities if city not in city_states]
+    if new_cities:
+        new_states = pd.Series(new_cities, dtype=str).str.extract(r',\s*([A-Z]{2})$')[0]
+        city_states.update(zip(new_cities, new_states))
+    return [city_states[city] for city in cities]
+
+def add_destination_state(load_data):
+    """Add the categorical STATE_TO column, resolving each distinct CITY TO once and looking rows up by code"""
+    cities = load_data['CITY TO'].astype('category')
+    city_states = pd.Index(resolve_city_states(list(cities.cat.categories)), dtype=object)
+    state_categories = pd.Index(sorted(city_states.dropna().unique()), dtype=object)
+    # Missing cities and cities without a state have code -1
+    state_codes = np.append(state_categories.get_indexer(city_states), -1)
+    return load_data.assign(STATE_TO=pd.Categorical.from_codes(state_codes[cities.cat.codes.to_numpy()],
+                                                               categories=state_categories))
+
+def add_week_calendar(load_data):
+    """Add the Tuesday-to-Monday week calendar shared by all KPIs: WEEK (start), WEEK_END, WEEKDAY
+    (day of that week, 0 = Tuesday ... 6 = Monday) and ISO_WEEK (ISO week number of the week start)"""
+    delivery_day = load_data['DELIVERY DATE'].dt.normalize()
+    
+    # Days to subtract to get back to the Tuesday that starts the week (Tuesday=0 ... Monday=6)
+    days_since_week_start = (delivery_day.dt.weekday - WEEK_START_WEEKDAY) % 7
+    
+    load_data['WEEK'] = delivery_day - pd.to_timedelta(days_since_week_start, unit='D')
+    load_data['WEEK_END'] = load_data['WEEK'] + pd.Timedelta(days=6)
+    load_data['WEEKDAY'] = days_since_week_start.astype('Int8')
+    load_data['ISO_WEEK'] = load_data['WEEK'].dt.isocalendar().week.astype('UInt8')
+    return load_data
+
 @st.cache_data
-def load_data(file_source):
+def load_data(_file_source, content_hash):
+    # The uploaded file itself is not hashed by Streamlit - content_hash identifies it
+    snapshot = read_snapshot(content_hash)
+    if snapshot is not None:
+        st.sidebar.info(f"⚡ Loaded cleaned data snapshot ({len(snapshot):,} loads)")
+        return snapshot
+    
     try:
-        # Load the data from uploaded file or default file
-        if isinstance(file_source, str):
-            load_data = pd.read_csv(file_source)
-        else:
-            load_data = pd.read_csv(file_source)
-        
-        # Clean and preprocess the data
-        load_data['DELIVERY DATE'] = pd.to_datetime(load_data['DELIVERY DATE'], errors='coerce')
-        load_data['PICK-UP DATE'] = pd.to_datetime(load_data['PICK-UP DATE'], errors='coerce')
-        load_data['DATE UPLOADED TO THE SYSTEM'] = pd.to_datetime(load_data['DATE UPLOADED TO THE SYSTEM'], errors='coerce')
-        
-        # Convert timezone-aware datetimes to timezone-naive to avoid comparison issues
-        for col in ['DATE UPLOADED TO THE SYSTEM', 'PICK-UP DATE', 'DELIVERY DATE']:
-            if col in load_data.columns and load_data[col].dt.tz is not None:
-                load_data[col] = load_data[col].dt.tz_localize(None)
+        # Load only the columns declared in LOAD_SCHEMA from the uploaded file or default file
+        schema_columns = [col for col in read_load_file_columns(_file_source) if col in LOAD_SCHEMA]
+        load_data = read_load_file(_file_source, schema_columns)
+        
+        # Remember each load's row in the raw file so skipped columns can be joined back later
+        load_data['SOURCE_ROW'] = np.arange(len(load_data), dtype='int64')
+        
+        # Clean and preprocess the data according to the declared schema
+        for col, kind in LOAD_SCHEMA.items():
+            if col not in load_data.columns:
+                continue
+            if kind == 'datetime':
+                load_data[col] = pd.to_datetime(load_data[col], errors='coerce')
+                # Convert timezone-aware datetimes to timezone-naive to avoid comparison issues
+                if load_data[col].dt.tz is not None:
+                    load_data[col] = load_data[col].dt.tz_localize(None)
+            elif kind == 'currency':
+                # Convert currency columns to numeric, removing commas and dollar signs
+                load_data[col] = pd.to_numeric(load_data[col].str.replace(',', '').str.replace('$', ''), errors='coerce')
+            elif kind == 'number':
+                load_data[col] = pd.to_numeric(load_data[col], errors='coerce')
+            elif kind == 'category':
+                load_data[col] = load_data[col].astype(pd.CategoricalDtype(sorted(load_data[col].dropna().unique())))
         
         # Filter out AMAZON RELAY loads as requested
         if 'BROKER NAME' in load_data.columns:
-            load_data = load_data[~load_data['BROKER NAME'].str.contains('AMAZON RELAY', case=False, na=False)]
+            load_data = load_data[~category_contains(load_data['BROKER NAME'], 'AMAZON RELAY')]
             st.sidebar.info(f"Filtered out AMAZON RELAY loads. Remaining loads: {len(load_data)}")
         
-        # Filter out canceled loads as they are not invoiced
+        # Flag canceled loads (not invoiced) instead of dropping them so the cancellation
+        # analysis can reuse this frame. Invoiced loads are ordered first so the invoiced and
+        # canceled views are plain row slices.
         if 'LOAD STATUS' in load_data.columns:
-            initial_count = len(load_data)
-            load_data = load_data[~load_data['LOAD STATUS'].str.contains('cancel', case=False, na=False)]
-            canceled_count = initial_count - len(load_data)
-            st.sidebar.info(f"Filtered out {canceled_count} canceled loads. Remaining loads: {len(load_data)}")
+            load_data['IS_CANCELED'] = category_contains(load_data['LOAD STATUS'], 'cancel')
+        else:
+            load_data['IS_CANCELED'] = False
+        load_data = load_data.sort_values('IS_CANCELED', kind='stable').reset_index(drop=True)
+        canceled_count = int(load_data['IS_CANCELED'].sum())
+        st.sidebar.info(f"Flagged {canceled_count} canceled loads. Invoiced loads: {len(load_data) - canceled_count}")
         
-        # Convert currency columns to numeric, removing commas and dollar signs
-        load_data['BROKER RATE (FC) [$]'] = pd.to_numeric(load_data['BROKER RATE (FC) [$]'].astype(str).str.replace(',', '').str.replace('$', ''), errors='coerce')
-        load_data['DRIVER RATE [$]'] = pd.to_numeric(load_data['DRIVER RATE [$]'].astype(str).str.replace(',', '').str.replace('$', ''), errors='coerce')
-        load_data['FULL MILES TOTAL'] = pd.to_numeric(load_data['FULL MILES TOTAL'], errors='coerce')
+        # Create the shared week calendar based on DELIVERY DATE - Week starts on Tuesday, ends on Monday
+        load_data = add_week_calendar(load_data)
         
-        # Create week column based on DELIVERY DATE - Week starts on Tuesday, ends on Monday
-        # This ensures weeks are counted using DELIVERY DATE as the indicator
-        def get_week_start_tuesday(delivery_date):
-            if pd.isna(delivery_date):
-                return None
-            # Convert to datetime if it's not already
-            if isinstance(delivery_date, str):
-                delivery_date = pd.to_datetime(delivery_date, errors='coerce')
-            if pd.isna(delivery_date):
-                return None
-            
-            # Get the day of week (0=Monday, 1=Tuesday, ..., 6=Sunday)
-            day_of_week = delivery_date.weekday()
-            
-            # Calculate days to subtract to get to the previous Tuesday
-            # If delivery_date is Tuesday (1), subtract 0 days
-            # If delivery_date is Wednesday (2), subtract 1 day
-            # If delivery_date is Thursday (3), subtract 2 days
-            # If delivery_date is Friday (4), subtract 3 days
-            # If delivery_date is Saturday (5), subtract 4 days
-            # If delivery_date is Sunday (6), subtract 5 days
-            # If delivery_date is Monday (0), subtract 6 days
-            days_to_subtract = (day_of_week - 1) % 7
-            
-            # Get the Tuesday that starts this week
-            week_start_tuesday = delivery_date - pd.Timedelta(days=days_to_subtract)
-            return week_start_tuesday
+        # Create BOOKING TIME column for use throughout the dashboard
+        load_data['BOOKING TIME'] = load_data['DATE UPLOADED TO THE SYSTEM']
         
-        load_data['WEEK'] = load_data['DELIVERY DATE'].apply(get_week_start_tuesday)
+        # Destination state from CITY TO (KPI 4)
+        if 'CITY TO' in load_data.columns:
+            load_data = add_destination_state(load_data)
         
-        # Create BOOKING TIME column for use throughout the dashboard
-        load_data['BOOKING TIME'] = pd.to_datetime(load_data['DATE UPLOADED TO THE SYSTEM'], errors='coerce')
-        if load_data['BOOKING TIME'].dt.tz is not None:
-            load_data['BOOKING TIME'] = load_data['BOOKING TIME'].dt.tz_localize(None)
+        # Drop categories that only appeared in filtered-out rows (categories stay sorted)
+        for col in load_data.select_dtypes('category').columns:
+            load_data[col] = load_data[col].cat.remove_unused_categories()
+        
+        write_snapshot(load_data, content_hash)
         
         return load_data
     except Exception as e:
         st.error(f"Error loading data: {e}")
         return pd.DataFrame()
 
-# Load the main data
-df = load_data(file_to_use)
+@st.cache_data
+def load_extra_columns(_file_source, content_hash):
+    """Lazily read the export columns skipped at ingest, indexed by their row in the raw file"""
+    extra_columns = [col for col in read_load_file_columns(_file_source) if col not in LOAD_SCHEMA]
+    if not extra_columns:
+        return pd.DataFrame()
+    return read_load_file(_file_source, extra_columns)
+
+def concat_frames(frames):
+    """Concatenate frames, unioning categories so categorical columns stay categorical"""
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    for col in frames[0].select_dtypes('category').columns:
+        categories = sorted(set().union(*(frame[col].cat.categories for frame in frames if col in frame.columns)))
+        frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) if col in frame.columns else frame
+                  for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+# --- Idle Gaps (KPI 5) ---
+IDLE_GAP_COLUMNS = ['LOAD ID', 'DRIVER ID', 'DRIVER NAME', 'FC NAME', 'WEEK', 'PICK-UP DATE', 'DELIVERY DATE']
+
+def compute_idle_gaps(loads):
+    """Per-driver timeline of invoiced loads with the idle days until the driver's next pickup.
+    One global sort by driver and delivery date; each load's next pickup is the following row of the same driver."""
+    if loads.empty or not all(col in loads.columns for col in IDLE_GAP_COLUMNS):
+        return pd.DataFrame(columns=IDLE_GAP_COLUMNS + ['NEXT PICKUP', 'IDLE DAYS'])
+    if 'IS_CANCELED' in loads.columns:
+        loads = loads[~loads['IS_CANCELED']]
+    
+    idle_gaps = loads[IDLE_GAP_COLUMNS].sort_values(['DRIVER ID', 'DELIVERY DATE'], kind='stable').reset_index(drop=True)
+    same_driver = idle_gaps['DRIVER ID'].eq(idle_gaps['DRIVER ID'].shift(-1))
+    idle_gaps['NEXT PICKUP'] = idle_gaps['PICK-UP DATE'].shift(-1).where(same_driver)
+    idle_gaps['IDLE DAYS'] = (idle_gaps['NEXT PICKUP'] - idle_gaps['DELIVERY DATE']).dt.days
+    return idle_gaps
+
+def extend_idle_gaps(idle_gaps, delta, replaced_ids):
+    """Merge new loads into an idle-gap table, re-sorting only the drivers that gained or lost loads"""
+    delta_gaps = compute_idle_gaps(delta)
+    replaced = idle_gaps['LOAD ID'].isin(replaced_ids)
+    touched_drivers = set(delta_gaps['DRIVER ID'].dropna()) | set(idle_gaps.loc[replaced, 'DRIVER ID'].dropna())
+    
+    kept = idle_gaps[~replaced]
+    touched = kept['DRIVER ID'].isin(touched_drivers)
+    recomputed = compute_idle_gaps(concat_frames([kept.loc[touched, IDLE_GAP_COLUMNS], delta_gaps[IDLE_GAP_COLUMNS]]))
+    return concat_frames([kept[~touched], recomputed])
+
+@st.cache_data
+def load_idle_gaps(_loads, content_hash):
+    """Idle-gap table for one upload, computed once from the whole normalized file and snapshotted next to it"""
+    gaps_path = get_snapshot_path(f"{content_hash}.idle_gaps")
+    idle_gaps = read_arrow_file(gaps_path)
+    if idle_gaps is None:
+        idle_gaps = compute_idle_gaps(_loads)
+        if not idle_gaps.empty:
+            write_arrow_file(idle_gaps, gaps_path)
+    return idle_gaps
+
+# --- Load History Store (incremental mode) ---
+def concat_loads(frames):
+    """Concatenate normalized load frames, unioning categories so categorical columns stay categorical"""
+    combined = concat_frames(frames)
+    if combined.empty:
+        return combined
+    # Keep invoiced loads first so the invoiced/canceled views stay row slices
+    return combined.sort_values('IS_CANCELED', kind='stable').reset_index(drop=True)
+
+def get_partition_keys(weeks):
+    """Partition key per load: the WEEK start as YYYY-MM-DD, or 'undated' without a delivery date"""
+    return weeks.dt.strftime('%Y-%m-%d').fillna('undated')
+
+def get_partition_path(partition_key):
+    return os.path.join(STORE_PARTITION_DIR, f"week={partition_key}.arrow")
+
+def list_store_partitions():
+    """Partition keys in the store, oldest week first ('undated' sorts last)"""
+    if not os.path.isdir(STORE_PARTITION_DIR):
+        return []
+    return sorted(name[len('week='):-len('.arrow')] for name in os.listdir(STORE_PARTITION_DIR)
+                  if name.startswith('week=') and name.endswith('.arrow'))
+
+def read_store_manifest():
+    if not os.path.exists(STORE_MANIFEST_PATH):
+        return {'store_version': '', 'cleaning_version': CLEANING_VERSION, 'merged_uploads': []}
+    with open(STORE_MANIFEST_PATH) as f:
+        return json.load(f)
+
+def write_store_manifest(manifest):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    temp_path = f"{STORE_MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, STORE_MANIFEST_PATH)
+
+def write_store_partitions(loads, load_index, replaced_ids, affected_keys):
+    """Rewrite only the affected weekly partitions and the LOAD ID -> partition index"""
+    load_keys = get_partition_keys(loads['WEEK'])
+    for partition_key in affected_keys:
+        partition_path = get_partition_path(partition_key)
+        existing = read_arrow_file(partition_path)
+        if existing is not None:
+            existing = existing[~existing['LOAD ID'].isin(replaced_ids)]
+        partition = concat_loads([existing, loads[load_keys == partition_key]])
+        if partition.empty:
+            if os.path.exists(partition_path):
+                os.remove(partition_path)
+        else:
+            write_arrow_file(partition, partition_path)
+    
+    new_entries = pd.DataFrame({'LOAD ID': loads['LOAD ID'].to_numpy(), 'PARTITION': load_keys.to_numpy()})
+    load_index = pd.concat([load_index[~load_index['LOAD ID'].isin(replaced_ids)], new_entries], ignore_index=True)
+    write_arrow_file(load_index, STORE_INDEX_PATH)
+    return load_index
+
+def read_store_idle_gaps():
+    """The load history's idle-gap table, written alongside the partitions on every merge"""
+    idle_gaps = read_arrow_file(STORE_IDLE_GAPS_PATH)
+    return idle_gaps if idle_gaps is not None else compute_idle_gaps(pd.DataFrame())
+
+def merge_into_store(delta, content_hash, export_load_ids):
+    """Merge a normalized export into the load history; rows from the newer export win per LOAD ID"""
+    manifest = read_store_manifest()
+    if content_hash in manifest['merged_uploads']:
+        return None
+    
+    # The last row in file order wins, as the IS_CANCELED sort in load_data moved canceled rows to the end
+    delta = delta.sort_values('SOURCE_ROW').drop_duplicates('LOAD ID', keep='last').sort_values('IS_CANCELED', kind='stable')
+    delta = delta.assign(SOURCE_ROW=-1)  # raw-file rows only make sense for a single upload
+    load_index = read_arrow_file(STORE_INDEX_PATH)
+    if load_index is None:
+        load_index = pd.DataFrame({'LOAD ID': pd.Series(dtype=str), 'PARTITION': pd.Series(dtype=str)})
+    
+    # Compare against every LOAD ID in the raw export, so a load the new export drops at
+    # ingest (e.g. now booked through AMAZON RELAY) also replaces its older row. Only the weeks
+    # holding replaced rows or new rows are rewritten.
+    replaced_keys = load_index.loc[load_index['LOAD ID'].isin(export_load_ids), 'PARTITION']
+    affected_keys = sorted(set(replaced_keys) | set(get_partition_keys(delta['WEEK'])))
+    idle_gaps = read_store_idle_gaps()
+    load_index = write_store_partitions(delta, load_index, export_load_ids, affected_keys)
+    
+    # Idle gaps only change for drivers with new or replaced loads
+    write_arrow_file(extend_idle_gaps(idle_gaps, delta, export_load_ids), STORE_IDLE_GAPS_PATH)
+    
+    manifest['merged_uploads'].append(content_hash)
+    manifest['store_version'] = hashlib.sha256(f"{manifest['store_version']}{content_hash}".encode()).hexdigest()
+    write_store_manifest(manifest)
+    return len(delta), len(load_index), len(affected_keys)
+
+@st.cache_data
+def load_store(store_version, partition_keys):
+    """Read the given weekly partitions of the load history; store_version changes on every merge"""
+    return concat_loads([read_arrow_file(get_partition_path(partition_key)) for partition_key in partition_keys])
+
+@st.cache_data
+def load_store_idle_gaps(store_version):
+    return read_store_idle_gaps()
+
+def select_week_range(weeks):
+    """Sidebar week range picker for the date range filter, defaulting to the last 8 weeks"""
+    weeks = [pd.Timestamp(week) for week in weeks]
+    if len(weeks) < 2:
+        return (weeks[0], weeks[0]) if weeks else (None, None)
+    with date_filter_container:
+        return st.select_slider(
+            "Delivery weeks (Tuesday start):",
+            options=weeks,
+            value=(weeks[max(len(weeks) - 8, 0)], weeks[-1]),
+            format_func=lambda week: week.strftime('%b %d, %Y')
+        )
+
+# Load the main data (keyed by a hash of the file contents so repeat uploads reuse the snapshot)
+content_hash = get_content_hash(uploaded_file.getvalue()) if uploaded_file is not None else None
+
+# Excel uploads are converted once, in a background worker, to a columnar snapshot that
+# load_data() then reads like a CSV. Repeat opens of the same workbook skip the conversion.
+if uploaded_file is not None and uploaded_file.name.lower().endswith(('.xlsx', '.xls')):
+    if feather is None or openpyxl is None:
+        st.error("Excel uploads need openpyxl and pyarrow. Install with: pip install openpyxl pyarrow")
+        st.stop()
+    if uploaded_file.name.lower().endswith('.xls') and xlrd is None:
+        st.error("Legacy .xls workbooks need xlrd. Install with: pip install xlrd, or save the workbook as .xlsx")
+        st.stop()
+    raw_path = get_raw_snapshot_path(uploaded_file.getvalue())
+    if not os.path.exists(raw_path):
+        excel_job = start_excel_conversion(uploaded_file.getvalue(), uploaded_file.name, raw_path)
+        with st.sidebar:
+            show_excel_conversion_progress(excel_job, raw_path)
+        st.info("⏳ Converting the Excel workbook - the dashboard will load automatically when it is ready.")
+        st.stop()
+    file_to_use = raw_path
+
+if incremental_mode:
+    if feather is None:
+        st.error("Incremental mode needs pyarrow to persist the load history. Install with: pip install pyarrow")
+        st.stop()
+    
+    store_manifest = read_store_manifest()
+    if store_manifest['cleaning_version'] != CLEANING_VERSION:
+        st.sidebar.warning("⚠️ The saved load history was built by an older version of the dashboard and is not migrated, so columns derived at ingest (such as destination states) may be missing. Clear it and re-upload your exports.")
+    
+    # Only a new export is normalized and re-read for its LOAD IDs; the history is read back from the store
+    if content_hash in store_manifest['merged_uploads']:
+        st.sidebar.info("ℹ️ This export is already part of the load history")
+    elif content_hash is not None:
+        if 'LOAD ID' not in read_load_file_columns(file_to_use):
+            st.error("❌ Incremental mode matches loads by LOAD ID, but this export has no LOAD ID column. Turn off incremental mode to analyze it as a single file.")
+            st.stop()
+        delta = load_data(file_to_use, content_hash)
+        if not delta.empty:
+            export_load_ids = read_load_file(file_to_use, ['LOAD ID'])['LOAD ID']
+            merge_result = merge_into_store(delta, content_hash, export_load_ids)
+            if merge_result is not None:
+                st.sidebar.success(f"✅ Merged {merge_result[0]:,} loads into history ({merge_result[1]:,} loads total, {merge_result[2]} weekly partitions updated)")
+    
+    # Partition pruning: with the date range filter on, only the selected weeks are read from disk
+    partition_keys = list_store_partitions()
+    if date_filter_enabled:
+        dated_keys = [key for key in partition_keys if key != 'undated']
+        week_start, week_end = select_week_range(pd.to_datetime(dated_keys))
+        selected_keys = [key for key in dated_keys if week_start is None or week_start <= pd.Timestamp(key) <= week_end]
+        date_filter_container.caption(f"Reading {len(selected_keys)} of {len(partition_keys)} weekly partitions")
+        partition_keys = selected_keys
+    
+    store_version = read_store_manifest()['store_version']
+    df_all = load_store(store_version, tuple(partition_keys))
+    idle_gaps = load_store_idle_gaps(store_version)
+    dataset_fingerprint = get_content_hash(f"store-{store_version}:{','.join(partition_keys)}".encode())
+    
+    if st.sidebar.button("🗑️ Clear saved load history"):
+        for partition_key in list_store_partitions():
+            os.remove(get_partition_path(partition_key))
+        for path in [STORE_INDEX_PATH, STORE_MANIFEST_PATH, STORE_IDLE_GAPS_PATH]:
+            if os.path.exists(path):
+                os.remove(path)
+        st.rerun()
+else:
+    df_all = load_data(file_to_use, content_hash)
+    idle_gaps = load_idle_gaps(df_all, content_hash)
+    dataset_fingerprint = content_hash
+    
+    # Without a store the whole file is already in memory, so the date range filter is a row filter
+    if date_filter_enabled and not df_all.empty:
+        week_start, week_end = select_week_range(sorted(df_all['WEEK'].dropna().unique()))
+        if week_start is not None:
+            df_all = df_all[df_all['WEEK'].between(week_start, week_end)]
+            dataset_fingerprint = f"{content_hash}:{week_start:%Y-%m-%d}:{week_end:%Y-%m-%d}"
+
+# Invoiced view (KPIs 1-7, 9) and cancellation view (KPI 8) of the same normalized frame.
+# load_data() orders invoiced loads first, so both views are row slices rather than new parses.
+invoiced_count = int((~df_all['IS_CANCELED']).sum()) if 'IS_CANCELED' in df_all.columns else len(df_all)
+df = df_all.iloc[:invoiced_count]
+df_canceled = df_all.iloc[invoiced_count:]
+
+# --- Dispatcher x Driver x Week Cube ---
+CUBE_KEYS = ['FC NAME', 'DRIVER NAME', 'WEEK']
+
+# Cube measure -> (load column, aggregation)
+CUBE_MEASURES = {
+    'BROKER RATE (FC) [$]': ('BROKER RATE (FC) [$]', 'sum'),
+    'DRIVER RATE [$]': ('DRIVER RATE [$]', 'sum'),
+    'FULL MILES TOTAL': ('FULL MILES TOTAL', 'sum'),
+    'Load Count': ('DELIVERY DATE', 'size'),
+    'Broker Rate Count': ('BROKER RATE (FC) [$]', 'count'),
+    'FIRST PICKUP': ('PICK-UP DATE', 'min'),
+    'FIRST DELIVERY': ('DELIVERY DATE', 'min'),
+    'LAST DELIVERY': ('DELIVERY DATE', 'max'),
+    'LAST DELIVERY WEEKDAY': ('WEEKDAY', 'max'),
+    'WEEK_END': ('WEEK_END', 'first'),
+    'ISO_WEEK': ('ISO_WEEK', 'first'),
+}
+
+@st.cache_data
+def build_load_cube(_loads, dataset_fingerprint):
+    """Invoiced loads pre-aggregated per dispatcher, driver and week, so KPIs roll up from a few
+    hundred cube rows instead of scanning every load. Cached per dataset fingerprint."""
+    if _loads.empty or not all(column in _loads.columns for column in CUBE_KEYS):
+        return pd.DataFrame(columns=CUBE_KEYS + list(CUBE_MEASURES))
+    
+    measures = {name: spec for name, spec in CUBE_MEASURES.items() if spec[0] in _loads.columns}
+    # dropna=False keeps loads with a missing dispatcher/driver/week, so totals over the cube match the table
+    return _loads.groupby(CUBE_KEYS, observed=True, dropna=False).agg(**measures).reset_index()
+
+load_cube = build_load_cube(df, dataset_fingerprint)
+
+# --- Booking Histograms (KPI 6 and 7) ---
+HISTOGRAM_KEYS = ['FC NAME', 'WEEK']
+
+# Prebook hours (booking to pickup) are counted in fixed 6-hour bins up to two weeks;
+# the last bin collects every load booked further ahead
+PREBOOK_HOUR_BIN_WIDTH = 6
+PREBOOK_HOUR_BIN_EDGES = np.arange(0, 14 * 24 + PREBOOK_HOUR_BIN_WIDTH, PREBOOK_HOUR_BIN_WIDTH)
+
+def strip_timezone(timestamps):
+    """Timezone-naive copy of a datetime column"""
+    timestamps = pd.to_datetime(timestamps, errors='coerce')
+    return timestamps.dt.tz_localize(None) if timestamps.dt.tz is not None else timestamps
+
+def count_by_key(group_ids, group_count, bins, bin_count):
+    """(group_count x bin_count) matrix of row counts; rows with a negative bin are skipped"""
+    valid = bins >= 0
+    counts = np.bincount(group_ids[valid] * bin_count + bins[valid], minlength=group_count * bin_count)
+    return counts.reshape(group_count, bin_count)
+
+@st.cache_data
+def build_booking_histograms(_loads, dataset_fingerprint):
+    """Prebook-hour and booking-hour counts per dispatcher and week: a key frame plus one small count
+    array per key, so KPI 6 and 7 draw bars from fixed-size counts. Cached per dataset fingerprint."""
+    prebook_bin_count = len(PREBOOK_HOUR_BIN_EDGES)  # the last bin is the overflow bin
+    if _loads.empty or not all(column in _loads.columns for column in HISTOGRAM_KEYS + ['BOOKING TIME', 'PICK-UP DATE']):
+        return {
+            'keys': pd.DataFrame(columns=HISTOGRAM_KEYS),
+            'prebook_hours': np.zeros((0, prebook_bin_count), dtype=np.int64),
+            'booking_hours': np.zeros((0, 24), dtype=np.int64),
+        }
+    
+    grouped = _loads.groupby(HISTOGRAM_KEYS, observed=True, dropna=False)
+    group_ids = grouped.ngroup().to_numpy()
+    keys = grouped.size().reset_index()[HISTOGRAM_KEYS]
+    
+    booking_time = strip_timezone(_loads['BOOKING TIME'])
+    prebook_hours = ((strip_timezone(_loads['PICK-UP DATE']) - booking_time).dt.total_seconds() / 3600).to_numpy()
+    with np.errstate(invalid='ignore'):
+        prebook_bins = np.where(prebook_hours >= 0, np.searchsorted(PREBOOK_HOUR_BIN_EDGES, prebook_hours, side='right') - 1, -1)
+    booking_hours = booking_time.dt.hour.fillna(-1).to_numpy(dtype=np.int64)
+    return {
+        'keys': keys,
+        'prebook_hours': count_by_key(group_ids, len(keys), prebook_bins, prebook_bin_count),
+        'booking_hours': count_by_key(group_ids, len(keys), booking_hours, 24),
+    }
+
+def select_histogram_rows(histograms, mask):
+    """Booking histograms restricted to the keys where mask is True"""
+    return {
+        'keys': histograms['keys'][mask].reset_index(drop=True),
+        'prebook_hours': histograms['prebook_hours'][mask],
+        'booking_hours': histograms['booking_hours'][mask],
+    }
+
+def sum_histograms_by_dispatcher(histograms, name):
+    """Counts of one booking histogram summed over weeks, one row per dispatcher"""
+    return pd.DataFrame(histograms[name]).groupby(histograms['keys']['FC NAME'].to_numpy(), observed=True).sum()
+
+booking_histograms = build_booking_histograms(df, dataset_fingerprint)
+
+# --- Dispatcher / Driver Filter Index ---
+FILTER_INDEX_COLUMNS = ['FC NAME', 'DRIVER NAME']
+
+@st.cache_resource(max_entries=4)
+def build_filter_index(_loads, dataset_fingerprint):
+    """Sorted row positions (into the invoiced loads) for every dispatcher and driver, built in one argsort
+    pass, so multiselect filters become position unions/intersections instead of isin scans. Shared
+    read-only across reruns and sessions per dataset fingerprint."""
+    filter_index = {'all_rows': np.arange(len(_loads))}
+    for column in FILTER_INDEX_COLUMNS:
+        if column not in _loads.columns:
+            continue
+        values = _loads[column].astype('category')
+        codes = values.cat.codes.to_numpy()
+        # Stable sort keeps positions ascending within each value; missing values (code -1) sort first
+        positions = np.argsort(codes, kind='stable')[np.count_nonzero(codes < 0):]
+        counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+        filter_index[column] = {
+            'values': values.cat.categories,
+            'positions': positions,
+            'offsets': np.concatenate([[0], np.cumsum(counts)]),
+        }
+        positions.flags.writeable = False
+    filter_index['all_rows'].flags.writeable = False
+    return filter_index
+
+def select_filter_rows(filter_index, column, selected_values, within=None):
+    """Sorted row positions whose column matches any selected value, optionally restricted to other positions"""
+    column_index = filter_index[column]
+    value_positions = column_index['values'].get_indexer(list(selected_values))
+    offsets = column_index['offsets']
+    slices = [column_index['positions'][offsets[value]:offsets[value + 1]] for value in value_positions[value_positions >= 0]]
+    rows = np.sort(np.concatenate(slices)) if slices else np.empty(0, dtype=np.intp)
+    return np.intersect1d(rows, within, assume_unique=True) if within is not None else rows
+
+# Columns the KPIs read from the globally filtered view and from the KPI 4 destination selections;
+# only these are gathered at the selected positions, the detailed table reads the full rows on demand
+GLOBAL_VIEW_COLUMNS = ['LOAD ID', 'FC NAME', 'DRIVER NAME', 'WEEK', 'BOOKING TIME', 'BROKER RATE (FC) [$]', 'FULL MILES TOTAL']
+DESTINATION_COLUMNS = ['CITY TO', 'STATE_TO', 'TRAILER']
+
+def read_filter_rows(loads, rows, columns=None):
+    """The loads at sorted row positions, limited to the given columns (those present); no rows are
+    gathered when every row is selected"""
+    if columns is not None:
+        loads = loads[[column for column in columns if column in loads.columns]]
+    return loads if len(rows) == len(loads) else loads.iloc[rows]
+
+# Selections read the invoiced loads through row positions; df is the globally filtered view
+invoiced_loads = df
+filter_index = build_filter_index(invoiced_loads, dataset_fingerprint)
+global_filter_rows = filter_index['all_rows']
 
 # --- Global Dispatcher Filter ---
 if not df.empty and 'FC NAME' in df.columns:
     # Get unique dispatchers for global filter
-    all_dispatchers = sorted(df['FC NAME'].dropna().astype(str).unique())
+    all_dispatchers = sorted(df['FC NAME'].dropna().unique())
     
     st.sidebar.markdown("---")
     st.sidebar.subheader("🎯 Global Dispatcher Filter")
@@ -296,17 +934,133 @@ if not df.empty and 'FC NAME' in df.columns:
     
     # Apply global dispatcher filter
     if selected_global_dispatchers:
-        df = df[df['FC NAME'].isin(selected_global_dispatchers)]
-        st.sidebar.success(f"✅ Filtered to {len(selected_global_dispatchers)} dispatcher(s): {", ".join(selected_global_dispatchers)}")
+        global_filter_rows = select_filter_rows(filter_index, 'FC NAME', selected_global_dispatchers)
+        load_cube = load_cube[load_cube['FC NAME'].isin(selected_global_dispatchers)]
+        booking_histograms = select_histogram_rows(booking_histograms, booking_histograms['keys']['FC NAME'].isin(selected_global_dispatchers).to_numpy())
+        st.sidebar.success(f"✅ Filtered to {len(selected_global_dispatchers)} dispatcher(s): {', '.join(selected_global_dispatchers)}")
     else:
         st.sidebar.info("ℹ️ Showing data for all dispatchers")
     
     st.sidebar.markdown("---")
 
+df = read_filter_rows(invoiced_loads, global_filter_rows, GLOBAL_VIEW_COLUMNS)
+
+# --- KPI Result and Figure Caches ---
+def new_lru_cache(max_mb):
+    """Empty LRU store: entries in recency order, their total size, a memory ceiling and hit/miss counters"""
+    return {
+        'entries': OrderedDict(),
+        'bytes': 0,
+        'max_bytes': max_mb * 1024 * 1024,
+        'hits': 0,
+        'misses': 0,
+        'evictions': 0,
+        'lock': threading.Lock(),
+    }
+
+def lru_cache_get(cache, key):
+    """Cached value for key (marked most recently used), or None on a miss"""
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            cache['hits'] += 1
+            return cache['entries'][key][0]
+        cache['misses'] += 1
+        return None
+
+def lru_cache_put(cache, key, value, size):
+    """Store a value of the given size, evicting least recently used entries to stay under the ceiling"""
+    with cache['lock']:
+        if key not in cache['entries'] and size <= cache['max_bytes']:
+            cache['entries'][key] = (value, size)
+            cache['bytes'] += size
+            trim_lru_cache(cache)
+
+def trim_lru_cache(cache):
+    """Evict least recently used entries until the cache fits its memory ceiling (lock held)"""
+    while cache['entries'] and cache['bytes'] > cache['max_bytes']:
+        _, (_, size) = cache['entries'].popitem(last=False)
+        cache['bytes'] -= size
+        cache['evictions'] += 1
+
+@st.cache_resource
+def get_kpi_result_cache():
+    """Process-wide LRU store of KPI result frames"""
+    return new_lru_cache(KPI_RESULT_CACHE_MAX_MB)
+
+@st.cache_resource
+def get_figure_cache():
+    """Process-wide LRU store of serialized Plotly figure specs"""
+    return new_lru_cache(FIGURE_CACHE_MAX_MB)
+
+def get_result_bytes(result):
+    """Approximate in-memory size of a KPI result (a frame, a series or a tuple of them)"""
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, pd.Series):
+        return int(result.memory_usage(deep=True))
+    if isinstance(result, tuple):
+        return sum(get_result_bytes(item) for item in result)
+    return 0
+
+def copy_result(result):
+    """Copy of a cached result, so callers can add display columns without touching the cache"""
+    if isinstance(result, tuple):
+        return tuple(copy_result(item) for item in result)
+    return result.copy() if isinstance(result, (pd.DataFrame, pd.Series)) else result
+
+def normalize_selection(selected_values, all_values=None):
+    """Order-independent cache key for a multiselect. An empty selection (no filter, so rows with a blank
+    value stay in) and a full selection (which drops them) get their own sentinel keys."""
+    selection = tuple(sorted({str(value) for value in selected_values}))
+    if not selection:
+        return 'NONE'
+    if all_values is not None and len(selection) == len({str(value) for value in all_values}):
+        return 'ALL'
+    return selection
+
+def get_kpi_result(kpi_name, filter_key, params, compute):
+    """KPI result memoized per (dataset fingerprint, global filter, KPI filter selection, parameters)"""
+    key = (kpi_name, dataset_fingerprint, global_filter_key, filter_key, params)
+    result = lru_cache_get(kpi_result_cache, key)
+    if result is None:
+        result = compute()
+        lru_cache_put(kpi_result_cache, key, result, get_result_bytes(result))
+    return copy_result(result)
+
+def get_frame_hash(data):
+    """Content hash of the aggregated frame(s) behind a chart: values, index, column names and dtypes"""
+    digest = hashlib.md5()
+    for frame in data if isinstance(data, tuple) else (data,):
+        if frame is None:
+            digest.update(b'None')
+            continue
+        columns = list(frame.columns) if isinstance(frame, pd.DataFrame) else [frame.name]
+        digest.update(f"{columns}|{frame.dtypes}|{len(frame)}".encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def get_cached_figure(chart_name, data, options, build_figure):
+    """Plotly figure rebuilt from its cached JSON spec while the aggregated input frame(s) and the chart
+    options are unchanged; build_figure() (plotly express and layout updates) only runs on a miss"""
+    key = (chart_name, get_frame_hash(data), options)
+    spec = lru_cache_get(figure_cache, key)
+    if spec is not None:
+        # The spec was produced by a validated figure, so it is not validated again
+        return go.Figure(json.loads(spec), _validate=False)
+    fig = build_figure()
+    spec = fig.to_json(validate=False)
+    lru_cache_put(figure_cache, key, spec, len(spec))
+    return fig
+
+kpi_result_cache = get_kpi_result_cache()
+figure_cache = get_figure_cache()
+global_filter_key = normalize_selection(selected_global_dispatchers, all_dispatchers) if not df.empty and 'FC NAME' in df.columns else 'NONE'
+
 # Display global filter status in main area
 if not df.empty:
     if selected_global_dispatchers:
-        st.info(f"🎯 **Global Filter Active**: Showing data for {len(selected_global_dispatchers)} dispatcher(s): {", ".join(selected_global_dispatchers)} | 📊 **Total Records**: {len(df):,}")
+        st.info(f"🎯 **Global Filter Active**: Showing data for {len(selected_global_dispatchers)} dispatcher(s): {', '.join(selected_global_dispatchers)} | 📊 **Total Records**: {len(df):,}")
     else:
         st.info(f"ℹ️ **Global Filter**: Showing data for all dispatchers | 📊 **Total Records**: {len(df):,}")
 
@@ -336,1439 +1090,1752 @@ def process_trucking_made_successful_data(df):
         st.sidebar.error(f"❌ Error processing Trucking Made Successful data: {e}")
         return None
 
+# Converted Trucking Made Successful files: reference key, path, label for status messages
+CONVERTED_REFERENCE_FILES = [
+    ('market', "Trucking_Made_Successful_Data/market_data.csv", "market data"),
+    ('dead_zones', "Trucking_Made_Successful_Data/dead_zones_data.csv", "dead zones data"),
+    ('market_rates', "Trucking_Made_Successful_Data/market_rates_by_state.csv", "market rates data"),
+]
+
 @st.cache_data
+def load_reference_file(_file_source, content_hash, file_name, tms_format):
+    """Parse one reference file. Cached per file by content hash, so changing one file re-parses only that file.
+    Returns the data and whether it was recognized as the Trucking Made Successful (name/value) format."""
+    if hasattr(_file_source, 'seek'):
+        _file_source.seek(0)
+    if file_name.endswith('.csv'):
+        data = pd.read_csv(_file_source)
+    else:
+        data = pd.read_excel(_file_source)
+    
+    if tms_format:
+        # Process Trucking Made Successful format
+        processed = process_trucking_made_successful_data(data)
+        if processed is not None:
+            return processed, True
+    return data, False
+
 def load_reference_data(market_file, dead_zones_file, market_rates_file, driver_fc_file, load_history_file, use_converted_files=False):
+    """Reference data by key, plus the content hash of each loaded file (the reference-data fingerprint)"""
     reference_data = {}
+    reference_hashes = {}
     
     # Load converted files directly if enabled
     if use_converted_files:
         try:
-            # Load market data
-            market_data = pd.read_csv("Trucking_Made_Successful_Data/market_data.csv")
-            reference_data['market'] = market_data
-            st.sidebar.success("✅ Converted market data loaded")
-            
-            # Load dead zones data
-            dead_zones_data = pd.read_csv("Trucking_Made_Successful_Data/dead_zones_data.csv")
-            reference_data['dead_zones'] = dead_zones_data
-            st.sidebar.success("✅ Converted dead zones data loaded")
-            
-            # Load market rates data
-            rates_data = pd.read_csv("Trucking_Made_Successful_Data/market_rates_by_state.csv")
-            reference_data['market_rates'] = rates_data
-            st.sidebar.success("✅ Converted market rates data loaded")
-            
+            for key, path, label in CONVERTED_REFERENCE_FILES:
+                with open(path, 'rb') as f:
+                    content_hash = hashlib.sha256(f.read()).hexdigest()
+                reference_data[key], _ = load_reference_file(path, content_hash, path, False)
+                reference_hashes[key] = content_hash
+                st.sidebar.success(f"✅ Converted {label} loaded")
         except Exception as e:
             st.sidebar.error(f"❌ Error loading converted files: {e}")
-            return {}
+            return {}, {}
     
     else:
-        # Load market data from uploaded file
-        if market_file is not None:
-            try:
-                if market_file.name.endswith('.csv'):
-                    market_data = pd.read_csv(market_file)
-                else:
-                    market_data = pd.read_excel(market_file)
-                
-                # Process Trucking Made Successful format
-                processed_market = process_trucking_made_successful_data(market_data)
-                if processed_market is not None:
-                    reference_data['market'] = processed_market
-                    st.sidebar.success(f"✅ Market data loaded: {market_file.name}")
-                else:
-                    reference_data['market'] = market_data
-                    st.sidebar.success(f"✅ Market data loaded (standard format): {market_file.name}")
-            except Exception as e:
-                st.sidebar.error(f"❌ Error loading market data: {e}")
-        
-        # Load dead zones data from uploaded file
-        if dead_zones_file is not None:
-            try:
-                if dead_zones_file.name.endswith('.csv'):
-                    dead_zones_data = pd.read_csv(dead_zones_file)
-                else:
-                    dead_zones_data = pd.read_excel(dead_zones_file)
-                
-                # Process Trucking Made Successful format
-                processed_dead_zones = process_trucking_made_successful_data(dead_zones_data)
-                if processed_dead_zones is not None:
-                    reference_data['dead_zones'] = processed_dead_zones
-                    st.sidebar.success(f"✅ Dead zones data loaded: {dead_zones_file.name}")
-                else:
-                    reference_data['dead_zones'] = dead_zones_data
-                    st.sidebar.success(f"✅ Dead zones data loaded (standard format): {dead_zones_file.name}")
-            except Exception as e:
-                st.sidebar.error(f"❌ Error loading dead zones data: {e}")
-        
-        # Load market rates data from uploaded file
-        if market_rates_file is not None:
+        # Load market data, dead zones and market rates from uploaded files
+        uploads = [
+            ('market', market_file, "Market data", "market data"),
+            ('dead_zones', dead_zones_file, "Dead zones data", "dead zones data"),
+            ('market_rates', market_rates_file, "Market rates", "market rates"),
+        ]
+        for key, upload, label, error_label in uploads:
+            if upload is None:
+                continue
             try:
-                if market_rates_file.name.endswith('.csv'):
-                    rates_data = pd.read_csv(market_rates_file)
-                else:
-                    rates_data = pd.read_excel(market_rates_file)
-                
-                # Process Trucking Made Successful format
-                processed_rates = process_trucking_made_successful_data(rates_data)
-                if processed_rates is not None:
-                    reference_data['market_rates'] = processed_rates
-                    st.sidebar.success(f"✅ Market rates loaded: {market_rates_file.name}")
+                reference_hashes[key] = hashlib.sha256(upload.getvalue()).hexdigest()
+                reference_data[key], tms_format = load_reference_file(upload, reference_hashes[key], upload.name, True)
+                if tms_format:
+                    st.sidebar.success(f"✅ {label} loaded: {upload.name}")
                 else:
-                    reference_data['market_rates'] = rates_data
-                    st.sidebar.success(f"✅ Market rates loaded (standard format): {market_rates_file.name}")
+                    st.sidebar.success(f"✅ {label} loaded (standard format): {upload.name}")
             except Exception as e:
-                st.sidebar.error(f"❌ Error loading market rates: {e}")
-    
-    # Load driver-FC mapping (always from upload)
-    if driver_fc_file is not None:
-        try:
-            if driver_fc_file.name.endswith('.csv'):
-                reference_data['driver_fc'] = pd.read_csv(driver_fc_file)
-            else:
-                reference_data['driver_fc'] = pd.read_excel(driver_fc_file)
-            st.sidebar.success(f"✅ Driver-FC mapping loaded: {driver_fc_file.name}")
-        except Exception as e:
-            st.sidebar.error(f"❌ Error loading driver-FC mapping: {e}")
-    
-    # Load load history (always from upload)
-    if load_history_file is not None:
+                st.sidebar.error(f"❌ Error loading {error_label}: {e}")
+    
+    # Load driver-FC mapping and load history (always from upload)
+    uploads = [
+        ('driver_fc', driver_fc_file, "Driver-FC mapping", "driver-FC mapping"),
+        ('load_history', load_history_file, "Load history", "load history"),
+    ]
+    for key, upload, label, error_label in uploads:
+        if upload is None:
+            continue
         try:
-            if load_history_file.name.endswith('.csv'):
-                reference_data['load_history'] = pd.read_csv(load_history_file)
-            else:
-                reference_data['load_history'] = pd.read_excel(load_history_file)
-            st.sidebar.success(f"✅ Load history loaded: {load_history_file.name}")
+            reference_hashes[key] = hashlib.sha256(upload.getvalue()).hexdigest()
+            reference_data[key], _ = load_reference_file(upload, reference_hashes[key], upload.name, False)
+            st.sidebar.success(f"✅ {label} loaded: {upload.name}")
         except Exception as e:
-            st.sidebar.error(f"❌ Error loading load history: {e}")
+            st.sidebar.error(f"❌ Error loading {error_label}: {e}")
     
-    return reference_data
+    return reference_data, reference_hashes
 
 # Load reference data
-reference_data = load_reference_data(market_data_file, dead_zones_file, market_rates_file, driver_fc_file, load_history_file, use_converted_files)
+reference_data, reference_hashes = load_reference_data(market_data_file, dead_zones_file, market_rates_file, driver_fc_file, load_history_file, use_converted_files)
 
 if df.empty:
     st.error("No data loaded. Please check if the CSV file exists.")
     st.stop()
 
 # --- KPI: Full-Week Active Drivers Overview ---
-st.subheader("🟢 Full-Week Active Drivers (Tuesday to Monday)")
+# Day names in week order (Tuesday first), indexed by days since the week start
+WEEK_DAY_NAMES = [calendar.day_name[(WEEK_START_WEEKDAY + offset) % 7] for offset in range(7)]
 
-try:
-    # Create a copy of the dataframe to avoid modifying the original
-    df_full_week = df.copy()
-    
-    # Ensure dates are datetime
-    df_full_week['PICK-UP DATE'] = pd.to_datetime(df_full_week['PICK-UP DATE'], errors='coerce')
-    df_full_week['DELIVERY DATE'] = pd.to_datetime(df_full_week['DELIVERY DATE'], errors='coerce')
-    
-    # Remove rows with invalid dates
-    df_full_week = df_full_week.dropna(subset=['PICK-UP DATE', 'DELIVERY DATE'])
-    
-    if df_full_week.empty:
-        st.warning("⚠️ No valid date data available for Full-Week Active Drivers analysis.")
-    else:
-        # Calculate week start (Tuesday) for each delivery date
-        def get_week_start_tuesday(delivery_date):
-            # Get the Monday of the week containing delivery_date
-            monday = delivery_date - pd.to_timedelta(delivery_date.weekday(), unit='d')
-            # Add 1 day to get Tuesday
-            tuesday = monday + pd.to_timedelta(1, unit='d')
-            return tuesday
-        
-        df_full_week['WEEK_START'] = df_full_week['DELIVERY DATE'].apply(get_week_start_tuesday)
-        
-        # Group by driver and week
-        weekly_driver = df_full_week.groupby(['DRIVER NAME', 'WEEK_START']).agg({
-            'PICK-UP DATE': 'min',
-            'DELIVERY DATE': 'max',
-            'FULL MILES TOTAL': 'sum',
-            'BROKER RATE (FC) [$]': 'sum',
-            'LOAD ID': 'count',
-            'FC NAME': 'first'  # Get dispatcher name
-        }).reset_index()
-        
-        # Calculate RPM
-        weekly_driver['RPM'] = weekly_driver['BROKER RATE (FC) [$]'] / weekly_driver['FULL MILES TOTAL']
-        weekly_driver['RPM'] = weekly_driver['RPM'].fillna(0)
-        
-        # Define full-week criteria: drivers with activity spanning most of the week
-        weekly_driver['WEEK_END'] = weekly_driver['WEEK_START'] + pd.to_timedelta(6, unit='d')  # Monday
-        
-        # Calculate the span of activity for each driver-week
-        weekly_driver['ACTIVITY_SPAN'] = (weekly_driver['DELIVERY DATE'] - weekly_driver['PICK-UP DATE']).dt.days
-        
-        # A driver is considered "full-week active" if they have activity spanning at least 5 days
-        # OR if they start early in the week (Tuesday/Wednesday) and end late in the week (Sunday/Monday)
-        weekly_driver['IS_FULL_WEEK'] = (
-            (weekly_driver['ACTIVITY_SPAN'] >= 5) |  # Activity spans at least 5 days
-            (
-                (weekly_driver['PICK-UP DATE'] <= weekly_driver['WEEK_START'] + pd.to_timedelta(1, unit='d')) &  # Start by Wednesday
-                (weekly_driver['DELIVERY DATE'] >= weekly_driver['WEEK_END'] - pd.to_timedelta(1, unit='d'))     # End by Sunday
-            )
-        )
-        
-        # Filter only full-week active drivers
-        full_week_drivers = weekly_driver[weekly_driver['IS_FULL_WEEK'] == True].copy()
-        
-        # Debug information
-        st.write(f"📊 **Data Analysis:**")
-        st.write(f"- Total driver-week combinations: {len(weekly_driver)}")
-        st.write(f"- Drivers with activity span ≥ 5 days: {len(weekly_driver[weekly_driver['ACTIVITY_SPAN'] >= 5])}")
-        st.write(f"- Drivers starting early and ending late: {len(weekly_driver[(weekly_driver['PICK-UP DATE'] <= weekly_driver['WEEK_START'] + pd.to_timedelta(1, unit='d')) & (weekly_driver['DELIVERY DATE'] >= weekly_driver['WEEK_END'] - pd.to_timedelta(1, unit='d'))])}")
-        st.write(f"- Full-week active drivers found: {len(full_week_drivers)}")
-        
-        if not full_week_drivers.empty:
-            # Display summary metrics
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("Full-Week Active Drivers", len(full_week_drivers))
-            with col2:
-                total_miles = full_week_drivers['FULL MILES TOTAL'].sum()
-                st.metric("Total Miles", f"{total_miles:,.0f}")
-            with col3:
-                total_revenue = full_week_drivers['BROKER RATE (FC) [$]'].sum()
-                st.metric("Total Revenue", f"${total_revenue:,.0f}")
-            with col4:
-                avg_rpm = full_week_drivers['RPM'].mean()
-                st.metric("Average RPM", f"${avg_rpm:.2f}")
-            
-            # Timeline-style Gantt Chart
-            st.markdown("### 🚛 Activity Span of Full-Week Drivers")
-            gantt_data = full_week_drivers.rename(columns={
-                'PICK-UP DATE': 'Start',
-                'DELIVERY DATE': 'Finish',
-                'FC NAME': 'Dispatcher'
-            })
-            
-            fig_gantt = px.timeline(
-                gantt_data,
-                x_start="Start",
-                x_end="Finish",
-                y="DRIVER NAME",
-                color="Dispatcher",
-                hover_data=["RPM", "LOAD ID", "FULL MILES TOTAL"],
-                title="Driver Activity Timeline (Full-Week Active Drivers)"
-            )
-            fig_gantt.update_yaxes(autorange="reversed")
-            fig_gantt.update_layout(
-                xaxis_title="Date",
-                yaxis_title="Driver Name",
-                height=400
-            )
-            st.plotly_chart(fig_gantt, use_container_width=True)
-            
-            # Bar Chart for Weekly RPM
-            st.markdown("### 📊 Weekly RPM for Full-Week Drivers")
-            fig_rpm = px.bar(
-                full_week_drivers,
-                x="DRIVER NAME",
-                y="RPM",
-                color="RPM",
-                hover_data=["FULL MILES TOTAL", "BROKER RATE (FC) [$]", "LOAD ID"],
-                title="Rate per Mile by Full-Week Active Driver"
-            )
-            fig_rpm.update_layout(
-                xaxis_title="Driver Name",
-                yaxis_title="Rate per Mile ($)",
-                height=400
+@st.cache_data
+def build_driver_week_activity(cube):
+    """Per driver-week activity rolled up from the load cube: first pickup, last delivery, span, miles, revenue and loads"""
+    cube = cube.dropna(subset=['DRIVER NAME', 'WEEK'])
+    weekly_driver = cube.groupby(['DRIVER NAME', 'WEEK'], observed=True).agg(**{
+        'PICK-UP DATE': ('FIRST PICKUP', 'min'),
+        'DELIVERY DATE': ('LAST DELIVERY', 'max'),
+        'LAST DELIVERY WEEKDAY': ('LAST DELIVERY WEEKDAY', 'max'),
+        'WEEK_END': ('WEEK_END', 'first'),
+        'FULL MILES TOTAL': ('FULL MILES TOTAL', 'sum'),
+        'BROKER RATE (FC) [$]': ('BROKER RATE (FC) [$]', 'sum'),
+        'LOAD ID': ('Load Count', 'sum'),
+    }).reset_index()
+    weekly_driver = weekly_driver.dropna(subset=['PICK-UP DATE', 'DELIVERY DATE'])
+    
+    # Dispatcher: the one with the most loads for the driver that week
+    dispatchers = (cube.dropna(subset=['FC NAME'])
+                   .sort_values('Load Count', ascending=False, kind='stable')
+                   .drop_duplicates(['DRIVER NAME', 'WEEK'])[['DRIVER NAME', 'WEEK', 'FC NAME']])
+    weekly_driver = weekly_driver.merge(dispatchers, on=['DRIVER NAME', 'WEEK'], how='left')
+    
+    weekly_driver['RPM'] = (weekly_driver['BROKER RATE (FC) [$]'] / weekly_driver['FULL MILES TOTAL']).fillna(0)
+    weekly_driver['ACTIVITY_SPAN'] = (weekly_driver['DELIVERY DATE'] - weekly_driver['PICK-UP DATE']).dt.days
+    return weekly_driver
+
+def flag_full_week(weekly_driver, min_span_days=5, start_by_day=1, end_from_day=5):
+    """Full-week flags per driver-week: a long enough activity span, or an early start and late finish.
+    start_by_day / end_from_day are days since the week start (1 = Wednesday, 5 = Sunday), as in WEEKDAY."""
+    long_span = weekly_driver['ACTIVITY_SPAN'] >= min_span_days
+    early_start_late_finish = (
+        (weekly_driver['PICK-UP DATE'] <= weekly_driver['WEEK'] + pd.Timedelta(days=start_by_day)) &
+        (weekly_driver['LAST DELIVERY WEEKDAY'] >= end_from_day)
+    )
+    return long_span, early_start_late_finish, long_span | early_start_late_finish
+
+# High-cardinality mode: past this many full-week driver-weeks the timeline and RPM charts switch to
+# WebGL traces, keep the top drivers and fold everyone else into one "Others" band per week
+FULL_WEEK_HIGH_CARDINALITY_ROWS = 1000
+FULL_WEEK_TOP_DRIVERS = 25
+OTHER_DRIVERS_LABEL = "Others"
+
+def split_top_drivers(full_week_drivers, top_n):
+    """(top driver-weeks, other driver-weeks), ranking drivers by full weeks and then by revenue"""
+    ranking = full_week_drivers.groupby('DRIVER NAME', observed=True).agg(
+        weeks=('WEEK', 'size'), revenue=('BROKER RATE (FC) [$]', 'sum')
+    ).sort_values(['weeks', 'revenue'], ascending=False)
+    is_top = full_week_drivers['DRIVER NAME'].isin(ranking.index[:top_n])
+    return full_week_drivers[is_top], full_week_drivers[~is_top]
+
+def summarize_other_drivers(other_drivers):
+    """One row per week for the drivers outside the top N: earliest start, latest finish, drivers, totals and RPM"""
+    others = other_drivers.groupby('WEEK').agg(**{
+        'PICK-UP DATE': ('PICK-UP DATE', 'min'),
+        'DELIVERY DATE': ('DELIVERY DATE', 'max'),
+        'DRIVERS': ('DRIVER NAME', 'nunique'),
+        'FULL MILES TOTAL': ('FULL MILES TOTAL', 'sum'),
+        'BROKER RATE (FC) [$]': ('BROKER RATE (FC) [$]', 'sum'),
+        'LOAD ID': ('LOAD ID', 'sum'),
+    }).reset_index()
+    others['RPM'] = (others['BROKER RATE (FC) [$]'] / others['FULL MILES TOTAL']).fillna(0)
+    return others
+
+def interleave_segments(starts, finishes):
+    """start, finish, gap triples so one line trace draws a separate segment per row"""
+    points = np.empty(len(starts) * 3, dtype=object)
+    points[0::3] = list(starts)
+    points[1::3] = list(finishes)
+    points[2::3] = None
+    return points
+
+def repeat_segment_data(*columns):
+    """Per-point customdata rows for interleave_segments() traces (each row's values on both segment ends)"""
+    rows = np.column_stack([np.asarray(column, dtype=object) for column in columns])
+    return np.repeat(rows, 3, axis=0).tolist()
+
+def build_webgl_timeline_figure(top_drivers, others, others_label):
+    """Driver activity timeline as WebGL line segments (one trace per dispatcher) plus the Others band"""
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    for position, (dispatcher, rows) in enumerate(top_drivers.groupby('FC NAME', observed=True, dropna=False)):
+        fig.add_trace(go.Scattergl(
+            x=interleave_segments(rows['PICK-UP DATE'], rows['DELIVERY DATE']),
+            y=interleave_segments(rows['DRIVER NAME'].astype(str), rows['DRIVER NAME'].astype(str)),
+            customdata=repeat_segment_data(rows['WEEK'].dt.strftime('%b %d, %Y'), rows['RPM'].round(2)),
+            mode='lines+markers', line=dict(width=8, color=colors[position % len(colors)]), marker=dict(size=4),
+            name=str(dispatcher), hovertemplate="%{y}<br>%{x}<br>Week %{customdata[0]}<br>RPM $%{customdata[1]}<extra></extra>"
+        ))
+    if not others.empty:
+        fig.add_trace(go.Scattergl(
+            x=interleave_segments(others['PICK-UP DATE'], others['DELIVERY DATE']),
+            y=interleave_segments([others_label] * len(others), [others_label] * len(others)),
+            customdata=repeat_segment_data(others['WEEK'].dt.strftime('%Y-%m-%d'), others['DRIVERS']),
+            mode='lines+markers', line=dict(width=8, color='lightgray'), marker=dict(size=8, color='gray'),
+            name=OTHER_DRIVERS_LABEL,
+            hovertemplate="%{customdata[1]} other drivers<br>Week of %{customdata[0]}<br>Click for details<extra></extra>"
+        ))
+    driver_order = top_drivers['DRIVER NAME'].astype(str).unique().tolist() + ([others_label] if not others.empty else [])
+    fig.update_yaxes(categoryorder='array', categoryarray=driver_order, autorange="reversed")
+    fig.update_layout(
+        title="Driver Activity Timeline (Full-Week Active Drivers)",
+        xaxis_title="Date",
+        yaxis_title="Driver Name",
+        legend_title="Dispatcher",
+        height=max(400, 18 * len(driver_order))
+    )
+    return fig
+
+def build_webgl_rpm_figure(top_drivers, others, others_label):
+    """Weekly RPM per driver as WebGL markers, plus one marker per week for the Others band"""
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(
+        x=top_drivers['DRIVER NAME'].astype(str), y=top_drivers['RPM'],
+        customdata=np.column_stack([top_drivers['WEEK'].dt.strftime('%b %d, %Y'), top_drivers['LOAD ID']]),
+        mode='markers', marker=dict(size=9, color=top_drivers['RPM'], coloraxis='coloraxis'), name="Drivers",
+        hovertemplate="%{x}<br>RPM $%{y:.2f}<br>Week %{customdata[0]}<br>%{customdata[1]} loads<extra></extra>"
+    ))
+    if not others.empty:
+        fig.add_trace(go.Scattergl(
+            x=[others_label] * len(others), y=others['RPM'],
+            customdata=np.column_stack([others['WEEK'].dt.strftime('%Y-%m-%d'), others['DRIVERS']]),
+            mode='markers', marker=dict(size=11, symbol='diamond', color=others['RPM'], coloraxis='coloraxis'),
+            name=OTHER_DRIVERS_LABEL,
+            hovertemplate="%{customdata[1]} other drivers<br>RPM $%{y:.2f}<br>Week of %{customdata[0]}<br>Click for details<extra></extra>"
+        ))
+    fig.update_layout(
+        title="Rate per Mile by Full-Week Active Driver",
+        xaxis_title="Driver Name",
+        yaxis_title="Rate per Mile ($)",
+        coloraxis=dict(colorscale='Plasma', colorbar_title="RPM"),
+        showlegend=False,
+        height=400
+    )
+    return fig
+
+def get_selected_other_weeks(*chart_events):
+    """Weeks of the Others band points selected in the high-cardinality charts"""
+    weeks = {
+        point['customdata'][0]
+        for chart_event in chart_events if chart_event
+        for point in chart_event.selection.points
+        if point.get('customdata') and any(str(point.get(axis, '')).startswith(OTHER_DRIVERS_LABEL) for axis in ('x', 'y'))
+    }
+    return sorted(pd.to_datetime(list(weeks)))
+
+@st.fragment
+def show_full_week_active_drivers():
+    """Full-Week Active Drivers section; its criteria widgets rerun only this section"""
+    st.subheader("🟢 Full-Week Active Drivers (Tuesday to Monday)")
+
+    try:
+        with st.expander("⚙️ Full-Week Criteria", expanded=False):
+            min_span_days = st.number_input("Minimum activity span (days):", min_value=1, max_value=7, value=5)
+            start_by_day, end_from_day = st.select_slider(
+                "Start by / finish from:",
+                options=list(range(7)),
+                value=(1, 5),
+                format_func=lambda offset: WEEK_DAY_NAMES[offset]
             )
-            st.plotly_chart(fig_rpm, use_container_width=True)
-            
-            # Interactive summary table
-            st.markdown("### 📋 Full-Week Driver Summary Table")
-            summary_table = full_week_drivers[[
-                'DRIVER NAME', 'WEEK_START', 'PICK-UP DATE', 'DELIVERY DATE',
-                'FULL MILES TOTAL', 'BROKER RATE (FC) [$]', 'RPM', 'LOAD ID', 'FC NAME'
-            ]].rename(columns={
-                'LOAD ID': 'Total Loads',
-                'FULL MILES TOTAL': 'Total Miles',
-                'BROKER RATE (FC) [$]': 'Total Revenue',
-                'WEEK_START': 'Week Start (Tuesday)',
-                'FC NAME': 'Dispatcher'
-            })
-            
-            # Format dates for display
-            summary_table['Week Start (Tuesday)'] = summary_table['Week Start (Tuesday)'].dt.strftime('%b %d, %Y')
-            summary_table['PICK-UP DATE'] = summary_table['PICK-UP DATE'].dt.strftime('%b %d, %Y')
-            summary_table['DELIVERY DATE'] = summary_table['DELIVERY DATE'].dt.strftime('%b %d, %Y')
-            summary_table['RPM'] = summary_table['RPM'].apply(lambda x: f"${x:.2f}")
-            summary_table['Total Revenue'] = summary_table['Total Revenue'].apply(lambda x: f"${x:,.0f}")
-            summary_table['Total Miles'] = summary_table['Total Miles'].apply(lambda x: f"{x:,.0f}")
-            
-            st.dataframe(summary_table, use_container_width=True, hide_index=True)
-            
+
+        # Driver-week activity from the cube (no pass over the raw loads)
+        weekly_driver = build_driver_week_activity(load_cube) if 'FULL MILES TOTAL' in load_cube.columns else pd.DataFrame()
+
+        if weekly_driver.empty:
+            st.warning("⚠️ No valid date data available for Full-Week Active Drivers analysis.")
         else:
-            st.info("ℹ️ No drivers found that meet the full-week active criteria (activity spanning at least 5 days OR early start/late finish).")
-            
-except Exception as e:
-    st.error(f"❌ Error in Full-Week Active Drivers analysis: {str(e)}")
-    st.info("Please check that your data contains valid PICK-UP DATE and DELIVERY DATE columns.")
+            # A driver is considered "full-week active" if they have activity spanning at least the minimum span
+            # OR if they start early in the week (default Wednesday) and end late in the week (default Sunday)
+            long_span, early_start_late_finish, is_full_week = flag_full_week(weekly_driver, min_span_days, start_by_day, end_from_day)
+            weekly_driver['IS_FULL_WEEK'] = is_full_week
+
+            # Filter only full-week active drivers
+            full_week_drivers = weekly_driver[weekly_driver['IS_FULL_WEEK'] == True].copy()
+
+            # Debug information
+            st.write(f"📊 **Data Analysis:**")
+            st.write(f"- Total driver-week combinations: {len(weekly_driver)}")
+            st.write(f"- Drivers with activity span ≥ {min_span_days} days: {long_span.sum()}")
+            st.write(f"- Drivers starting early and ending late: {early_start_late_finish.sum()}")
+            st.write(f"- Full-week active drivers found: {len(full_week_drivers)}")
+
+            if not full_week_drivers.empty:
+                # Display summary metrics
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Full-Week Active Drivers", len(full_week_drivers))
+                with col2:
+                    total_miles = full_week_drivers['FULL MILES TOTAL'].sum()
+                    st.metric("Total Miles", f"{total_miles:,.0f}")
+                with col3:
+                    total_revenue = full_week_drivers['BROKER RATE (FC) [$]'].sum()
+                    st.metric("Total Revenue", f"${total_revenue:,.0f}")
+                with col4:
+                    avg_rpm = full_week_drivers['RPM'].mean()
+                    st.metric("Average RPM", f"${avg_rpm:.2f}")
+
+                # Large fleets switch to WebGL traces with the top drivers and an Others band
+                col1, col2 = st.columns(2)
+                with col1:
+                    high_cardinality = st.checkbox(
+                        "High-cardinality mode (WebGL, top drivers + Others band)",
+                        value=len(full_week_drivers) > FULL_WEEK_HIGH_CARDINALITY_ROWS,
+                        key="full_week_high_cardinality",
+                        help=f"On by default above {FULL_WEEK_HIGH_CARDINALITY_ROWS:,} full-week driver-weeks"
+                    )
+                with col2:
+                    top_n = st.number_input("Top drivers shown:", min_value=5, max_value=500, value=FULL_WEEK_TOP_DRIVERS, step=5,
+                                            key="full_week_top_drivers", disabled=not high_cardinality)
+
+                if high_cardinality:
+                    top_drivers, other_drivers = split_top_drivers(full_week_drivers, top_n)
+                    others = summarize_other_drivers(other_drivers)
+                    others_label = f"{OTHER_DRIVERS_LABEL} ({other_drivers['DRIVER NAME'].nunique()} drivers)"
+
+                    st.markdown("### 🚛 Activity Span of Full-Week Drivers")
+                    fig_gantt = get_cached_figure('full_week_timeline_webgl', (top_drivers, others), (others_label,),
+                                                  lambda: build_webgl_timeline_figure(top_drivers, others, others_label))
+                    timeline_event = st.plotly_chart(fig_gantt, use_container_width=True, on_select="rerun",
+                                                     selection_mode="points", key="full_week_timeline_chart")
+
+                    st.markdown("### 📊 Weekly RPM for Full-Week Drivers")
+                    fig_rpm = get_cached_figure('full_week_rpm_webgl', (top_drivers, others), (others_label,),
+                                                lambda: build_webgl_rpm_figure(top_drivers, others, others_label))
+                    rpm_event = st.plotly_chart(fig_rpm, use_container_width=True, on_select="rerun",
+                                                selection_mode="points", key="full_week_rpm_chart")
+
+                    # Others band detail, built only for the weeks clicked in either chart
+                    selected_other_weeks = get_selected_other_weeks(timeline_event, rpm_event)
+                    if selected_other_weeks:
+                        st.markdown(f"#### 🔍 {OTHER_DRIVERS_LABEL} - " + ", ".join(week.strftime('%b %d, %Y') for week in selected_other_weeks))
+                        other_detail = other_drivers[other_drivers['WEEK'].isin(selected_other_weeks)]
+                        st.dataframe(
+                            other_detail[['DRIVER NAME', 'FC NAME', 'WEEK', 'PICK-UP DATE', 'DELIVERY DATE', 'FULL MILES TOTAL', 'BROKER RATE (FC) [$]', 'RPM', 'LOAD ID']]
+                            .sort_values('BROKER RATE (FC) [$]', ascending=False)
+                            .rename(columns={'LOAD ID': 'Total Loads', 'FC NAME': 'Dispatcher'}),
+                            use_container_width=True, hide_index=True
+                        )
+                    elif not others.empty:
+                        st.caption(f"Click the {OTHER_DRIVERS_LABEL} band in either chart to list its drivers for that week.")
+                else:
+                    # Timeline-style Gantt Chart
+                    st.markdown("### 🚛 Activity Span of Full-Week Drivers")
+                    def build_gantt_figure():
+                        gantt_data = full_week_drivers.rename(columns={
+                            'PICK-UP DATE': 'Start',
+                            'DELIVERY DATE': 'Finish',
+                            'FC NAME': 'Dispatcher'
+                        })
+
+                        fig_gantt = px.timeline(
+                            gantt_data,
+                            x_start="Start",
+                            x_end="Finish",
+                            y="DRIVER NAME",
+                            color="Dispatcher",
+                            hover_data=["RPM", "LOAD ID", "FULL MILES TOTAL"],
+                            title="Driver Activity Timeline (Full-Week Active Drivers)"
+                        )
+                        fig_gantt.update_yaxes(autorange="reversed")
+                        fig_gantt.update_layout(
+                            xaxis_title="Date",
+                            yaxis_title="Driver Name",
+                            height=400
+                        )
+                        return fig_gantt
+
+                    fig_gantt = get_cached_figure('full_week_timeline', full_week_drivers, (), build_gantt_figure)
+                    st.plotly_chart(fig_gantt, use_container_width=True)
+
+                    # Bar Chart for Weekly RPM
+                    st.markdown("### 📊 Weekly RPM for Full-Week Drivers")
+                    def build_rpm_figure():
+                        fig_rpm = px.bar(
+                            full_week_drivers,
+                            x="DRIVER NAME",
+                            y="RPM",
+                            color="RPM",
+                            hover_data=["FULL MILES TOTAL", "BROKER RATE (FC) [$]", "LOAD ID"],
+                            title="Rate per Mile by Full-Week Active Driver"
+                        )
+                        fig_rpm.update_layout(
+                            xaxis_title="Driver Name",
+                            yaxis_title="Rate per Mile ($)",
+                            height=400
+                        )
+                        return fig_rpm
+
+                    fig_rpm = get_cached_figure('full_week_rpm', full_week_drivers, (), build_rpm_figure)
+                    st.plotly_chart(fig_rpm, use_container_width=True)
+
+                # Interactive summary table
+                st.markdown("### 📋 Full-Week Driver Summary Table")
+                summary_table = full_week_drivers[[
+                    'DRIVER NAME', 'WEEK', 'PICK-UP DATE', 'DELIVERY DATE',
+                    'FULL MILES TOTAL', 'BROKER RATE (FC) [$]', 'RPM', 'LOAD ID', 'FC NAME'
+                ]].rename(columns={
+                    'LOAD ID': 'Total Loads',
+                    'FULL MILES TOTAL': 'Total Miles',
+                    'BROKER RATE (FC) [$]': 'Total Revenue',
+                    'WEEK': 'Week Start (Tuesday)',
+                    'FC NAME': 'Dispatcher'
+                })
+
+                # Format dates for display
+                summary_table['Week Start (Tuesday)'] = summary_table['Week Start (Tuesday)'].dt.strftime('%b %d, %Y')
+                summary_table['PICK-UP DATE'] = summary_table['PICK-UP DATE'].dt.strftime('%b %d, %Y')
+                summary_table['DELIVERY DATE'] = summary_table['DELIVERY DATE'].dt.strftime('%b %d, %Y')
+                summary_table['RPM'] = summary_table['RPM'].apply(lambda x: f"${x:.2f}")
+                summary_table['Total Revenue'] = summary_table['Total Revenue'].apply(lambda x: f"${x:,.0f}")
+                summary_table['Total Miles'] = summary_table['Total Miles'].apply(lambda x: f"{x:,.0f}")
+
+                st.dataframe(summary_table, use_container_width=True, hide_index=True)
+
+            else:
+                st.info(f"ℹ️ No drivers found that meet the full-week active criteria (activity spanning at least {min_span_days} days OR starting by {WEEK_DAY_NAMES[start_by_day]} and finishing from {WEEK_DAY_NAMES[end_from_day]}).")
+
+    except Exception as e:
+        st.error(f"❌ Error in Full-Week Active Drivers analysis: {str(e)}")
+        st.info("Please check that your data contains valid PICK-UP DATE and DELIVERY DATE columns.")
+
+show_full_week_active_drivers()
 
 # --- KPI 1: Weekly Earnings Evolution per Dispatcher ---
-st.subheader("1. Weekly Earnings Evolution per Dispatcher")
-    # Get drivers for this dispatcher
-# Use the globally filtered data (no need for individual dispatcher selection)
-if not df.empty:
-    # Get drivers from the globally filtered data
-    drivers = sorted(df['DRIVER NAME'].dropna().astype(str).unique())
-    
-    # Driver selection with multi-select
-    selected_drivers = st.multiselect(
-        "Select Drivers (remove to exclude):",
-        drivers,
-        default=drivers,
-        help="Select which drivers to include in the chart. Remove drivers to exclude them."
-    )
-    
-    if selected_drivers:
-        # Filter data for selected drivers
-        filtered_data = df[df['DRIVER NAME'].isin(selected_drivers)]
+def get_total_annotations(weekly_totals):
+    """Total label on top of each stacked weekly bar, built as one annotation list"""
+    return [
+        dict(x=week, y=total, text=f"${total:,.0f}", showarrow=False, yshift=15,
+             font=dict(size=12, color='black', weight='bold'), bgcolor='white', bordercolor='black', borderwidth=1)
+        for week, total in zip(weekly_totals.index, weekly_totals.to_numpy())
+    ]
+
+@st.fragment
+def show_weekly_earnings():
+    """KPI 1 section; its driver picker reruns only this section"""
+    st.subheader("1. Weekly Earnings Evolution per Dispatcher")
+    # Use the globally filtered data (no need for individual dispatcher selection)
+    if not df.empty:
+        # Get drivers from the globally filtered data
+        drivers = sorted(load_cube['DRIVER NAME'].dropna().unique())
+
+        # Driver selection with multi-select
+        selected_drivers = st.multiselect(
+            "Select Drivers (remove to exclude):",
+            drivers,
+            default=drivers,
+            help="Select which drivers to include in the chart. Remove drivers to exclude them."
+        )
 
-    drivers = sorted(dispatcher_data['DRIVER NAME'].dropna().astype(str).unique())
-    
-    # Driver selection with multi-select
-    selected_drivers = st.multiselect(
-        "Select Drivers (remove to exclude):",
-        drivers,
-        default=drivers,
-        help="Select which drivers to include in the chart. Remove drivers to exclude them."
-    )
-    
-    if selected_drivers:
-        # Filter data for selected drivers
-        filtered_data = dispatcher_data[dispatcher_data['DRIVER NAME'].isin(selected_drivers)]
-        
-        # Group by driver and week for earnings
-        weekly_earnings = filtered_data.groupby(['DRIVER NAME', 'WEEK']).agg({
-            'BROKER RATE (FC) [$]': 'sum',
-            'DRIVER RATE [$]': 'sum'
-        }).reset_index()
-        
-        # Group by driver and week for load count
-        weekly_loads = filtered_data.groupby(['DRIVER NAME', 'WEEK']).size().reset_index(name='Load Count')
-        
-        # Merge earnings and load data
-        weekly_data = weekly_earnings.merge(weekly_loads, on=['DRIVER NAME', 'WEEK'], how='left')
-        weekly_data = weekly_data.dropna(subset=['WEEK'])
-        
-        if not weekly_data.empty:
-            # Create bar chart for earnings (showing only broker rates as total revenue)
-            fig1_earnings = px.bar(weekly_data, x='WEEK', y='BROKER RATE (FC) [$]', 
-                                  color='DRIVER NAME',
-                                  title=f"Weekly Earnings - {selected_dispatcher}",
-                                  labels={'value': 'Amount ($)', 'y': 'Total Revenue ($)'})
-            
-            # Calculate total earnings per week for annotations (use only broker rates as total revenue)
-            weekly_totals = weekly_data.groupby('WEEK').agg({
-                'BROKER RATE (FC) [$]': 'sum'
+        if selected_drivers:
+            def compute_weekly_data():
+                # Filter the cube for selected drivers
+                filtered_cube = load_cube[load_cube['DRIVER NAME'].isin(selected_drivers)]
+
+                # Roll the cube up to driver and week for earnings and load count
+                weekly_data = filtered_cube.groupby(['DRIVER NAME', 'WEEK'], observed=True).agg({
+                    'BROKER RATE (FC) [$]': 'sum',
+                    'DRIVER RATE [$]': 'sum',
+                    'Load Count': 'sum'
+                }).reset_index()
+                return weekly_data.dropna(subset=['WEEK'])
+
+            weekly_data = get_kpi_result('kpi1_weekly_earnings', normalize_selection(selected_drivers, drivers), (), compute_weekly_data)
+
+            if not weekly_data.empty:
+                def build_earnings_figure():
+                    # Create bar chart for earnings (showing only broker rates as total revenue)
+                    fig1_earnings = px.bar(weekly_data, x='WEEK', y='BROKER RATE (FC) [$]', 
+                                          color='DRIVER NAME',
+                                          title="Weekly Earnings - Selected Dispatchers",
+                                          labels={'value': 'Amount ($)', 'y': 'Total Revenue ($)'})
+
+                    # Total amount annotations on top of each stacked bar (use only broker rates as total revenue)
+                    weekly_totals = weekly_data.groupby('WEEK')['BROKER RATE (FC) [$]'].sum()
+                    fig1_earnings.update_layout(annotations=get_total_annotations(weekly_totals))
+
+                    fig1_earnings.update_layout(
+                        xaxis_title="Week (Tuesday-Monday)",
+                        yaxis_title="Earnings ($)",
+                        showlegend=True,
+                        legend_title="Driver Name"
+                    )
+                    return fig1_earnings
+
+                fig1_earnings = get_cached_figure('kpi1_earnings', weekly_data, (), build_earnings_figure)
+                st.plotly_chart(fig1_earnings, use_container_width=True)
+
+                def build_loads_figure():
+                    # Create line chart for load quantities
+                    fig1_loads = px.line(weekly_data, x='WEEK', y='Load Count', color='DRIVER NAME', markers=True,
+                                        title="Weekly Load Quantities - Selected Dispatchers")
+
+                    fig1_loads.update_layout(
+                        xaxis_title="Week (Tuesday-Monday)",
+                        yaxis_title="Number of Loads",
+                        showlegend=True,
+                        legend_title="Driver Name"
+                    )
+                    return fig1_loads
+
+                fig1_loads = get_cached_figure('kpi1_loads', weekly_data, (), build_loads_figure)
+                st.plotly_chart(fig1_loads, use_container_width=True)
+
+                # Show summary statistics
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    total_broker_earnings = weekly_data['BROKER RATE (FC) [$]'].sum()
+                    st.metric("Total Broker Earnings", f"${total_broker_earnings:,.0f}")
+                with col2:
+                    total_driver_earnings = weekly_data['DRIVER RATE [$]'].sum()
+                    st.metric("Total Driver Earnings", f"${total_driver_earnings:,.0f}")
+                with col3:
+                    total_loads = weekly_data['Load Count'].sum()
+                    st.metric("Total Loads", f"{total_loads}")
+                with col4:
+                    num_drivers = len(selected_drivers)
+                    st.metric("Active Drivers", f"{num_drivers}")
+
+                # Show weekly breakdown
+                with st.expander("📊 Weekly Breakdown Table", expanded=False):
+                    weekly_summary = weekly_data.groupby('WEEK').agg({
+                        'BROKER RATE (FC) [$]': 'sum',
+                        'DRIVER RATE [$]': 'sum',
+                        'Load Count': 'sum'
+                    }).reset_index()
+
+                    # Format the week display
+                    weekly_summary['Week Display'] = weekly_summary['WEEK'].dt.strftime('%b %d, %Y')
+                    weekly_summary['BROKER RATE (FC) [$]'] = weekly_summary['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.0f}")
+                    weekly_summary['DRIVER RATE [$]'] = weekly_summary['DRIVER RATE [$]'].apply(lambda x: f"${x:,.0f}")
+
+                    st.dataframe(weekly_summary[['Week Display', 'BROKER RATE (FC) [$]', 'DRIVER RATE [$]', 'Load Count']], 
+                                use_container_width=True, hide_index=True)
+
+                # Show detailed table
+                with st.expander("📋 Detailed Weekly Earnings Data", expanded=False):
+                    display_data = weekly_data.copy()
+                    display_data['BROKER RATE (FC) [$]'] = display_data['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.2f}")
+                    display_data['DRIVER RATE [$]'] = display_data['DRIVER RATE [$]'].apply(lambda x: f"${x:,.2f}")
+                    st.dataframe(display_data.sort_values(['DRIVER NAME', 'WEEK']), use_container_width=True)
+            else:
+                st.info("No weekly earnings data available for the selected dispatchers")
+        else:
+            st.info("Please select at least one driver to view the chart.")
+    else:
+        # Show all dispatchers overview
+        def compute_weekly_data_all():
+            weekly_data_all = load_cube.groupby(['FC NAME', 'WEEK'], observed=True).agg({
+                'BROKER RATE (FC) [$]': 'sum',
+                'DRIVER RATE [$]': 'sum',
+                'Load Count': 'sum'
             }).reset_index()
-            weekly_totals['TOTAL_EARNINGS'] = weekly_totals['BROKER RATE (FC) [$]']
-            
-            # Add total amount annotations on top of each stacked bar
-            for _, row in weekly_totals.iterrows():
-                fig1_earnings.add_annotation(
-                    x=row['WEEK'],
-                    y=row['TOTAL_EARNINGS'],
-                    text=f"${row['TOTAL_EARNINGS']:,.0f}",
-                    showarrow=False,
-                    yshift=15,
-                    font=dict(size=12, color='black', weight='bold'),
-                    bgcolor='white',
-                    bordercolor='black',
-                    borderwidth=1
+            return weekly_data_all.dropna(subset=['WEEK'])
+
+        weekly_data_all = get_kpi_result('kpi1_weekly_earnings_all', (), (), compute_weekly_data_all)
+
+        if not weekly_data_all.empty:
+            def build_all_earnings_figure():
+                # Create bar chart for all dispatchers (showing only broker rates as total revenue)
+                fig1_all_earnings = px.bar(weekly_data_all, x='WEEK', y='BROKER RATE (FC) [$]', 
+                                           color='FC NAME',
+                                           title="Weekly Earnings - All Dispatchers",
+                                           labels={'value': 'Amount ($)', 'y': 'Total Revenue ($)'})
+
+                # Total amount annotations on top of each stacked bar (All Dispatchers view - use only broker rates as total revenue)
+                weekly_totals_all = weekly_data_all.groupby('WEEK')['BROKER RATE (FC) [$]'].sum()
+                fig1_all_earnings.update_layout(annotations=get_total_annotations(weekly_totals_all))
+
+                fig1_all_earnings.update_layout(
+                    xaxis_title="Week (Tuesday-Monday)",
+                    yaxis_title="Earnings ($)",
+                    showlegend=True,
+                    legend_title="Dispatcher (FC)"
                 )
-            
-            fig1_earnings.update_layout(
-                xaxis_title="Week (Tuesday-Monday)",
-                yaxis_title="Earnings ($)",
-                showlegend=True,
-                legend_title="Driver Name"
-            )
-            
-            st.plotly_chart(fig1_earnings, use_container_width=True)
-            
-            # Create line chart for load quantities
-            fig1_loads = px.line(weekly_data, x='WEEK', y='Load Count', color='DRIVER NAME', markers=True,
-                                title=f"Weekly Load Quantities - {selected_dispatcher}")
-            
-            fig1_loads.update_layout(
-                xaxis_title="Week (Tuesday-Monday)",
-                yaxis_title="Number of Loads",
-                showlegend=True,
-                legend_title="Driver Name"
-            )
-            
-            st.plotly_chart(fig1_loads, use_container_width=True)
-            
+                return fig1_all_earnings
+
+            fig1_all_earnings = get_cached_figure('kpi1_all_earnings', weekly_data_all, (), build_all_earnings_figure)
+            st.plotly_chart(fig1_all_earnings, use_container_width=True)
+
+            def build_all_loads_figure():
+                # Create line chart for load quantities
+                fig1_all_loads = px.line(weekly_data_all, x='WEEK', y='Load Count', color='FC NAME', markers=True,
+                                         title="Weekly Load Quantities - All Dispatchers")
+
+                fig1_all_loads.update_layout(
+                    xaxis_title="Week (Tuesday-Monday)",
+                    yaxis_title="Number of Loads",
+                    showlegend=True,
+                    legend_title="Dispatcher (FC)"
+                )
+                return fig1_all_loads
+
+            fig1_all_loads = get_cached_figure('kpi1_all_loads', weekly_data_all, (), build_all_loads_figure)
+            st.plotly_chart(fig1_all_loads, use_container_width=True)
+
             # Show summary statistics
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                total_broker_earnings = weekly_data['BROKER RATE (FC) [$]'].sum()
+                total_broker_earnings = weekly_data_all['BROKER RATE (FC) [$]'].sum()
                 st.metric("Total Broker Earnings", f"${total_broker_earnings:,.0f}")
             with col2:
-                total_driver_earnings = weekly_data['DRIVER RATE [$]'].sum()
+                total_driver_earnings = weekly_data_all['DRIVER RATE [$]'].sum()
                 st.metric("Total Driver Earnings", f"${total_driver_earnings:,.0f}")
             with col3:
-                total_loads = weekly_data['Load Count'].sum()
+                total_loads = weekly_data_all['Load Count'].sum()
                 st.metric("Total Loads", f"{total_loads}")
             with col4:
-                num_drivers = len(selected_drivers)
-                st.metric("Active Drivers", f"{num_drivers}")
-            
+                # Count unique dispatchers across all weeks
+                unique_dispatchers = weekly_data_all['FC NAME'].nunique()
+                st.metric("Active Dispatchers", f"{unique_dispatchers}")
+
             # Show weekly breakdown
-            with st.expander("📊 Weekly Breakdown Table", expanded=False):
-                weekly_summary = weekly_data.groupby('WEEK').agg({
-                    'BROKER RATE (FC) [$]': 'sum',
-                    'DRIVER RATE [$]': 'sum',
-                    'Load Count': 'sum'
-                }).reset_index()
-                
-                # Format the week display
-                weekly_summary['Week Display'] = weekly_summary['WEEK'].dt.strftime('%b %d, %Y')
-                weekly_summary['BROKER RATE (FC) [$]'] = weekly_summary['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.0f}")
-                weekly_summary['DRIVER RATE [$]'] = weekly_summary['DRIVER RATE [$]'].apply(lambda x: f"${x:,.0f}")
-                
-                st.dataframe(weekly_summary[['Week Display', 'BROKER RATE (FC) [$]', 'DRIVER RATE [$]', 'Load Count']], 
-                            use_container_width=True, hide_index=True)
-            
-            # Show detailed table
-            with st.expander("📋 Detailed Weekly Earnings Data", expanded=False):
-                display_data = weekly_data.copy()
-                display_data['BROKER RATE (FC) [$]'] = display_data['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.2f}")
-                display_data['DRIVER RATE [$]'] = display_data['DRIVER RATE [$]'].apply(lambda x: f"${x:,.2f}")
-                st.dataframe(display_data.sort_values(['DRIVER NAME', 'WEEK']), use_container_width=True)
+            st.subheader("Weekly Breakdown")
+            weekly_summary_all = weekly_data_all.groupby('WEEK').agg({
+                'BROKER RATE (FC) [$]': 'sum',
+                'DRIVER RATE [$]': 'sum',
+                'Load Count': 'sum',
+                'FC NAME': 'nunique'  # Count unique dispatchers per week
+            }).reset_index()
+
+            # Format the week display
+            weekly_summary_all['Week Display'] = weekly_summary_all['WEEK'].dt.strftime('%b %d, %Y')
+            weekly_summary_all['BROKER RATE (FC) [$]'] = weekly_summary_all['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.0f}")
+            weekly_summary_all['DRIVER RATE [$]'] = weekly_summary_all['DRIVER RATE [$]'].apply(lambda x: f"${x:,.0f}")
+            weekly_summary_all.rename(columns={'FC NAME': 'Active Dispatchers'}, inplace=True)
+
+            st.dataframe(weekly_summary_all[['Week Display', 'BROKER RATE (FC) [$]', 'DRIVER RATE [$]', 'Load Count', 'Active Dispatchers']], 
+                        use_container_width=True, hide_index=True)
         else:
-            st.info(f"No weekly earnings data available for {selected_dispatcher}")
-    else:
-        st.info("Please select at least one driver to view the chart.")
-else:
-    # Show all dispatchers overview
-    weekly_earnings_all = df.groupby(['FC NAME', 'WEEK']).agg({
-        'BROKER RATE (FC) [$]': 'sum',
-        'DRIVER RATE [$]': 'sum'
-    }).reset_index()
-    
-    weekly_loads_all = df.groupby(['FC NAME', 'WEEK']).size().reset_index(name='Load Count')
-    weekly_data_all = weekly_earnings_all.merge(weekly_loads_all, on=['FC NAME', 'WEEK'], how='left')
-    weekly_data_all = weekly_data_all.dropna(subset=['WEEK'])
-    
-    if not weekly_data_all.empty:
-        # Create bar chart for all dispatchers (showing only broker rates as total revenue)
-        fig1_all_earnings = px.bar(weekly_data_all, x='WEEK', y='BROKER RATE (FC) [$]', 
-                                   color='FC NAME',
-                                   title="Weekly Earnings - All Dispatchers",
-                                   labels={'value': 'Amount ($)', 'y': 'Total Revenue ($)'})
-        
-        # Calculate total earnings per week for annotations (All Dispatchers view - use only broker rates as total revenue)
-        weekly_totals_all = weekly_data_all.groupby('WEEK').agg({
-            'BROKER RATE (FC) [$]': 'sum'
-        }).reset_index()
-        weekly_totals_all['TOTAL_EARNINGS'] = weekly_totals_all['BROKER RATE (FC) [$]']
-        
-        # Add total amount annotations on top of each stacked bar
-        for _, row in weekly_totals_all.iterrows():
-            fig1_all_earnings.add_annotation(
-                x=row['WEEK'],
-                y=row['TOTAL_EARNINGS'],
-                text=f"${row['TOTAL_EARNINGS']:,.0f}",
-                showarrow=False,
-                yshift=15,
-                font=dict(size=12, color='black', weight='bold'),
-                bgcolor='white',
-                bordercolor='black',
-                borderwidth=1
-            )
-        
-        fig1_all_earnings.update_layout(
-            xaxis_title="Week (Tuesday-Monday)",
-            yaxis_title="Earnings ($)",
-            showlegend=True,
-            legend_title="Dispatcher (FC)"
-        )
-        
-        st.plotly_chart(fig1_all_earnings, use_container_width=True)
-        
-        # Create line chart for load quantities
-        fig1_all_loads = px.line(weekly_data_all, x='WEEK', y='Load Count', color='FC NAME', markers=True,
-                                 title="Weekly Load Quantities - All Dispatchers")
-        
-        fig1_all_loads.update_layout(
-            xaxis_title="Week (Tuesday-Monday)",
-            yaxis_title="Number of Loads",
-            showlegend=True,
-            legend_title="Dispatcher (FC)"
-        )
-        
-        st.plotly_chart(fig1_all_loads, use_container_width=True)
-        
-        # Show summary statistics
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            total_broker_earnings = weekly_data_all['BROKER RATE (FC) [$]'].sum()
-            st.metric("Total Broker Earnings", f"${total_broker_earnings:,.0f}")
-        with col2:
-            total_driver_earnings = weekly_data_all['DRIVER RATE [$]'].sum()
-            st.metric("Total Driver Earnings", f"${total_driver_earnings:,.0f}")
-        with col3:
-            total_loads = weekly_data_all['Load Count'].sum()
-            st.metric("Total Loads", f"{total_loads}")
-        with col4:
-            # Count unique dispatchers across all weeks
-            unique_dispatchers = weekly_data_all['FC NAME'].nunique()
-            st.metric("Active Dispatchers", f"{unique_dispatchers}")
-        
-        # Show weekly breakdown
-        st.subheader("Weekly Breakdown")
-        weekly_summary_all = weekly_data_all.groupby('WEEK').agg({
-            'BROKER RATE (FC) [$]': 'sum',
-            'DRIVER RATE [$]': 'sum',
-            'Load Count': 'sum',
-            'FC NAME': 'nunique'  # Count unique dispatchers per week
-        }).reset_index()
-        
-        # Format the week display
-        weekly_summary_all['Week Display'] = weekly_summary_all['WEEK'].dt.strftime('%b %d, %Y')
-        weekly_summary_all['BROKER RATE (FC) [$]'] = weekly_summary_all['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.0f}")
-        weekly_summary_all['DRIVER RATE [$]'] = weekly_summary_all['DRIVER RATE [$]'].apply(lambda x: f"${x:,.0f}")
-        weekly_summary_all.rename(columns={'FC NAME': 'Active Dispatchers'}, inplace=True)
-        
-        st.dataframe(weekly_summary_all[['Week Display', 'BROKER RATE (FC) [$]', 'DRIVER RATE [$]', 'Load Count', 'Active Dispatchers']], 
-                    use_container_width=True, hide_index=True)
-    else:
-        st.info("No weekly earnings data available")
+            st.info("No weekly earnings data available")
+
+show_weekly_earnings()
+
+# --- Multi-Week Chart Views (KPI 2 and 5) ---
+# One facet per week does not scale past a few months, so these charts show either a
+# dispatcher x week heatmap of every week or the stacked bars for a page of weeks
+WEEK_CHART_VIEWS = ["Weekly bars (paged)", "Heatmap (all weeks)"]
+WEEKS_PER_PAGE = 8
+
+def select_week_page(weeks, key):
+    """Weeks on the page picked with a slider (latest page by default); all weeks if they fit on one page"""
+    weeks = sorted(weeks)
+    if len(weeks) <= WEEKS_PER_PAGE:
+        return weeks
+    # Pages are counted back from the latest week, so only the oldest page can be short
+    page_ends = list(range(len(weeks), 0, -WEEKS_PER_PAGE))[::-1]
+    pages = {end: weeks[max(end - WEEKS_PER_PAGE, 0):end] for end in page_ends}
+    page_end = st.select_slider(
+        "Weeks shown:",
+        options=page_ends,
+        value=page_ends[-1],
+        format_func=lambda end: f"{pages[end][0]:%b %d, %Y} - {pages[end][-1]:%b %d, %Y}",
+        key=key
+    )
+    return pages[page_end]
+
+def build_dispatcher_week_heatmap(summary, value_column, title, value_label):
+    """Dispatcher x week heatmap of a weekly measure (one cell per dispatcher and week)"""
+    pivot = summary.groupby(['FC NAME', 'WEEK'], observed=True)[value_column].sum().unstack('WEEK').sort_index(axis=1)
+    pivot.columns = pivot.columns.strftime('%b %d, %Y')
+    fig = px.imshow(pivot, aspect='auto', color_continuous_scale='Blues',
+                    labels={'x': 'Week (Tuesday-Monday)', 'y': 'Dispatcher (FC)', 'color': value_label})
+    fig.update_layout(title=title)
+    return fig
 
 # --- KPI 2: Weekly Billing per Driver by Dispatcher ---
-st.subheader("2. Weekly Billing per Driver by Dispatcher")
+@st.fragment
+def show_weekly_billing():
+    """KPI 2 section; its driver picker reruns only this section"""
+    st.subheader("2. Weekly Billing per Driver by Dispatcher")
+
+    # Use the globally filtered data (no need for individual dispatcher selection)
+    if not df.empty:
+        # Get drivers from the globally filtered data
+        drivers_billing = sorted(load_cube['DRIVER NAME'].dropna().unique())
+
+        # Driver selection with multi-select
+        selected_drivers_billing = st.multiselect(
+            "Select Drivers for Billing (remove to exclude):",
+            drivers_billing,
+            default=drivers_billing,
+            key="billing_drivers",
+            help="Select which drivers to include in the billing chart. Remove drivers to exclude them."
+        )
 
-    drivers_billing = sorted(dispatcher_billing_data['DRIVER NAME'].dropna().astype(str).unique())
-# Use the globally filtered data (no need for individual dispatcher selection)
-if not df.empty:
-    # Get drivers from the globally filtered data
-    drivers_billing = sorted(df['DRIVER NAME'].dropna().astype(str).unique())
-    
-    # Driver selection with multi-select
-    selected_drivers_billing = st.multiselect(
-        "Select Drivers for Billing (remove to exclude):",
-        drivers_billing,
-        default=drivers_billing,
-        key="billing_drivers",
-        help="Select which drivers to include in the billing chart. Remove drivers to exclude them."
-    )
-    
-    if selected_drivers_billing:
-        # Filter data for selected drivers
-        filtered_billing_data = df[df['DRIVER NAME'].isin(selected_drivers_billing)]
-        billing = filtered_billing_data.groupby(['FC NAME', 'DRIVER NAME', 'WEEK'])['BROKER RATE (FC) [$]'].sum().reset_index()
-    else:
-        billing = pd.DataFrame()
-else:
-    billing = pd.DataFrame()
+        if selected_drivers_billing:
+            def compute_billing():
+                # Filter the cube for selected drivers (already at dispatcher/driver/week grain)
+                filtered_billing_cube = load_cube[load_cube['DRIVER NAME'].isin(selected_drivers_billing)]
+                return filtered_billing_cube.groupby(['FC NAME', 'DRIVER NAME', 'WEEK'], observed=True)['BROKER RATE (FC) [$]'].sum().reset_index()
 
-    
-    # Driver selection with multi-select
-    selected_drivers_billing = st.multiselect(
-        "Select Drivers for Billing (remove to exclude):",
-        drivers_billing,
-        default=drivers_billing,
-        key="billing_drivers",
-        help="Select which drivers to include in the billing chart. Remove drivers to exclude them."
-    )
-    
-    if selected_drivers_billing:
-        # Filter data for selected drivers
-        filtered_billing_data = dispatcher_billing_data[dispatcher_billing_data['DRIVER NAME'].isin(selected_drivers_billing)]
-        billing = filtered_billing_data.groupby(['FC NAME', 'DRIVER NAME', 'WEEK'])['BROKER RATE (FC) [$]'].sum().reset_index()
+            billing = get_kpi_result('kpi2_weekly_billing', normalize_selection(selected_drivers_billing, drivers_billing), (), compute_billing)
+        else:
+            billing = pd.DataFrame()
     else:
         billing = pd.DataFrame()
-else:
-    # Use all data for all dispatchers
-    billing = df.groupby(['FC NAME', 'DRIVER NAME', 'WEEK'])['BROKER RATE (FC) [$]'].sum().reset_index()
 
-billing = billing.dropna(subset=['WEEK', 'BROKER RATE (FC) [$]'])
 
-if not billing.empty:
-    # Format week for display
-    billing['Week Display'] = billing['WEEK'].dt.strftime('%b %d, %Y')
-    
-    # Create stacked bar chart with one bar per dispatcher per week
-    fig2 = px.bar(billing, x='FC NAME', y='BROKER RATE (FC) [$]', color='DRIVER NAME', 
-                  facet_col='Week Display',  # Separate chart for each week
-                  barmode='stack',  # Stacked bars
-                  hover_data=['WEEK', 'DRIVER NAME', 'BROKER RATE (FC) [$]'])
-    
-    # Update layout for better presentation
-    fig2.update_layout(
-        title="Weekly Billing by Dispatcher (Stacked by Driver) - Week by Week",
-        xaxis_title="Dispatcher (FC)",
-        yaxis_title="Billing Amount ($)",
-        showlegend=True,
-        legend_title="Driver Name"
-    )
-    
-    st.plotly_chart(fig2, use_container_width=True)
-    
-    # Show weekly summary table
-    with st.expander("📊 Weekly Billing Summary", expanded=False):
-        weekly_summary = billing.groupby(['WEEK', 'FC NAME'])['BROKER RATE (FC) [$]'].sum().reset_index()
-        weekly_summary['Week Display'] = weekly_summary['WEEK'].dt.strftime('%b %d, %Y')
-        weekly_summary['BROKER RATE (FC) [$]'] = weekly_summary['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.2f}")
-        weekly_summary = weekly_summary.sort_values(['WEEK', 'BROKER RATE (FC) [$]'], ascending=[True, False])
-        
-        st.dataframe(weekly_summary[['Week Display', 'FC NAME', 'BROKER RATE (FC) [$]']], 
-                    use_container_width=True, hide_index=True)
-    
-    # Show overall summary table
-    with st.expander("📊 Overall Billing Summary by Dispatcher", expanded=False):
-        total_billing = billing.groupby('FC NAME')['BROKER RATE (FC) [$]'].sum().reset_index()
-        summary_table = total_billing.sort_values('BROKER RATE (FC) [$]', ascending=False)
-        summary_table['BROKER RATE (FC) [$]'] = summary_table['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.2f}")
-        st.dataframe(summary_table, use_container_width=True)
-    
-else:
-    st.info("No billing data available")
+    billing = billing.dropna(subset=['WEEK', 'BROKER RATE (FC) [$]'])
 
-# --- KPI 3: Rate per Mile (RPM) per Dispatcher ---
-st.subheader("3. Rate per Mile Distribution per Dispatcher")
-df['RPM'] = df['BROKER RATE (FC) [$]'] / df['FULL MILES TOTAL']
-rpm_data = df[df['RPM'].notna() & (df['RPM'] > 0) & (df['RPM'] < 10)]  # Filter reasonable RPM values
-if not rpm_data.empty:
-    fig3 = px.violin(rpm_data, x="FC NAME", y="RPM", box=True, points="all", hover_data=["LOAD ID", "DRIVER NAME"])
-    st.plotly_chart(fig3, use_container_width=True)
-else:
-    st.info("No RPM data available")
+    if not billing.empty:
+        # Format week for display
+        billing['Week Display'] = billing['WEEK'].dt.strftime('%b %d, %Y')
 
-# --- KPI 4: Destination Market Quality Analysis ---
-st.subheader("4. Destination Market Quality Analysis")
-
-# Explanation of destination market quality concept
-st.info("""
-**What is Destination Market Quality?** 
-- **Destination Markets** = States where loads terminate
-- **Market Quality** = Assessment of outbound load opportunities and rates in each destination
-- **High Quality Destinations** = Good markets for return loads with high rates
-- **Low Quality Destinations** = Poor markets (Dead Zones) with limited outbound opportunities
-- **Business Impact**: Understanding destination quality helps with:
-  - Route planning and optimization
-  - Repositioning strategies
-  - Profitability forecasting
-  - Risk assessment for empty miles
-""")
+        billing_view = st.radio("Chart view:", WEEK_CHART_VIEWS, horizontal=True, key="billing_chart_view")
+        if billing_view == "Heatmap (all weeks)":
+            fig2 = get_cached_figure(
+                'kpi2_heatmap', billing, (),
+                lambda: build_dispatcher_week_heatmap(billing, 'BROKER RATE (FC) [$]', "Weekly Billing by Dispatcher - All Weeks", "Billing Amount ($)")
+            )
+        else:
+            # Create stacked bar chart with one bar per dispatcher per week (one page of weeks)
+            page_billing = billing[billing['WEEK'].isin(select_week_page(billing['WEEK'].unique(), "billing_week_page"))]
+
+            def build_billing_figure():
+                fig2 = px.bar(page_billing, x='FC NAME', y='BROKER RATE (FC) [$]', color='DRIVER NAME', 
+                              facet_col='Week Display',  # Separate chart for each week
+                              category_orders={'Week Display': page_billing.sort_values('WEEK')['Week Display'].unique().tolist()},
+                              barmode='stack',  # Stacked bars
+                              hover_data=['WEEK', 'DRIVER NAME', 'BROKER RATE (FC) [$]'])
+
+                # Update layout for better presentation
+                fig2.update_layout(
+                    title="Weekly Billing by Dispatcher (Stacked by Driver) - Week by Week",
+                    xaxis_title="Dispatcher (FC)",
+                    yaxis_title="Billing Amount ($)",
+                    showlegend=True,
+                    legend_title="Driver Name"
+                )
+                return fig2
 
-    
-# Use the globally filtered data (no need for individual dispatcher selection)
-if not df.empty:
-    # Get drivers from the globally filtered data
-    drivers_dest = sorted(df['DRIVER NAME'].dropna().astype(str).unique())
-    
-    # Driver selection with multi-select
-    selected_drivers_dest = st.multiselect(
-        "Select Drivers for Destination Analysis (remove to exclude):",
-        drivers_dest,
-        default=drivers_dest,
-        key="dest_drivers",
-        help="Select which drivers to include in the destination analysis"
+            fig2 = get_cached_figure('kpi2_weekly_bars', page_billing, (), build_billing_figure)
+
+        st.plotly_chart(fig2, use_container_width=True)
+
+        # Show weekly summary table
+        with st.expander("📊 Weekly Billing Summary", expanded=False):
+            weekly_summary = billing.groupby(['WEEK', 'FC NAME'], observed=True)['BROKER RATE (FC) [$]'].sum().reset_index()
+            weekly_summary['Week Display'] = weekly_summary['WEEK'].dt.strftime('%b %d, %Y')
+            weekly_summary['BROKER RATE (FC) [$]'] = weekly_summary['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.2f}")
+            weekly_summary = weekly_summary.sort_values(['WEEK', 'BROKER RATE (FC) [$]'], ascending=[True, False])
+
+            st.dataframe(weekly_summary[['Week Display', 'FC NAME', 'BROKER RATE (FC) [$]']], 
+                        use_container_width=True, hide_index=True)
+
+        # Show overall summary table
+        with st.expander("📊 Overall Billing Summary by Dispatcher", expanded=False):
+            total_billing = billing.groupby('FC NAME', observed=True)['BROKER RATE (FC) [$]'].sum().reset_index()
+            summary_table = total_billing.sort_values('BROKER RATE (FC) [$]', ascending=False)
+            summary_table['BROKER RATE (FC) [$]'] = summary_table['BROKER RATE (FC) [$]'].apply(lambda x: f"${x:,.2f}")
+            st.dataframe(summary_table, use_container_width=True)
+
+    else:
+        st.info("No billing data available")
+
+show_weekly_billing()
+
+# --- KPI 3: Rate per Mile (RPM) per Dispatcher ---
+# RPM violins are drawn from a per-dispatcher summary instead of sending every load to the browser:
+# reasonable RPM range, histogram bins behind the density, density grid points and sampled outliers per dispatcher
+RPM_RANGE = (0, 10)
+RPM_HISTOGRAM_BINS = 400
+RPM_DENSITY_POINTS = 120
+RPM_MAX_OUTLIERS = 200
+
+def summarize_rpm_distribution(rpm_data, max_outliers=RPM_MAX_OUTLIERS):
+    """Per-dispatcher RPM box statistics, a Gaussian kernel density evaluated over binned counts and a
+    random sample (at most max_outliers) of the loads outside the whiskers. Returns (box, density, outliers)."""
+    bin_edges = np.linspace(*RPM_RANGE, RPM_HISTOGRAM_BINS + 1)
+    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    rng = np.random.default_rng(0)
+    box_rows, density_frames, outlier_frames = [], [], []
+    for dispatcher, group in rpm_data.groupby('FC NAME', observed=True):
+        rpm = group['RPM'].to_numpy(dtype=float)
+        q1, median, q3 = np.quantile(rpm, [0.25, 0.5, 0.75])
+        inside = (rpm >= q1 - 1.5 * (q3 - q1)) & (rpm <= q3 + 1.5 * (q3 - q1))
+        box_rows.append({
+            'FC NAME': dispatcher, 'LOADS': len(rpm), 'MEAN': rpm.mean(), 'Q1': q1, 'MEDIAN': median, 'Q3': q3,
+            'LOWER FENCE': rpm[inside].min(), 'UPPER FENCE': rpm[inside].max(),
+        })
+        
+        # Silverman's rule bandwidth (what plotly uses client-side), never narrower than one bin
+        spread = min(rpm.std(), (q3 - q1) / 1.349) or rpm.std()
+        bandwidth = max(1.059 * spread * len(rpm) ** -0.2, bin_edges[1] - bin_edges[0])
+        counts, _ = np.histogram(rpm, bins=bin_edges)
+        grid = np.linspace(rpm.min(), rpm.max(), RPM_DENSITY_POINTS)
+        kernel = np.exp(-0.5 * ((grid[:, None] - bin_centers[None, :]) / bandwidth) ** 2)
+        density = kernel @ counts / (len(rpm) * bandwidth * np.sqrt(2 * np.pi))
+        density_frames.append(pd.DataFrame({'FC NAME': dispatcher, 'RPM': grid, 'DENSITY': density}))
+        
+        outliers = group[~inside]
+        if len(outliers) > max_outliers:
+            outliers = outliers.iloc[np.sort(rng.choice(len(outliers), max_outliers, replace=False))]
+        outlier_frames.append(outliers)
+    
+    if not box_rows:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+    return pd.DataFrame(box_rows), pd.concat(density_frames, ignore_index=True), pd.concat(outlier_frames)
+
+def build_rpm_violin_figure(rpm_box, rpm_density, rpm_outliers=None):
+    """Violin (mirrored density) and box per dispatcher drawn from the precomputed summary"""
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    for position, box in enumerate(rpm_box.to_dict('records')):
+        color = colors[position % len(colors)]
+        density = rpm_density[rpm_density['FC NAME'] == box['FC NAME']]
+        half_width = 0.4 * density['DENSITY'].to_numpy() / density['DENSITY'].max()
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([position - half_width, (position + half_width)[::-1]]),
+            y=np.concatenate([density['RPM'].to_numpy(), density['RPM'].to_numpy()[::-1]]),
+            fill='toself', mode='lines', line=dict(color=color, width=1), opacity=0.6,
+            name=str(box['FC NAME']), hoverinfo='skip'
+        ))
+        fig.add_trace(go.Box(
+            x=[position], q1=[box['Q1']], median=[box['MEDIAN']], q3=[box['Q3']], mean=[box['MEAN']],
+            lowerfence=[box['LOWER FENCE']], upperfence=[box['UPPER FENCE']],
+            width=0.08, marker_color=color, name=str(box['FC NAME']), boxpoints=False
+        ))
+        if rpm_outliers is not None:
+            outliers = rpm_outliers[rpm_outliers['FC NAME'] == box['FC NAME']]
+            fig.add_trace(go.Scatter(
+                x=np.full(len(outliers), position), y=outliers['RPM'], mode='markers',
+                marker=dict(color=color, size=4), name=str(box['FC NAME']),
+                customdata=outliers[['LOAD ID', 'DRIVER NAME']].astype(str).to_numpy(),
+                hovertemplate="RPM=%{y:.2f}<br>LOAD ID=%{customdata[0]}<br>DRIVER NAME=%{customdata[1]}<extra></extra>"
+            ))
+    fig.update_layout(
+        showlegend=False,
+        xaxis=dict(title="FC NAME", tickmode='array', tickvals=list(range(len(rpm_box))), ticktext=rpm_box['FC NAME'].astype(str).tolist()),
+        yaxis_title="RPM"
     )
-    
-    if selected_drivers_dest:
-        # Filter data for selected drivers
-        filtered_dest_data = df[df['DRIVER NAME'].isin(selected_drivers_dest)]
+    return fig
+
+df['RPM'] = df['BROKER RATE (FC) [$]'] / df['FULL MILES TOTAL']
+
+@st.fragment
+def show_rpm_distribution():
+    """KPI 3 section; its outlier toggle reruns only this section"""
+    st.subheader("3. Rate per Mile Distribution per Dispatcher")
+    rpm_box, rpm_density, rpm_outliers = get_kpi_result(
+        'kpi3_rpm_distribution', (), (RPM_HISTOGRAM_BINS, RPM_DENSITY_POINTS, RPM_MAX_OUTLIERS),
+        lambda: summarize_rpm_distribution(
+            df.loc[df['RPM'].notna() & (df['RPM'] > RPM_RANGE[0]) & (df['RPM'] < RPM_RANGE[1]), ['FC NAME', 'RPM', 'LOAD ID', 'DRIVER NAME']]  # Filter reasonable RPM values
+        )
+    )
+    if not rpm_box.empty:
+        show_outliers = st.checkbox("Show sampled outlier loads", value=True, key="rpm_outliers",
+                                    help=f"Plots at most {RPM_MAX_OUTLIERS} randomly sampled loads outside the whiskers per dispatcher")
+        fig3 = get_cached_figure(
+            'kpi3_rpm_violins', (rpm_box, rpm_density, rpm_outliers), (show_outliers,),
+            lambda: build_rpm_violin_figure(rpm_box, rpm_density, rpm_outliers if show_outliers else None)
+        )
+        st.plotly_chart(fig3, use_container_width=True)
+        st.caption(f"Density and quartiles summarize {rpm_box['LOADS'].sum():,} loads with an RPM between ${RPM_RANGE[0]} and ${RPM_RANGE[1]}.")
     else:
-        filtered_dest_data = df.copy()
-else:
-    filtered_dest_data = pd.DataFrame()
-
-    # Driver selection with multi-select
-    selected_drivers_dest = st.multiselect(
-        "Select Drivers for Destination Analysis (remove to exclude):",
-        drivers_dest,
-        default=drivers_dest,
-        key="dest_drivers",
-        help="Select which drivers to include in the destination analysis"
+        st.info("No RPM data available")
+
+show_rpm_distribution()
+
+# --- Trailer Market-Rate Index (KPI 4) ---
+TRAILER_STATE_RATES_FILE = os.path.join("Trucking_Made_Successful_Data", "market_rates_by_trailer_state.csv")
+TRAILER_MAPPING_FILE = os.path.join("Trucking_Made_Successful_Data", "trailer_type_mapping.csv")
+
+# Mappings for the specific trailer types in the data; any other type is priced at the average rate
+CUSTOM_TRAILER_MAPPING = {
+    'DryVan': 'Dry Van',
+    'Flatbed': 'Flatbed',
+    'Power Only': 'Dry Van',  # Power Only should be considered DryVan
+    'Reefer': 'Reefer',
+    'Stepdeck': 'Flatbed'  # Stepdeck should be considered Flatbed
+}
+
+# Standard trailer type -> rate column in market_rates_by_trailer_state.csv
+TRAILER_RATE_COLUMNS = {'Dry Van': 'DRY_VAN_RATE', 'Reefer': 'REEFER_RATE', 'Flatbed': 'FLATBED_RATE'}
+
+def get_file_signature(*paths):
+    """(path, modification time, size) of each file, or None if any file is missing"""
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+
+@st.cache_resource(max_entries=2)
+def load_trailer_rate_index(file_signature):
+    """Process-wide, read-only market-rate index keyed by state and standard trailer type.
+    Shared by every session and rebuilt only when the reference files' signature changes."""
+    trailer_state_rates = pd.read_csv(TRAILER_STATE_RATES_FILE)
+    
+    # State x trailer type rate matrix (one row per full state name)
+    state_rates = trailer_state_rates.drop_duplicates('STATE').set_index('STATE')
+    rates = state_rates[list(TRAILER_RATE_COLUMNS.values())].to_numpy(dtype=float)
+    
+    # Lookup matrix: an extra average-rate column for unmapped trailer types and an
+    # extra NaN row for unknown states, both reached through position -1
+    lookup_rates = np.vstack([
+        np.column_stack([rates, rates.mean(axis=1)]),
+        np.full(rates.shape[1] + 1, np.nan),
+    ])
+    lookup_rates.setflags(write=False)
+    
+    return MappingProxyType({
+        'states': pd.Index(state_rates.index),
+        'trailer_types': pd.Index(list(TRAILER_RATE_COLUMNS)),
+        'lookup_rates': lookup_rates,
+        'type_mapping': MappingProxyType(CUSTOM_TRAILER_MAPPING),
+    })
+
+def lookup_trailer_rates(trailer_rate_index, states_full, trailer_standard):
+    """Market rate per delivery from the state x trailer type matrix (average of all rates for unmapped trailers)"""
+    state_positions = trailer_rate_index['states'].get_indexer(states_full)
+    trailer_positions = trailer_rate_index['trailer_types'].get_indexer(trailer_standard)
+    return trailer_rate_index['lookup_rates'][state_positions, trailer_positions]
+
+# Market rate ($/mile) above which a delivery counts as High / Medium quality; everything else is Low
+MARKET_QUALITY_THRESHOLDS = {'High': 2.5, 'Medium': 2.0}
+
+def classify_market_quality(market_rates, thresholds=MARKET_QUALITY_THRESHOLDS):
+    """High/Medium/Low label per market rate (missing rates count as Low)"""
+    market_rates = np.asarray(market_rates, dtype=float)
+    return np.select(
+        [market_rates > thresholds['High'], market_rates > thresholds['Medium']],
+        ['High', 'Medium'],
+        default='Low'
     )
-    
-    if selected_drivers_dest:
-        # Filter data for selected drivers
-        filtered_dest_data = dispatcher_dest_data[dispatcher_dest_data['DRIVER NAME'].isin(selected_drivers_dest)]
+
+# --- KPI 4: Destination Market Quality Analysis ---
+@st.fragment
+def show_destination_market_quality():
+    """KPI 4 section; its driver and dispatcher pickers rerun only this section"""
+    st.subheader("4. Destination Market Quality Analysis")
+
+    # Explanation of destination market quality concept
+    st.info("""
+    **What is Destination Market Quality?** 
+    - **Destination Markets** = States where loads terminate
+    - **Market Quality** = Assessment of outbound load opportunities and rates in each destination
+    - **High Quality Destinations** = Good markets for return loads with high rates
+    - **Low Quality Destinations** = Poor markets (Dead Zones) with limited outbound opportunities
+    - **Business Impact**: Understanding destination quality helps with:
+      - Route planning and optimization
+      - Repositioning strategies
+      - Profitability forecasting
+      - Risk assessment for empty miles
+    """)
+
+
+    # Use the globally filtered data (no need for individual dispatcher selection)
+    if not df.empty:
+        # Get drivers from the globally filtered data
+        drivers_dest = sorted(load_cube['DRIVER NAME'].dropna().unique())
+
+        # Driver selection with multi-select
+        selected_drivers_dest = st.multiselect(
+            "Select Drivers for Destination Analysis (remove to exclude):",
+            drivers_dest,
+            default=drivers_dest,
+            key="dest_drivers",
+            help="Select which drivers to include in the destination analysis"
+        )
+
+        # Filter data for selected drivers (driver positions intersected with the global filter)
+        dest_rows = global_filter_rows
+        if selected_drivers_dest:
+            dest_rows = select_filter_rows(filter_index, 'DRIVER NAME', selected_drivers_dest, within=dest_rows)
+        filtered_dest_data = read_filter_rows(invoiced_loads, dest_rows, DESTINATION_COLUMNS)
     else:
         filtered_dest_data = pd.DataFrame()
-else:
-    # Use all data for all dispatchers
-    filtered_dest_data = df.copy()
 
-# Check if CITY TO column exists (preferred method)
-if 'CITY TO' in filtered_dest_data.columns and not filtered_dest_data.empty:
-    st.success("✅ Using 'CITY TO' column for state extraction")
-    
-    # Extract state from CITY TO column (format: "CITY, ST")
-    filtered_dest_data['CITY_STATE'] = filtered_dest_data['CITY TO'].astype(str)
-    
-    # Extract state code (last 2 characters after comma and space)
-    filtered_dest_data['STATE_TO'] = filtered_dest_data['CITY_STATE'].str.extract(r',\s*([A-Z]{2})$')
-    
-    # Filter out rows where we couldn't extract state
-    df_with_states = filtered_dest_data[filtered_dest_data['STATE_TO'].notna()]
-    
-    # Count deliveries by state
-    destination_counts = df_with_states.groupby('STATE_TO').size().reset_index(name='Destination Deliveries')
-    
-    # Debug: Show what we found
-    st.write(f"📊 Found {len(destination_counts)} states with delivery data")
-    if not destination_counts.empty:
-        with st.expander("📋 Destination Data Table", expanded=False):
-            st.write("Top 10 states by delivery count:")
-            st.dataframe(destination_counts.head(10), use_container_width=True)
-            
-            # Show city/state mapping for debugging
-            st.write("📋 City to State Mapping (sample):")
-            city_mapping_sample = df_with_states[['CITY TO', 'STATE_TO']].head(10)
-            st.dataframe(city_mapping_sample, use_container_width=True)
-    else:
-        st.warning("⚠️ No valid state data found. Check CITY TO column format.")
 
-else:
-    st.error("❌ 'CITY TO' column not found!")
-    st.write("Available columns:", list(df.columns))
-    st.stop()
+    # Check if CITY TO column exists (preferred method)
+    if 'CITY TO' in filtered_dest_data.columns and not filtered_dest_data.empty:
+        st.success("✅ Using 'CITY TO' column for state extraction")
 
-# Enhanced destination market quality analysis with Trucking Made Successful data
-# Initialize analysis_df with basic destination counts
-analysis_df = destination_counts[['STATE_TO', 'Destination Deliveries']].copy()
+        # STATE_TO was extracted from CITY TO (format: "CITY, ST") once per city at ingest
+        # Filter out rows where we couldn't extract state
+        df_with_states = filtered_dest_data[filtered_dest_data['STATE_TO'].notna()]
 
-if 'market_rates' in reference_data and not destination_counts.empty:
-    try:
-        # Get market rates data for destination quality analysis
-        rates_data = reference_data['market_rates']
-        
-        # Add dispatcher and driver filtering for destination analysis
-        st.subheader("Filter Destination Analysis:")
-        
-        # Check for available driver/dispatcher columns
-        driver_column = None
-        dispatcher_column = None
-        
-        # Look for driver column (try different possible names)
-        for col in ['DRIVER', 'DRIVER NAME', 'DRIVER_NAME']:
-            if col in df.columns:
-                driver_column = col
-                break
-        
-        # Look for dispatcher/FC column (try different possible names)
-        for col in ['FC NAME', 'FC_NAME', 'DISPATCHER', 'DISPATCHER NAME', 'DISPATCHER_NAME']:
-            if col in df.columns:
-                dispatcher_column = col
-                break
-        
-        # FC/Dispatcher filter (primary filter)
-        if dispatcher_column:
-            all_dispatchers = ['All Dispatchers'] + sorted(df[dispatcher_column].unique().tolist())
-            selected_dispatcher_dest = st.selectbox(f"Select {dispatcher_column} for Destination Analysis:", all_dispatchers)
+        # Count deliveries by state
+        destination_counts = get_kpi_result(
+            'kpi4_destination_counts', normalize_selection(selected_drivers_dest, drivers_dest), (),
+            lambda: df_with_states.groupby('STATE_TO', observed=True).size().reset_index(name='Destination Deliveries')
+        )
+
+        # Debug: Show what we found
+        st.write(f"📊 Found {len(destination_counts)} states with delivery data")
+        if not destination_counts.empty:
+            with st.expander("📋 Destination Data Table", expanded=False):
+                st.write("Top 10 states by delivery count:")
+                st.dataframe(destination_counts.head(10), use_container_width=True)
+
+                # Show city/state mapping for debugging
+                st.write("📋 City to State Mapping (sample):")
+                city_mapping_sample = df_with_states[['CITY TO', 'STATE_TO']].head(10)
+                st.dataframe(city_mapping_sample, use_container_width=True)
         else:
-            st.warning("⚠️ No dispatcher/FC column found. Available columns: " + ", ".join(df.columns.tolist()[:10]) + "...")
-            selected_dispatcher_dest = 'All Dispatchers'
-        
-        # Driver filter (depends on dispatcher selection)
-        if driver_column:
-            if selected_dispatcher_dest == 'All Dispatchers':
-                all_drivers = ['All Drivers'] + sorted(df[driver_column].unique().tolist())
+            st.warning("⚠️ No valid state data found. Check CITY TO column format.")
+
+    else:
+        st.error("❌ 'CITY TO' column not found!")
+        st.write("Available columns:", list(df.columns))
+        st.stop()
+
+    # Enhanced destination market quality analysis with Trucking Made Successful data
+    # Initialize analysis_df with basic destination counts
+    analysis_df = destination_counts[['STATE_TO', 'Destination Deliveries']].copy()
+
+    if 'market_rates' in reference_data and not destination_counts.empty:
+        try:
+            # Get market rates data for destination quality analysis
+            rates_data = reference_data['market_rates']
+
+            # Add dispatcher and driver filtering for destination analysis
+            st.subheader("Filter Destination Analysis:")
+
+            # Check for available driver/dispatcher columns
+            driver_column = None
+            dispatcher_column = None
+
+            # Look for driver column (try different possible names)
+            for col in ['DRIVER', 'DRIVER NAME', 'DRIVER_NAME']:
+                if col in df.columns:
+                    driver_column = col
+                    break
+
+            # Look for dispatcher/FC column (try different possible names)
+            for col in ['FC NAME', 'FC_NAME', 'DISPATCHER', 'DISPATCHER NAME', 'DISPATCHER_NAME']:
+                if col in df.columns:
+                    dispatcher_column = col
+                    break
+
+            # FC/Dispatcher filter (primary filter)
+            if dispatcher_column:
+                all_dispatchers = ['All Dispatchers'] + sorted(df[dispatcher_column].unique().tolist())
+                selected_dispatcher_dest = st.selectbox(f"Select {dispatcher_column} for Destination Analysis:", all_dispatchers)
             else:
-                # Get drivers for selected dispatcher/FC
-                dispatcher_drivers = df[df[dispatcher_column] == selected_dispatcher_dest][driver_column].unique().tolist()
-                all_drivers = ['All Drivers'] + sorted(dispatcher_drivers)
-            
-            selected_driver_dest = st.selectbox("Select Driver for Destination Analysis:", all_drivers)
-        else:
-            st.warning("⚠️ No driver column found. Available columns: " + ", ".join(df.columns.tolist()[:10]) + "...")
-            selected_driver_dest = 'All Drivers'
-        
-        # Filter data based on selections
-        if dispatcher_column and driver_column:
-            if selected_dispatcher_dest == 'All Dispatchers' and selected_driver_dest == 'All Drivers':
-                filtered_dest_data = df.copy()
-            elif selected_dispatcher_dest == 'All Dispatchers':
-                filtered_dest_data = df[df[driver_column] == selected_driver_dest].copy()
-            elif selected_driver_dest == 'All Drivers':
-                filtered_dest_data = df[df[dispatcher_column] == selected_dispatcher_dest].copy()
+                st.warning("⚠️ No dispatcher/FC column found. Available columns: " + ", ".join(df.columns.tolist()[:10]) + "...")
+                selected_dispatcher_dest = 'All Dispatchers'
+
+            # Driver filter (depends on dispatcher selection)
+            if driver_column:
+                if selected_dispatcher_dest == 'All Dispatchers':
+                    all_drivers = ['All Drivers'] + sorted(df[driver_column].unique().tolist())
+                else:
+                    # Get drivers for selected dispatcher/FC
+                    dispatcher_drivers = df[df[dispatcher_column] == selected_dispatcher_dest][driver_column].unique().tolist()
+                    all_drivers = ['All Drivers'] + sorted(dispatcher_drivers)
+
+                selected_driver_dest = st.selectbox("Select Driver for Destination Analysis:", all_drivers)
             else:
-                filtered_dest_data = df[(df[dispatcher_column] == selected_dispatcher_dest) & (df[driver_column] == selected_driver_dest)].copy()
-        elif driver_column:
-            # If only driver column exists, only filter by driver if selected
-            if selected_driver_dest == 'All Drivers':
-                filtered_dest_data = df.copy()
+                st.warning("⚠️ No driver column found. Available columns: " + ", ".join(df.columns.tolist()[:10]) + "...")
+                selected_driver_dest = 'All Drivers'
+
+            # Filter data based on selections (dispatcher and driver positions intersected with the global filter)
+            dest_rows = global_filter_rows
+            if dispatcher_column and selected_dispatcher_dest != 'All Dispatchers':
+                dest_rows = select_filter_rows(filter_index, dispatcher_column, [selected_dispatcher_dest], within=dest_rows)
+            if driver_column and selected_driver_dest != 'All Drivers':
+                dest_rows = select_filter_rows(filter_index, driver_column, [selected_driver_dest], within=dest_rows)
+            filtered_dest_data = read_filter_rows(invoiced_loads, dest_rows, DESTINATION_COLUMNS)
+            dest_filter_key = (selected_dispatcher_dest, selected_driver_dest)
+
+            # Keep filtered rows with a destination state (resolved at ingest)
+            if 'CITY TO' in filtered_dest_data.columns and not filtered_dest_data.empty:
+                filtered_dest_data = filtered_dest_data[filtered_dest_data['STATE_TO'].notna()]
+
+                # Recalculate destination counts
+                filtered_destination_counts = get_kpi_result(
+                    'kpi4_filtered_destination_counts', dest_filter_key, (),
+                    lambda: filtered_dest_data.groupby('STATE_TO', observed=True).size().reset_index(name='Destination Deliveries')
+                )
+
+                # Update analysis_df with filtered data
+                analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']].copy()
+
+                st.success(f"✅ Filtered data: {len(filtered_dest_data)} deliveries to {len(filtered_destination_counts)} states")
             else:
-                filtered_dest_data = df[df[driver_column] == selected_driver_dest].copy()
-        else:
-            # No filtering columns found, use all data
-            filtered_dest_data = df.copy()
-        
-        # Re-extract state data from filtered data
-        if 'CITY TO' in filtered_dest_data.columns and not filtered_dest_data.empty:
-            filtered_dest_data['CITY_STATE'] = filtered_dest_data['CITY TO'].astype(str)
-            filtered_dest_data['STATE_TO'] = filtered_dest_data['CITY_STATE'].str.extract(r',\s*([A-Z]{2})$')
-            filtered_dest_data = filtered_dest_data[filtered_dest_data['STATE_TO'].notna()]
-            
-            # Recalculate destination counts
-            filtered_destination_counts = filtered_dest_data.groupby('STATE_TO').size().reset_index(name='Destination Deliveries')
-            
-            # Update analysis_df with filtered data
-            analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']].copy()
-            
-            st.success(f"✅ Filtered data: {len(filtered_dest_data)} deliveries to {len(filtered_destination_counts)} states")
-        else:
-            st.warning("⚠️ No data available for selected filters")
-            filtered_destination_counts = destination_counts
-        
-        # Perform market quality analysis BEFORE creating the three-column layout
-        # This ensures the analysis_df has the 'High', 'Medium', 'Low' columns when we need them
-        
-        # Merge destination data with market rates for quality analysis
-        try:
-            # Enhanced market rates analysis with trailer type correlation
+                st.warning("⚠️ No data available for selected filters")
+                filtered_destination_counts = destination_counts
+
+            # Perform market quality analysis BEFORE creating the three-column layout
+            # This ensures the analysis_df has the 'High', 'Medium', 'Low' columns when we need them
+
+            # Merge destination data with market rates for quality analysis
             try:
-                # Load trailer-specific rates by state if available
-                trailer_state_rates_file = os.path.join("Trucking_Made_Successful_Data", "market_rates_by_trailer_state.csv")
-                trailer_mapping_file = os.path.join("Trucking_Made_Successful_Data", "trailer_type_mapping.csv")
-                
-                if os.path.exists(trailer_state_rates_file) and os.path.exists(trailer_mapping_file):
-                    trailer_state_rates = pd.read_csv(trailer_state_rates_file)
-                    trailer_mapping = pd.read_csv(trailer_mapping_file)
-                    
-                    # Create mapping dictionary
-                    mapping_dict = dict(zip(trailer_mapping['ORIGINAL_TYPE'], trailer_mapping['STANDARD_TYPE']))
-                    
-                    # Add custom mappings for the specific trailer types in the data
-                    custom_mapping = {
-                        'DryVan': 'Dry Van',
-                        'Flatbed': 'Flatbed', 
-                        'Power Only': 'Dry Van',  # Power Only should be considered DryVan
-                        'Reefer': 'Reefer',
-                        'Stepdeck': 'Flatbed'  # Stepdeck should be considered Flatbed
-                    }
-                    
-                    # Add trailer type analysis to destination data (use filtered data)
-                    destination_with_trailer = filtered_dest_data[['STATE_TO', 'TRAILER']].copy()
-                    destination_with_trailer['TRAILER_STANDARD'] = destination_with_trailer['TRAILER'].map(custom_mapping)
-                    
-                    # Convert state abbreviations to full names for merging
-                    destination_with_trailer['STATE_FULL'] = destination_with_trailer['STATE_TO'].map(STATE_ABBR_TO_FULL)
-                    
-                    # Merge with trailer-specific rates by state
-                    destination_with_trailer = destination_with_trailer.merge(trailer_state_rates, 
-                                                                            left_on='STATE_FULL', 
-                                                                            right_on='STATE', 
-                                                                            how='left')
-                    
-                    # Get the appropriate rate based on trailer type
-                    def get_trailer_rate(row):
-                        if row['TRAILER_STANDARD'] == 'Dry Van':
-                            return row['DRY_VAN_RATE']
-                        elif row['TRAILER_STANDARD'] == 'Reefer':
-                            return row['REEFER_RATE']
-                        elif row['TRAILER_STANDARD'] == 'Flatbed':
-                            return row['FLATBED_RATE']
-                        else:
-                            # Default to average of all rates
-                            return (row['DRY_VAN_RATE'] + row['REEFER_RATE'] + row['FLATBED_RATE']) / 3
-                    
-                    destination_with_trailer['MARKET_RATE'] = destination_with_trailer.apply(get_trailer_rate, axis=1)
-                    
-                    # Calculate market quality score for each delivery
-                    destination_with_trailer['MARKET_QUALITY'] = destination_with_trailer['MARKET_RATE'].apply(
-                        lambda x: 'High' if x > 2.5 else 'Medium' if x > 2.0 else 'Low'
-                    )
-                    
-                    # Group by state and market quality
-                    state_quality_analysis = destination_with_trailer.groupby(['STATE_TO', 'MARKET_QUALITY']).size().reset_index(name='Deliveries')
-                    
-                    # Pivot to get quality breakdown by state
-                    quality_pivot = state_quality_analysis.pivot(index='STATE_TO', columns='MARKET_QUALITY', values='Deliveries').fillna(0)
-                    quality_pivot = quality_pivot.reset_index()
-                    
-                    # Merge with destination counts
-                    analysis_df = filtered_destination_counts.merge(quality_pivot, on='STATE_TO', how='left')
-                    
-                    # Calculate average rate by state
-                    state_avg_rates = destination_with_trailer.groupby('STATE_TO')['MARKET_RATE'].mean().reset_index()
-                    analysis_df = analysis_df.merge(state_avg_rates, on='STATE_TO', how='left')
-                    
-                    st.success("✅ Using trailer-specific market rates by state for analysis")
-                    
-                else:
-                    # Fallback to overall market rates
-                    if 'MARKET_RATE' in rates_data.columns:
-                        rates_subset = rates_data[['STATE', 'MARKET_RATE']].copy()
-                        destination_counts_mapped = filtered_destination_counts.copy()
-                        destination_counts_mapped['STATE_FULL'] = destination_counts_mapped['STATE_TO'].map(STATE_ABBR_TO_FULL)
-                        analysis_df = destination_counts_mapped.merge(rates_subset, left_on='STATE_FULL', right_on='STATE', how='left')
-                        analysis_df = analysis_df[['STATE_TO', 'Destination Deliveries', 'MARKET_RATE']].dropna()
-                        
-                    elif 'value' in rates_data.columns:
-                        rates_subset = rates_data[['STATE', 'value']].copy()
-                        rates_subset = rates_subset.rename(columns={'value': 'MARKET_RATE'})
-                        destination_counts_mapped = filtered_destination_counts.copy()
-                        destination_counts_mapped['STATE_FULL'] = destination_counts_mapped['STATE_TO'].map(STATE_ABBR_TO_FULL)
-                        analysis_df = destination_counts_mapped.merge(rates_subset, left_on='STATE_FULL', right_on='STATE', how='left')
-                        analysis_df = analysis_df[['STATE_TO', 'Destination Deliveries', 'MARKET_RATE']].dropna()
-                        
+                # Enhanced market rates analysis with trailer type correlation
+                try:
+                    # Use the shared trailer-specific rates by state index if the files are available
+                    trailer_files_signature = get_file_signature(TRAILER_STATE_RATES_FILE, TRAILER_MAPPING_FILE)
+
+                    if trailer_files_signature is not None:
+                        def compute_trailer_quality():
+                            trailer_rate_index = load_trailer_rate_index(trailer_files_signature)
+
+                            # Add trailer type analysis to destination data (use filtered data)
+                            destination_with_trailer = filtered_dest_data[['STATE_TO', 'TRAILER']].copy()
+                            trailer_standard = destination_with_trailer['TRAILER'].map(trailer_rate_index['type_mapping'])
+
+                            # Convert state abbreviations to full names and look up the trailer-specific rate by state
+                            states_full = destination_with_trailer['STATE_TO'].map(STATE_ABBR_TO_FULL)
+                            destination_with_trailer['MARKET_RATE'] = lookup_trailer_rates(trailer_rate_index, states_full, trailer_standard)
+
+                            # Calculate market quality score for each delivery
+                            destination_with_trailer['MARKET_QUALITY'] = classify_market_quality(destination_with_trailer['MARKET_RATE'])
+
+                            # Group by state and market quality
+                            state_quality_analysis = destination_with_trailer.groupby(['STATE_TO', 'MARKET_QUALITY'], observed=True).size().reset_index(name='Deliveries')
+
+                            # Pivot to get quality breakdown by state
+                            quality_pivot = state_quality_analysis.pivot(index='STATE_TO', columns='MARKET_QUALITY', values='Deliveries').fillna(0)
+                            quality_pivot = quality_pivot.reset_index()
+
+                            # Calculate average rate by state
+                            state_avg_rates = destination_with_trailer.groupby('STATE_TO', observed=True)['MARKET_RATE'].mean().reset_index()
+                            return quality_pivot, state_avg_rates
+
+                        quality_pivot, state_avg_rates = get_kpi_result(
+                            'kpi4_trailer_quality', dest_filter_key, (trailer_files_signature,), compute_trailer_quality
+                        )
+
+                        # Merge with destination counts and the average rate by state
+                        analysis_df = filtered_destination_counts.merge(quality_pivot, on='STATE_TO', how='left')
+                        analysis_df = analysis_df.merge(state_avg_rates, on='STATE_TO', how='left')
+
+                        st.success("✅ Using trailer-specific market rates by state for analysis")
+
                     else:
-                        analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']]
-                        st.info("Market rates data not available for analysis")
-                        
+                        # Fallback to overall market rates
+                        if 'MARKET_RATE' in rates_data.columns:
+                            rates_subset = rates_data[['STATE', 'MARKET_RATE']].copy()
+                            destination_counts_mapped = filtered_destination_counts.copy()
+                            destination_counts_mapped['STATE_FULL'] = destination_counts_mapped['STATE_TO'].map(STATE_ABBR_TO_FULL)
+                            analysis_df = destination_counts_mapped.merge(rates_subset, left_on='STATE_FULL', right_on='STATE', how='left')
+                            analysis_df = analysis_df[['STATE_TO', 'Destination Deliveries', 'MARKET_RATE']].dropna()
+
+                        elif 'value' in rates_data.columns:
+                            rates_subset = rates_data[['STATE', 'value']].copy()
+                            rates_subset = rates_subset.rename(columns={'value': 'MARKET_RATE'})
+                            destination_counts_mapped = filtered_destination_counts.copy()
+                            destination_counts_mapped['STATE_FULL'] = destination_counts_mapped['STATE_TO'].map(STATE_ABBR_TO_FULL)
+                            analysis_df = destination_counts_mapped.merge(rates_subset, left_on='STATE_FULL', right_on='STATE', how='left')
+                            analysis_df = analysis_df[['STATE_TO', 'Destination Deliveries', 'MARKET_RATE']].dropna()
+
+                        else:
+                            analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']]
+                            st.info("Market rates data not available for analysis")
+
+                except Exception as e:
+                    st.error(f"Error in trailer-specific analysis: {e}")
+                    # Fallback to basic analysis
+                    analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']]
+
             except Exception as e:
-                st.error(f"Error in trailer-specific analysis: {e}")
-                # Fallback to basic analysis
+                st.error(f"Error processing destination data: {e}")
                 analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']]
-            
-        except Exception as e:
-            st.error(f"Error processing destination data: {e}")
-            analysis_df = filtered_destination_counts[['STATE_TO', 'Destination Deliveries']]
-        
-        # Create three-column layout for maps and charts
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            # Destination deliveries by state map
-            fig4a = px.choropleth(filtered_destination_counts, locations='STATE_TO', locationmode="USA-states", 
-                                 color='Destination Deliveries', scope="usa", color_continuous_scale="Blues",
-                                 title="Destination Deliveries by State")
-            st.plotly_chart(fig4a, use_container_width=True)
-        
-        with col2:
-            # Market rates map
-            if 'MARKET_RATE' in rates_data.columns or 'value' in rates_data.columns:
-                if 'MARKET_RATE' in rates_data.columns:
-                    rates_viz = rates_data[['STATE', 'MARKET_RATE']].copy()
+
+            # Create three-column layout for maps and charts
+            col1, col2, col3 = st.columns(3)
+
+            with col1:
+                # Destination deliveries by state map
+                fig4a = get_cached_figure(
+                    'kpi4_destination_map', filtered_destination_counts, (),
+                    lambda: px.choropleth(filtered_destination_counts, locations='STATE_TO', locationmode="USA-states", 
+                                          color='Destination Deliveries', scope="usa", color_continuous_scale="Blues",
+                                          title="Destination Deliveries by State")
+                )
+                st.plotly_chart(fig4a, use_container_width=True)
+
+            with col2:
+                # Market rates map
+                if 'MARKET_RATE' in rates_data.columns or 'value' in rates_data.columns:
+                    if 'MARKET_RATE' in rates_data.columns:
+                        rates_viz = rates_data[['STATE', 'MARKET_RATE']].copy()
+                    else:
+                        rates_viz = rates_data[['STATE', 'value']].copy()
+                        rates_viz = rates_viz.rename(columns={'value': 'MARKET_RATE'})
+
+                    rates_viz['STATE_ABBR'] = rates_viz['STATE'].map(STATE_FULL_TO_ABBR)
+
+                    fig4b = get_cached_figure(
+                        'kpi4_market_rate_map', rates_viz, (),
+                        lambda: px.choropleth(rates_viz, locations='STATE_ABBR', locationmode="USA-states", 
+                                              color='MARKET_RATE', scope="usa", color_continuous_scale="RdYlGn",
+                                              title="Market Rates by State (Green=High, Red=Low)")
+                    )
+                    st.plotly_chart(fig4b, use_container_width=True)
+
+            with col3:
+                # Market quality breakdown chart
+                if 'High' in analysis_df.columns and 'Medium' in analysis_df.columns and 'Low' in analysis_df.columns:
+                    # Calculate market quality score for map visualization
+                    quality_map_data = analysis_df.copy()
+                    quality_map_data['Market Quality Score'] = (
+                        quality_map_data['High'] * 3 + 
+                        quality_map_data['Medium'] * 2 + 
+                        quality_map_data['Low'] * 1
+                    ) / quality_map_data['Destination Deliveries']
+
+                    # Create choropleth map showing market quality by state
+                    fig4c = get_cached_figure(
+                        'kpi4_quality_map', quality_map_data[['STATE_TO', 'Market Quality Score']], (),
+                        lambda: px.choropleth(quality_map_data, locations='STATE_TO', locationmode="USA-states", 
+                                              color='Market Quality Score', scope="usa", color_continuous_scale="RdYlGn",
+                                              title="Market Quality by State (Green=High, Red=Low)",
+                                              labels={'Market Quality Score': 'Quality Score'})
+                    )
+                    st.plotly_chart(fig4c, use_container_width=True)
                 else:
-                    rates_viz = rates_data[['STATE', 'value']].copy()
-                    rates_viz = rates_viz.rename(columns={'value': 'MARKET_RATE'})
-                
-                STATE_FULL_TO_ABBR = {v: k for k, v in STATE_ABBR_TO_FULL.items()}
-                rates_viz['STATE_ABBR'] = rates_viz['STATE'].map(STATE_FULL_TO_ABBR)
-                
-                fig4b = px.choropleth(rates_viz, locations='STATE_ABBR', locationmode="USA-states", 
-                                     color='MARKET_RATE', scope="usa", color_continuous_scale="RdYlGn",
-                                     title="Market Rates by State (Green=High, Red=Low)")
-                st.plotly_chart(fig4b, use_container_width=True)
-        
-        with col3:
-            # Market quality breakdown chart
-            if 'High' in analysis_df.columns and 'Medium' in analysis_df.columns and 'Low' in analysis_df.columns:
-                # Calculate market quality score for map visualization
-                quality_map_data = analysis_df.copy()
-                quality_map_data['Market Quality Score'] = (
-                    quality_map_data['High'] * 3 + 
-                    quality_map_data['Medium'] * 2 + 
-                    quality_map_data['Low'] * 1
-                ) / quality_map_data['Destination Deliveries']
-                
-                # Create choropleth map showing market quality by state
-                fig4c = px.choropleth(quality_map_data, locations='STATE_TO', locationmode="USA-states", 
-                                     color='Market Quality Score', scope="usa", color_continuous_scale="RdYlGn",
-                                     title="Market Quality by State (Green=High, Red=Low)",
-                                     labels={'Market Quality Score': 'Quality Score'})
-                st.plotly_chart(fig4c, use_container_width=True)
-            else:
-                st.info("Market quality map will appear here after analysis")
-        
-        # Destination market quality analysis table
-        st.subheader("Destination Market Quality Analysis")
-        
-        if not analysis_df.empty:
-            # Show comprehensive analysis table
-            display_columns = ['STATE_TO', 'Destination Deliveries', 'MARKET_RATE']
-            
-            # Add quality columns if available
-            if 'High' in analysis_df.columns:
-                display_columns.extend(['High', 'Medium', 'Low'])
-            
-            display_df = analysis_df[display_columns].copy()
-            display_df['MARKET_RATE'] = display_df['MARKET_RATE'].round(2)
-            
-            # Rename columns for better display
-            display_df = display_df.rename(columns={
-                'STATE_TO': 'State',
-                'Destination Deliveries': 'Total Deliveries',
-                'MARKET_RATE': 'Avg Rate ($/mile)',
-                'High': 'High Quality',
-                'Medium': 'Medium Quality', 
-                'Low': 'Low Quality'
-            })
-            
-            st.dataframe(display_df.sort_values('Total Deliveries', ascending=False), use_container_width=True)
-            
-            # Add summary statistics
-            if 'High' in analysis_df.columns:
-                total_high = analysis_df['High'].sum()
-                total_medium = analysis_df['Medium'].sum()
-                total_low = analysis_df['Low'].sum()
-                
-                st.info(f"""
-                **Market Quality Summary:**
-                - **High Quality Deliveries**: {total_high} ({(total_high/(total_high+total_medium+total_low)*100):.1f}%)
-                - **Medium Quality Deliveries**: {total_medium} ({(total_medium/(total_high+total_medium+total_low)*100):.1f}%)
-                - **Low Quality Deliveries**: {total_low} ({(total_low/(total_high+total_medium+total_low)*100):.1f}%)
+                    st.info("Market quality map will appear here after analysis")
+
+            # Destination market quality analysis table
+            st.subheader("Destination Market Quality Analysis")
+
+            if not analysis_df.empty:
+                # Show comprehensive analysis table
+                display_columns = ['STATE_TO', 'Destination Deliveries', 'MARKET_RATE']
+
+                # Add quality columns if available
+                if 'High' in analysis_df.columns:
+                    display_columns.extend(['High', 'Medium', 'Low'])
+
+                display_df = analysis_df[display_columns].copy()
+                display_df['MARKET_RATE'] = display_df['MARKET_RATE'].round(2)
+
+                # Rename columns for better display
+                display_df = display_df.rename(columns={
+                    'STATE_TO': 'State',
+                    'Destination Deliveries': 'Total Deliveries',
+                    'MARKET_RATE': 'Avg Rate ($/mile)',
+                    'High': 'High Quality',
+                    'Medium': 'Medium Quality', 
+                    'Low': 'Low Quality'
+                })
+
+                st.dataframe(display_df.sort_values('Total Deliveries', ascending=False), use_container_width=True)
+
+                # Add summary statistics
+                if 'High' in analysis_df.columns:
+                    total_high = analysis_df['High'].sum()
+                    total_medium = analysis_df['Medium'].sum()
+                    total_low = analysis_df['Low'].sum()
+
+                    st.info(f"""
+                    **Market Quality Summary:**
+                    - **High Quality Deliveries**: {total_high} ({(total_high/(total_high+total_medium+total_low)*100):.1f}%)
+                    - **Medium Quality Deliveries**: {total_medium} ({(total_medium/(total_high+total_medium+total_low)*100):.1f}%)
+                    - **Low Quality Deliveries**: {total_low} ({(total_low/(total_high+total_medium+total_low)*100):.1f}%)
+                    """)
+
+                # Market Quality Score Explanation
+                st.info("""
+                **Market Quality Score Explanation:**
+                - **Green (High Score)**: States with mostly high-quality deliveries
+                - **Yellow (Medium Score)**: States with mixed quality deliveries  
+                - **Red (Low Score)**: States with mostly low-quality deliveries
+                - **Score Calculation**: (High×3 + Medium×2 + Low×1) ÷ Total Deliveries
                 """)
-            
-            # Market Quality Score Explanation
-            st.info("""
-            **Market Quality Score Explanation:**
-            - **Green (High Score)**: States with mostly high-quality deliveries
-            - **Yellow (Medium Score)**: States with mixed quality deliveries  
-            - **Red (Low Score)**: States with mostly low-quality deliveries
-            - **Score Calculation**: (High×3 + Medium×2 + Low×1) ÷ Total Deliveries
-            """)
-            
-        else:
-            st.warning("No data available for analysis after merging")
-            st.info("This usually means state names don't match between destinations and market rates data")
-        
-    except Exception as e:
-            st.error(f"Error merging market rates data: {e}")
-            # Fallback to destinations only
-            analysis_df = destination_counts[['STATE_TO', 'Destination Deliveries']]
-            st.dataframe(analysis_df.sort_values('Destination Deliveries', ascending=False), use_container_width=True)
-        
-    except Exception as e:
-        st.error(f"Error processing destination data: {e}")
-        # Fallback to basic visualization
-        fig4 = px.choropleth(destination_counts, locations='STATE_TO', locationmode="USA-states", 
-                            color='Destination Deliveries', scope="usa", color_continuous_scale="Blues")
-        st.plotly_chart(fig4, use_container_width=True)
 
-elif not destination_counts.empty:
-    fig4 = px.choropleth(destination_counts, locations='STATE_TO', locationmode="USA-states", 
-                         color='Destination Deliveries', scope="usa", color_continuous_scale="Blues")
-    st.plotly_chart(fig4, use_container_width=True)
-else:
-    st.info("No state delivery data available")
+            else:
+                st.warning("No data available for analysis after merging")
+                st.info("This usually means state names don't match between destinations and market rates data")
 
-# Market Quality Heat Map based on Trucking Made Successful data
-st.subheader("Market Quality Heat Map")
-if 'market' in reference_data and 'market_rates' in reference_data:
-    try:
-        # Get market data (load volumes) and market rates
-        market_data = reference_data['market']
-        rates_data = reference_data['market_rates']
-        
-        # Create market quality analysis
-        # Check if using converted files (different column names)
-        if 'LOAD_VOLUME' in market_data.columns and 'MARKET_RATE' in rates_data.columns:
-            # Using converted files format
-            market_quality = market_data[['STATE', 'LOAD_VOLUME']].copy()
-            rates_subset = rates_data[['STATE', 'MARKET_RATE']].copy()
-            
-            # Convert full state names to abbreviations for choropleth map
-            STATE_FULL_TO_ABBR = {v: k for k, v in STATE_ABBR_TO_FULL.items()}
-            market_quality['STATE_ABBR'] = market_quality['STATE'].map(STATE_FULL_TO_ABBR)
-            rates_subset['STATE_ABBR'] = rates_subset['STATE'].map(STATE_FULL_TO_ABBR)
-            
-        elif 'value' in market_data.columns and 'value' in rates_data.columns:
-            # Using original Trucking Made Successful format
-            market_quality = market_data[['STATE', 'value']].copy()
-            market_quality = market_quality.rename(columns={'value': 'LOAD_VOLUME'})
-            
-            rates_subset = rates_data[['STATE', 'value']].copy()
-            rates_subset = rates_subset.rename(columns={'value': 'MARKET_RATE'})
-            
-            # Convert full state names to abbreviations for choropleth map
-            STATE_FULL_TO_ABBR = {v: k for k, v in STATE_ABBR_TO_FULL.items()}
-            market_quality['STATE_ABBR'] = market_quality['STATE'].map(STATE_FULL_TO_ABBR)
-            rates_subset['STATE_ABBR'] = rates_subset['STATE'].map(STATE_FULL_TO_ABBR)
-            
-        else:
-            st.error("❌ Unexpected data format. Please check your data files.")
-            st.stop()
-        
-        # Merge load volumes with rates
-        market_quality = market_quality.merge(rates_subset, on='STATE_ABBR', how='left')
-        
-        # Calculate market quality score (higher load volume + higher rate = better market)
-        if not market_quality.empty:
-            # Normalize values for scoring (0-100 scale)
-            market_quality['LOAD_VOLUME_NORM'] = (market_quality['LOAD_VOLUME'] - market_quality['LOAD_VOLUME'].min()) / (market_quality['LOAD_VOLUME'].max() - market_quality['LOAD_VOLUME'].min()) * 100
-            market_quality['RATE_NORM'] = (market_quality['MARKET_RATE'] - market_quality['MARKET_RATE'].min()) / (market_quality['MARKET_RATE'].max() - market_quality['MARKET_RATE'].min()) * 100
-            
-            # Calculate overall market quality score
-            market_quality['MARKET_QUALITY_SCORE'] = (market_quality['LOAD_VOLUME_NORM'] * 0.6 + market_quality['RATE_NORM'] * 0.4)
-            
-            # Debug: Show merged data info (after calculation)
-            with st.expander("🔍 Debug: Market Quality Data", expanded=False):
-                st.write("**Merged Market Quality Data:**")
-                st.write(f"Columns: {list(market_quality.columns)}")
-                st.write(f"Total rows: {len(market_quality)}")
-                st.write(f"Sample data:")
-                st.dataframe(market_quality.head(), use_container_width=True)
-                
-                # Show which columns are available for the heat map
-                st.write("**Available columns for heat map:**")
-                if 'STATE_ABBR' in market_quality.columns:
-                    st.write("✅ STATE_ABBR column found")
-                if 'MARKET_QUALITY_SCORE' in market_quality.columns:
-                    st.write("✅ MARKET_QUALITY_SCORE column found")
-                else:
-                    st.write("❌ MARKET_QUALITY_SCORE column missing")
-            
-            # Create heat map
-            fig4c = px.choropleth(market_quality, locations='STATE_ABBR', locationmode="USA-states", 
-                                 color='MARKET_QUALITY_SCORE', scope="usa", 
-                                 color_continuous_scale="RdYlGn",  # Red (bad) to Green (good)
-                                 title="Market Quality Heat Map (Green=Good, Red=Bad)",
-                                 labels={'MARKET_QUALITY_SCORE': 'Market Quality Score'})
-            st.plotly_chart(fig4c, use_container_width=True)
-            
-            # Show market quality table
-            with st.expander("📊 Market Quality Analysis Table", expanded=False):
-                # Use the correct column name for state
-                state_col = 'STATE' if 'STATE' in market_quality.columns else 'STATE_ABBR'
-                quality_table = market_quality[[state_col, 'LOAD_VOLUME', 'MARKET_RATE', 'MARKET_QUALITY_SCORE']].sort_values('MARKET_QUALITY_SCORE', ascending=False)
-                quality_table['MARKET_QUALITY_SCORE'] = quality_table['MARKET_QUALITY_SCORE'].round(1)
-                st.dataframe(quality_table, use_container_width=True)
-            
-            # Add explanation
-            st.info("""
-            **Market Quality Score Explanation:**
-            - **Green (High Score)**: Good markets with high load volume and good rates
-            - **Yellow (Medium Score)**: Average markets
-            - **Red (Low Score)**: Poor markets (Dead Zones) with low load volume or poor rates
-            - **Score Calculation**: 60% load volume + 40% market rate
-            """)
-        
-    except Exception as e:
-        st.error(f"Error creating market quality heat map: {e}")
-        st.info("Market quality analysis requires both market data (load volumes) and market rates data to be uploaded.")
-else:
-    st.info("📊 Upload market data and market rates data in the sidebar to see the Market Quality Heat Map")
+        except Exception as e:
+                st.error(f"Error merging market rates data: {e}")
+                # Fallback to destinations only
+                analysis_df = destination_counts[['STATE_TO', 'Destination Deliveries']]
+                st.dataframe(analysis_df.sort_values('Destination Deliveries', ascending=False), use_container_width=True)
 
-# --- KPI 5: Idle Days per Driver per Dispatcher ---
-st.subheader("5. Idle Days per Driver per Dispatcher")
+        except Exception as e:
+            st.error(f"Error processing destination data: {e}")
+            # Fallback to basic visualization
+            fig4 = px.choropleth(destination_counts, locations='STATE_TO', locationmode="USA-states", 
+                                color='Destination Deliveries', scope="usa", color_continuous_scale="Blues")
+            st.plotly_chart(fig4, use_container_width=True)
 
-    # Get drivers for this dispatcher
-# Use the globally filtered data (no need for individual dispatcher selection)
-if not df.empty:
-    # Get drivers from the globally filtered data
-    drivers_idle = sorted(df['DRIVER NAME'].dropna().astype(str).unique())
-    
-    # Driver selection with multi-select
-    selected_drivers_idle = st.multiselect(
-        "Select Drivers for Idle Days (remove to exclude):",
-        drivers_idle,
-        default=drivers_idle,
-        key="idle_drivers",
-        help="Select which drivers to include in the idle days chart. Remove drivers to exclude them."
-    )
-    
-    if selected_drivers_idle:
-        # Filter data for selected drivers
-        filtered_idle_data = df[df['DRIVER NAME'].isin(selected_drivers_idle)]
-        df_sorted = filtered_idle_data.sort_values(['DRIVER ID', 'DELIVERY DATE']).copy()
+    elif not destination_counts.empty:
+        fig4 = px.choropleth(destination_counts, locations='STATE_TO', locationmode="USA-states", 
+                             color='Destination Deliveries', scope="usa", color_continuous_scale="Blues")
+        st.plotly_chart(fig4, use_container_width=True)
     else:
-        df_sorted = pd.DataFrame()
-else:
-    df_sorted = pd.DataFrame()
+        st.info("No state delivery data available")
+
+show_destination_market_quality()
 
-    drivers_idle = sorted(dispatcher_idle_data['DRIVER NAME'].dropna().astype(str).unique())
+@st.cache_data
+def build_market_quality_table(_market_data, _rates_data, reference_fingerprint):
+    """Load volume and market rate per state with their 0-100 min-max normalizations, computed once per
+    market data / market rates fingerprint. Returns None if the files are in an unexpected format."""
+    # Check if using converted files (different column names)
+    if 'LOAD_VOLUME' in _market_data.columns and 'MARKET_RATE' in _rates_data.columns:
+        # Using converted files format
+        market_quality = _market_data[['STATE', 'LOAD_VOLUME']].copy()
+        rates_subset = _rates_data[['STATE', 'MARKET_RATE']].copy()
+    elif 'value' in _market_data.columns and 'value' in _rates_data.columns:
+        # Using original Trucking Made Successful format
+        market_quality = _market_data[['STATE', 'value']].rename(columns={'value': 'LOAD_VOLUME'})
+        rates_subset = _rates_data[['STATE', 'value']].rename(columns={'value': 'MARKET_RATE'})
+    else:
+        return None
     
-    # Driver selection with multi-select
-    selected_drivers_idle = st.multiselect(
-        "Select Drivers for Idle Days (remove to exclude):",
-        drivers_idle,
-        default=drivers_idle,
-        key="idle_drivers",
-        help="Select which drivers to include in the idle days chart. Remove drivers to exclude them."
-    )
+    # Convert full state names to abbreviations for choropleth map
+    market_quality['STATE_ABBR'] = market_quality['STATE'].map(STATE_FULL_TO_ABBR)
+    rates_subset['STATE_ABBR'] = rates_subset['STATE'].map(STATE_FULL_TO_ABBR)
     
-    if selected_drivers_idle:
-        # Filter data for selected drivers
-        filtered_idle_data = dispatcher_idle_data[dispatcher_idle_data['DRIVER NAME'].isin(selected_drivers_idle)]
-        df_sorted = filtered_idle_data.sort_values(['DRIVER ID', 'DELIVERY DATE']).copy()
-    else:
-        df_sorted = pd.DataFrame()
-else:
-    # Use all data for all dispatchers
-    df_sorted = df.sort_values(['DRIVER ID', 'DELIVERY DATE']).copy()
+    # Merge load volumes with rates
+    market_quality = market_quality.merge(rates_subset, on='STATE_ABBR', how='left')
+    
+    # Normalize values for scoring (0-100 scale)
+    for col, norm_col in [('LOAD_VOLUME', 'LOAD_VOLUME_NORM'), ('MARKET_RATE', 'RATE_NORM')]:
+        market_quality[norm_col] = (market_quality[col] - market_quality[col].min()) / (market_quality[col].max() - market_quality[col].min()) * 100
+    return market_quality
 
-if not df_sorted.empty:
-    try:
-        df_sorted['NEXT PICKUP'] = df_sorted.groupby('DRIVER ID')['PICK-UP DATE'].shift(-1)
-        
-        # Remove timezone info if present
-        if df_sorted['NEXT PICKUP'].dt.tz is not None:
-            df_sorted['NEXT PICKUP'] = df_sorted['NEXT PICKUP'].dt.tz_localize(None)
-        if df_sorted['DELIVERY DATE'].dt.tz is not None:
-            df_sorted['DELIVERY DATE'] = df_sorted['DELIVERY DATE'].dt.tz_localize(None)
-        
-        # Calculate idle days only for valid datetime pairs
-        mask = df_sorted['NEXT PICKUP'].notna() & df_sorted['DELIVERY DATE'].notna()
-        df_sorted.loc[mask, 'IDLE DAYS'] = (df_sorted.loc[mask, 'NEXT PICKUP'] - df_sorted.loc[mask, 'DELIVERY DATE']).dt.days
-        
-        idle_df = df_sorted[df_sorted['IDLE DAYS'] > 0]
-        
-        if not idle_df.empty:
-            # Group by dispatcher, driver, and week for week-by-week visualization
-            idle_summary = idle_df.groupby(['FC NAME', 'DRIVER NAME', 'WEEK'])['IDLE DAYS'].sum().reset_index()
-            idle_summary = idle_summary.dropna(subset=['WEEK'])
-            
-            # Format week for display
-            idle_summary['Week Display'] = idle_summary['WEEK'].dt.strftime('%b %d, %Y')
-            
-            # Create stacked bar chart with one bar per dispatcher per week
-            fig5 = px.bar(idle_summary, x='FC NAME', y='IDLE DAYS', color='DRIVER NAME', 
-                          facet_col='Week Display',  # Separate chart for each week
-                          barmode='stack',  # Stacked bars
-                          hover_data=['WEEK', 'DRIVER NAME', 'IDLE DAYS'])
-            
-            # Update layout for better presentation
-            fig5.update_layout(
-                title="Idle Days by Dispatcher (Stacked by Driver) - Week by Week",
-                xaxis_title="Dispatcher (FC)",
-                yaxis_title="Idle Days",
-                showlegend=True,
-                legend_title="Driver Name"
+@st.fragment
+def show_market_quality_heat_map():
+    """Market Quality Heat Map; the weight slider reruns only this section"""
+    st.subheader("Market Quality Heat Map")
+    if 'market' in reference_data and 'market_rates' in reference_data:
+        try:
+            # Normalized per-state table, shared across sessions until the reference data changes
+            market_quality = build_market_quality_table(
+                reference_data['market'], reference_data['market_rates'],
+                f"{reference_hashes.get('market')}:{reference_hashes.get('market_rates')}"
             )
-            
-            st.plotly_chart(fig5, use_container_width=True)
-            
-            # Show weekly summary table
-            with st.expander("Weekly Idle Days Summary", expanded=False):
-                weekly_idle_summary = idle_summary.groupby(['WEEK', 'FC NAME'])['IDLE DAYS'].sum().reset_index()
-                weekly_idle_summary['Week Display'] = weekly_idle_summary['WEEK'].dt.strftime('%b %d, %Y')
-                weekly_idle_summary['IDLE DAYS'] = weekly_idle_summary['IDLE DAYS'].apply(lambda x: f"{x:.1f} days")
-                weekly_idle_summary = weekly_idle_summary.sort_values(['WEEK', 'IDLE DAYS'], ascending=[True, False])
-                
-                st.dataframe(weekly_idle_summary[['Week Display', 'FC NAME', 'IDLE DAYS']], 
-                            use_container_width=True, hide_index=True)
-            
-            # Show overall summary table
-            with st.expander("Overall Idle Days Summary by Dispatcher", expanded=False):
-                total_idle = idle_summary.groupby('FC NAME')['IDLE DAYS'].sum().reset_index()
-                summary_table = total_idle.sort_values('IDLE DAYS', ascending=False)
-                summary_table['IDLE DAYS'] = summary_table['IDLE DAYS'].apply(lambda x: f"{x:.1f} days")
-                st.dataframe(summary_table, use_container_width=True)
-            
+            if market_quality is None:
+                st.error("❌ Unexpected data format. Please check your data files.")
+                st.stop()
+
+            # Calculate market quality score (higher load volume + higher rate = better market)
+            if not market_quality.empty:
+                volume_weight = st.slider("Load volume weight in the market quality score:", 0.0, 1.0, 0.6, 0.05,
+                                          help="The market rate gets the remaining weight")
+
+                # Calculate overall market quality score
+                market_quality['MARKET_QUALITY_SCORE'] = (market_quality['LOAD_VOLUME_NORM'] * volume_weight + market_quality['RATE_NORM'] * (1 - volume_weight))
+
+                # Debug: Show merged data info (after calculation)
+                with st.expander("🔍 Debug: Market Quality Data", expanded=False):
+                    st.write("**Merged Market Quality Data:**")
+                    st.write(f"Columns: {list(market_quality.columns)}")
+                    st.write(f"Total rows: {len(market_quality)}")
+                    st.write(f"Sample data:")
+                    st.dataframe(market_quality.head(), use_container_width=True)
+
+                    # Show which columns are available for the heat map
+                    st.write("**Available columns for heat map:**")
+                    if 'STATE_ABBR' in market_quality.columns:
+                        st.write("✅ STATE_ABBR column found")
+                    if 'MARKET_QUALITY_SCORE' in market_quality.columns:
+                        st.write("✅ MARKET_QUALITY_SCORE column found")
+                    else:
+                        st.write("❌ MARKET_QUALITY_SCORE column missing")
+
+                # Create heat map
+                fig4c = get_cached_figure(
+                    'market_quality_heat_map', market_quality[['STATE_ABBR', 'MARKET_QUALITY_SCORE']], (),
+                    lambda: px.choropleth(market_quality, locations='STATE_ABBR', locationmode="USA-states", 
+                                          color='MARKET_QUALITY_SCORE', scope="usa", 
+                                          color_continuous_scale="RdYlGn",  # Red (bad) to Green (good)
+                                          title="Market Quality Heat Map (Green=Good, Red=Bad)",
+                                          labels={'MARKET_QUALITY_SCORE': 'Market Quality Score'})
+                )
+                st.plotly_chart(fig4c, use_container_width=True)
+
+                # Show market quality table
+                with st.expander("📊 Market Quality Analysis Table", expanded=False):
+                    # Use the correct column name for state
+                    state_col = 'STATE' if 'STATE' in market_quality.columns else 'STATE_ABBR'
+                    quality_table = market_quality[[state_col, 'LOAD_VOLUME', 'MARKET_RATE', 'MARKET_QUALITY_SCORE']].sort_values('MARKET_QUALITY_SCORE', ascending=False)
+                    quality_table['MARKET_QUALITY_SCORE'] = quality_table['MARKET_QUALITY_SCORE'].round(1)
+                    st.dataframe(quality_table, use_container_width=True)
+
+                # Add explanation
+                st.info(f"""
+                **Market Quality Score Explanation:**
+                - **Green (High Score)**: Good markets with high load volume and good rates
+                - **Yellow (Medium Score)**: Average markets
+                - **Red (Low Score)**: Poor markets (Dead Zones) with low load volume or poor rates
+                - **Score Calculation**: {volume_weight:.0%} load volume + {1 - volume_weight:.0%} market rate
+                """)
+
+        except Exception as e:
+            st.error(f"Error creating market quality heat map: {e}")
+            st.info("Market quality analysis requires both market data (load volumes) and market rates data to be uploaded.")
+    else:
+        st.info("📊 Upload market data and market rates data in the sidebar to see the Market Quality Heat Map")
+
+show_market_quality_heat_map()
+
+# --- KPI 5: Idle Days per Driver per Dispatcher ---
+@st.fragment
+def show_idle_days():
+    """KPI 5 section; its driver picker reruns only this section"""
+    st.subheader("5. Idle Days per Driver per Dispatcher")
+
+    # Use the globally filtered data (no need for individual dispatcher selection)
+    if not df.empty:
+        # Get drivers from the globally filtered data
+        drivers_idle = sorted(load_cube['DRIVER NAME'].dropna().unique())
+
+        # Driver selection with multi-select
+        selected_drivers_idle = st.multiselect(
+            "Select Drivers for Idle Days (remove to exclude):",
+            drivers_idle,
+            default=drivers_idle,
+            key="idle_drivers",
+            help="Select which drivers to include in the idle days chart. Remove drivers to exclude them."
+        )
+
+        if selected_drivers_idle:
+            def compute_idle_summary():
+                # Filter the idle gaps precomputed at ingest (global dispatcher filter, date range and selected drivers)
+                idle_df = idle_gaps[idle_gaps['DRIVER NAME'].isin(selected_drivers_idle) & (idle_gaps['IDLE DAYS'] > 0)]
+                if selected_global_dispatchers:
+                    idle_df = idle_df[idle_df['FC NAME'].isin(selected_global_dispatchers)]
+                idle_df = idle_df[idle_df['WEEK'].isin(load_cube['WEEK'])]
+
+                # Group by dispatcher, driver, and week for week-by-week visualization
+                idle_summary = idle_df.groupby(['FC NAME', 'DRIVER NAME', 'WEEK'], observed=True)['IDLE DAYS'].sum().reset_index()
+                return idle_summary.dropna(subset=['WEEK'])
         else:
+            compute_idle_summary = None
+    else:
+        compute_idle_summary = None
+
+
+    if compute_idle_summary is not None:
+        try:
+            idle_summary = get_kpi_result('kpi5_idle_days', normalize_selection(selected_drivers_idle, drivers_idle), (), compute_idle_summary)
+            if not idle_summary.empty:
+                # Format week for display
+                idle_summary['Week Display'] = idle_summary['WEEK'].dt.strftime('%b %d, %Y')
+
+                idle_view = st.radio("Chart view:", WEEK_CHART_VIEWS, horizontal=True, key="idle_chart_view")
+                if idle_view == "Heatmap (all weeks)":
+                    fig5 = get_cached_figure(
+                        'kpi5_heatmap', idle_summary, (),
+                        lambda: build_dispatcher_week_heatmap(idle_summary, 'IDLE DAYS', "Idle Days by Dispatcher - All Weeks", "Idle Days")
+                    )
+                else:
+                    # Create stacked bar chart with one bar per dispatcher per week (one page of weeks)
+                    page_idle = idle_summary[idle_summary['WEEK'].isin(select_week_page(idle_summary['WEEK'].unique(), "idle_week_page"))]
+
+                    def build_idle_figure():
+                        fig5 = px.bar(page_idle, x='FC NAME', y='IDLE DAYS', color='DRIVER NAME', 
+                                      facet_col='Week Display',  # Separate chart for each week
+                                      category_orders={'Week Display': page_idle.sort_values('WEEK')['Week Display'].unique().tolist()},
+                                      barmode='stack',  # Stacked bars
+                                      hover_data=['WEEK', 'DRIVER NAME', 'IDLE DAYS'])
+
+                        # Update layout for better presentation
+                        fig5.update_layout(
+                            title="Idle Days by Dispatcher (Stacked by Driver) - Week by Week",
+                            xaxis_title="Dispatcher (FC)",
+                            yaxis_title="Idle Days",
+                            showlegend=True,
+                            legend_title="Driver Name"
+                        )
+                        return fig5
+
+                    fig5 = get_cached_figure('kpi5_weekly_bars', page_idle, (), build_idle_figure)
+
+                st.plotly_chart(fig5, use_container_width=True)
+
+                # Show weekly summary table
+                with st.expander("Weekly Idle Days Summary", expanded=False):
+                    weekly_idle_summary = idle_summary.groupby(['WEEK', 'FC NAME'], observed=True)['IDLE DAYS'].sum().reset_index()
+                    weekly_idle_summary['Week Display'] = weekly_idle_summary['WEEK'].dt.strftime('%b %d, %Y')
+                    weekly_idle_summary['IDLE DAYS'] = weekly_idle_summary['IDLE DAYS'].apply(lambda x: f"{x:.1f} days")
+                    weekly_idle_summary = weekly_idle_summary.sort_values(['WEEK', 'IDLE DAYS'], ascending=[True, False])
+
+                    st.dataframe(weekly_idle_summary[['Week Display', 'FC NAME', 'IDLE DAYS']], 
+                                use_container_width=True, hide_index=True)
+
+                # Show overall summary table
+                with st.expander("Overall Idle Days Summary by Dispatcher", expanded=False):
+                    total_idle = idle_summary.groupby('FC NAME', observed=True)['IDLE DAYS'].sum().reset_index()
+                    summary_table = total_idle.sort_values('IDLE DAYS', ascending=False)
+                    summary_table['IDLE DAYS'] = summary_table['IDLE DAYS'].apply(lambda x: f"{x:.1f} days")
+                    st.dataframe(summary_table, use_container_width=True)
+
+            else:
+                st.info("No idle days data available")
+
+        except Exception as e:
+            st.error(f"Error calculating idle days: {e}")
             st.info("No idle days data available")
-            
-    except Exception as e:
-        st.error(f"Error calculating idle days: {e}")
-        st.info("No idle days data available")
-else:
-    st.info("No data available for selected dispatcher/drivers")
+    else:
+        st.info("No data available for selected dispatcher/drivers")
+
+show_idle_days()
 
 # --- KPI 6: Prebooked Loads ---
-with st.expander("6. Hours Prebooked (Time Between Booking and Pickup)", expanded=False):
-    try:
-        # Create a copy to avoid modifying the original dataframe
-        df_temp = df.copy()
-        
-        # Ensure BOOKING TIME exists
-        if 'BOOKING TIME' not in df_temp.columns:
-            st.error("BOOKING TIME column not found. Please check data loading.")
-            prebook_df = pd.DataFrame()
-        else:
-            # Ensure PICK-UP DATE is timezone-naive
-            df_temp['PICK-UP DATE'] = pd.to_datetime(df_temp['PICK-UP DATE'], errors='coerce')
-            if df_temp['PICK-UP DATE'].dt.tz is not None:
-                df_temp['PICK-UP DATE'] = df_temp['PICK-UP DATE'].dt.tz_localize(None)
-            
-            # Ensure BOOKING TIME is timezone-naive
-            if df_temp['BOOKING TIME'].dt.tz is not None:
-                df_temp['BOOKING TIME'] = df_temp['BOOKING TIME'].dt.tz_localize(None)
-            
-            # Calculate prebook hours only for valid datetime pairs
-            mask = df_temp['BOOKING TIME'].notna() & df_temp['PICK-UP DATE'].notna()
-            df_temp.loc[mask, 'PREBOOK HOURS'] = (df_temp.loc[mask, 'PICK-UP DATE'] - df_temp.loc[mask, 'BOOKING TIME']).dt.total_seconds() / 3600
-            
-            prebook_df = df_temp[df_temp['PREBOOK HOURS'] >= 0]
-    except Exception as e:
-        st.error(f"Error calculating prebook hours: {e}")
-        prebook_df = pd.DataFrame()
-    if not prebook_df.empty:
-        fig6 = px.histogram(prebook_df, x='PREBOOK HOURS', color='FC NAME', nbins=50)
-        st.plotly_chart(fig6, use_container_width=True)
-    else:
-        st.info("No prebook data available")
+@st.fragment
+def show_prebooked_hours():
+    """KPI 6 section, drawn from the prebook-hour counts built at ingest"""
+    with st.expander("6. Hours Prebooked (Time Between Booking and Pickup)", expanded=False):
+        if st.checkbox("Show prebook hours chart", key="show_prebook_hours"):
+            if 'BOOKING TIME' not in df.columns:
+                st.error("BOOKING TIME column not found. Please check data loading.")
+                return
+            prebook_counts = sum_histograms_by_dispatcher(booking_histograms, 'prebook_hours')
+            prebook_counts.columns = PREBOOK_HOUR_BIN_EDGES
+            prebook_counts = prebook_counts.rename_axis('FC NAME').reset_index().melt(id_vars='FC NAME', var_name='PREBOOK HOURS', value_name='LOADS')
+            prebook_counts = prebook_counts[prebook_counts['LOADS'] > 0]
+            if not prebook_counts.empty:
+                def build_prebook_figure():
+                    fig6 = px.bar(prebook_counts, x='PREBOOK HOURS', y='LOADS', color='FC NAME')
+                    # Each bar spans its bin, starting at the bin's lower edge
+                    fig6.update_traces(width=PREBOOK_HOUR_BIN_WIDTH, offset=0)
+                    fig6.update_layout(bargap=0, yaxis_title="count")
+                    return fig6
+
+                fig6 = get_cached_figure('kpi6_prebook_hours', prebook_counts, (), build_prebook_figure)
+                st.plotly_chart(fig6, use_container_width=True)
+                st.caption(f"{PREBOOK_HOUR_BIN_WIDTH}-hour bins; the last bin holds loads booked {PREBOOK_HOUR_BIN_EDGES[-1]} or more hours ahead.")
+            else:
+                st.info("No prebook data available")
+
+show_prebooked_hours()
 
 # --- KPI 7: Latest Booking Time per Dispatcher ---
-with st.expander("7. Latest Booking Time per Dispatcher (Average Hour)", expanded=False):
-    try:
-        # Ensure BOOKING TIME exists and is timezone-naive
-        if 'BOOKING TIME' not in df.columns:
-            st.error("BOOKING TIME column not found. Please check data loading.")
-            st.info("No booking hour data available")
-        else:
-            # Ensure BOOKING TIME is timezone-naive
-            if df['BOOKING TIME'].dt.tz is not None:
-                df['BOOKING TIME'] = df['BOOKING TIME'].dt.tz_localize(None)
-            
-            df['BOOKING HOUR'] = df['BOOKING TIME'].dt.hour
-            avg_booking_hour = df.groupby('FC NAME')['BOOKING HOUR'].mean().reset_index()
-            avg_booking_hour = avg_booking_hour.dropna()
+@st.fragment
+def show_booking_hours():
+    """KPI 7 section, drawn from the booking-hour counts built at ingest"""
+    with st.expander("7. Latest Booking Time per Dispatcher (Average Hour)", expanded=False):
+        if st.checkbox("Show booking hour chart", key="show_booking_hours"):
+            if 'BOOKING TIME' not in df.columns:
+                st.error("BOOKING TIME column not found. Please check data loading.")
+                return
+            # Average booking hour from the hour-of-day counts
+            booking_hour_counts = sum_histograms_by_dispatcher(booking_histograms, 'booking_hours')
+            booking_hour_loads = booking_hour_counts.sum(axis=1)
+            avg_booking_hour = (booking_hour_counts.to_numpy() @ np.arange(24)) / booking_hour_loads.where(booking_hour_loads > 0)
+            avg_booking_hour = avg_booking_hour.rename('BOOKING HOUR').rename_axis('FC NAME').reset_index().dropna()
             if not avg_booking_hour.empty:
-                fig7 = px.bar(avg_booking_hour, x='FC NAME', y='BOOKING HOUR', labels={'BOOKING HOUR': 'Avg Booking Hour'})
+                fig7 = get_cached_figure(
+                    'kpi7_booking_hours', avg_booking_hour, (),
+                    lambda: px.bar(avg_booking_hour, x='FC NAME', y='BOOKING HOUR', labels={'BOOKING HOUR': 'Avg Booking Hour'})
+                )
                 st.plotly_chart(fig7, use_container_width=True)
             else:
                 st.info("No booking hour data available")
-    except Exception as e:
-        st.error(f"Error calculating booking hours: {e}")
-        st.info("No booking hour data available")
+
+show_booking_hours()
 
 # --- KPI 8: Cancellation per Dispatcher and per Driver ---
 st.subheader("8. Load Cancellations")
 
-# Use the main data but include canceled loads for this analysis
-# We need to load the original data without filtering out canceled loads
-try:
-    # Load the original data without filtering out canceled loads
-    if hasattr(file_to_use, 'read'):
-        # Reset file pointer to beginning
-        file_to_use.seek(0)
-        df_with_cancellations = pd.read_csv(file_to_use)
-    else:
-        df_with_cancellations = pd.read_csv(file_to_use)
-    
-    # Apply the same preprocessing as main data but don't filter out canceled loads
-    df_with_cancellations['DELIVERY DATE'] = pd.to_datetime(df_with_cancellations['DELIVERY DATE'], errors='coerce')
-    df_with_cancellations['PICK-UP DATE'] = pd.to_datetime(df_with_cancellations['PICK-UP DATE'], errors='coerce')
-    df_with_cancellations['DATE UPLOADED TO THE SYSTEM'] = pd.to_datetime(df_with_cancellations['DATE UPLOADED TO THE SYSTEM'], errors='coerce')
-    
-    # Convert timezone-aware datetimes to timezone-naive
-    for col in ['DATE UPLOADED TO THE SYSTEM', 'PICK-UP DATE', 'DELIVERY DATE']:
-        if col in df_with_cancellations.columns and df_with_cancellations[col].dt.tz is not None:
-            df_with_cancellations[col] = df_with_cancellations[col].dt.tz_localize(None)
-    
-    # Filter out AMAZON RELAY loads but keep canceled loads
-    if 'BROKER NAME' in df_with_cancellations.columns:
-        df_with_cancellations = df_with_cancellations[~df_with_cancellations['BROKER NAME'].str.contains('AMAZON RELAY', case=False, na=False)]
-    
-    # Convert currency columns
-    df_with_cancellations['BROKER RATE (FC) [$]'] = pd.to_numeric(df_with_cancellations['BROKER RATE (FC) [$]'].astype(str).str.replace(',', '').str.replace('$', ''), errors='coerce')
-    df_with_cancellations['DRIVER RATE [$]'] = pd.to_numeric(df_with_cancellations['DRIVER RATE [$]'].astype(str).str.replace(',', '').str.replace('$', ''), errors='coerce')
-    df_with_cancellations['FULL MILES TOTAL'] = pd.to_numeric(df_with_cancellations['FULL MILES TOTAL'], errors='coerce')
-    
-except Exception as e:
-    st.error(f"Error loading data for cancellation analysis: {e}")
-    df_with_cancellations = pd.DataFrame()
-
-# Check if LOAD STATUS column exists
-if 'LOAD STATUS' in df_with_cancellations.columns:
-    cancelled = df_with_cancellations[df_with_cancellations['LOAD STATUS'].str.contains("cancel", case=False, na=False)]
+# Canceled loads come from the cancellation view built at ingest (not affected by the global filter)
+if 'LOAD STATUS' in df_all.columns:
+    cancelled = df_canceled
 else:
     cancelled = pd.DataFrame()
     st.warning("LOAD STATUS column not found in data. Cancellation analysis will not be available.")
 if not cancelled.empty:
-    cancel_fc = cancelled.groupby('FC NAME').size().reset_index(name='Cancellations')
-    cancel_fc = cancel_fc.sort_values('Cancellations', ascending=False)
-    cancel_driver = cancelled.groupby('DRIVER NAME').size().reset_index(name='Cancellations')
-    cancel_driver = cancel_driver.sort_values('Cancellations', ascending=False)
+    def compute_cancellations():
+        cancel_fc = cancelled.groupby('FC NAME', observed=True).size().reset_index(name='Cancellations')
+        cancel_driver = cancelled.groupby('DRIVER NAME', observed=True).size().reset_index(name='Cancellations')
+        return cancel_fc.sort_values('Cancellations', ascending=False), cancel_driver.sort_values('Cancellations', ascending=False)
+
+    cancel_fc, cancel_driver = get_kpi_result('kpi8_cancellations', (), (), compute_cancellations)
 
     col1, col2 = st.columns(2)
     with col1:
-        fig8a = px.bar(cancel_fc, x='FC NAME', y='Cancellations', title="By Dispatcher",
-                      color='Cancellations', color_continuous_scale='Reds')
-        fig8a.update_traces(texttemplate='%{y:.0f}', textposition='outside')
+        def build_cancel_fc_figure():
+            fig8a = px.bar(cancel_fc, x='FC NAME', y='Cancellations', title="By Dispatcher",
+                          color='Cancellations', color_continuous_scale='Reds')
+            fig8a.update_traces(texttemplate='%{y:.0f}', textposition='outside')
+            return fig8a
+
+        fig8a = get_cached_figure('kpi8_by_dispatcher', cancel_fc, (), build_cancel_fc_figure)
         st.plotly_chart(fig8a, use_container_width=True)
     with col2:
-        fig8b = px.bar(cancel_driver, x='DRIVER NAME', y='Cancellations', title="By Driver",
-                      color='Cancellations', color_continuous_scale='Reds')
-        fig8b.update_traces(texttemplate='%{y:.0f}', textposition='outside')
+        def build_cancel_driver_figure():
+            fig8b = px.bar(cancel_driver, x='DRIVER NAME', y='Cancellations', title="By Driver",
+                          color='Cancellations', color_continuous_scale='Reds')
+            fig8b.update_traces(texttemplate='%{y:.0f}', textposition='outside')
+            return fig8b
+
+        fig8b = get_cached_figure('kpi8_by_driver', cancel_driver, (), build_cancel_driver_figure)
         st.plotly_chart(fig8b, use_container_width=True)
 else:
     st.info("No cancellation data available")
 
 # --- Additional KPIs ---
-st.subheader("9. Additional Performance Metrics")
+# Week-over-week measures: output column -> cube measure
+WEEK_OVER_WEEK_MEASURES = {'Revenue': 'BROKER RATE (FC) [$]', 'Loads': 'Load Count', 'Rated Loads': 'Broker Rate Count'}
 
-# Toggle for PAULO BONILLA
-include_paulo = st.checkbox("Include PAULO BONILLA in Total Revenue by Dispatcher", value=True)
+def get_change_vs_previous_week(weekly):
+    """Percent change of every column versus the previous row (week); 0 when the previous week is 0, NaN for the first week"""
+    previous = weekly.shift(1)
+    return ((weekly - previous) / previous * 100).where(previous > 0, 0).where(previous.notna())
 
-# Get the latest week for analysis
-if 'WEEK' in df.columns and not df.empty:
-    latest_week = df['WEEK'].max()
-    latest_week_data = df[df['WEEK'] == latest_week]
-    
-    # Week-to-week comparison
-    if len(df['WEEK'].unique()) >= 2:
-        previous_week = df[df['WEEK'] < latest_week]['WEEK'].max()
-        previous_week_data = df[df['WEEK'] == previous_week]
-        
-        # Calculate week-to-week variations
-        latest_revenue = latest_week_data['BROKER RATE (FC) [$]'].sum()
-        previous_revenue = previous_week_data['BROKER RATE (FC) [$]'].sum()
-        revenue_change = ((latest_revenue - previous_revenue) / previous_revenue * 100) if previous_revenue > 0 else 0
-        
-        latest_loads = len(latest_week_data)
-        previous_loads = len(previous_week_data)
-        loads_change = ((latest_loads - previous_loads) / previous_loads * 100) if previous_loads > 0 else 0
-        
-        # Display week-to-week summary
-        st.info(f"""
-        **Week-to-Week Comparison (Latest Week: {latest_week.strftime('%b %d, %Y')})**
-        - **Revenue**: ${latest_revenue:,.2f} ({revenue_change:+.1f}% vs previous week)
-        - **Loads**: {latest_loads} ({loads_change:+.1f}% vs previous week)
-        """)
+@st.cache_data
+def compute_week_over_week(cube):
+    """Revenue, loads and average load value per dispatcher and week, with the percent change versus the
+    previous week in the data, for every week in one pass over the cube. 'All Dispatchers' holds the totals."""
+    cube = cube.dropna(subset=['WEEK'])
+    weekly = {}
+    for name, measure in WEEK_OVER_WEEK_MEASURES.items():
+        # Week x dispatcher matrix (0 for weeks without loads), plus a totals column
+        totals = cube.groupby('WEEK')[measure].sum()
+        wide = cube.pivot_table(index='WEEK', columns='FC NAME', values=measure, aggfunc='sum', fill_value=0, observed=True)
+        wide = wide.reindex(totals.index, fill_value=0)
+        wide.columns = wide.columns.astype(str)
+        wide['All Dispatchers'] = totals
+        weekly[name] = wide
+    
+    weekly['Average Load Value'] = (weekly['Revenue'] / weekly['Rated Loads']).where(weekly['Rated Loads'] > 0)
+    for name in ['Revenue', 'Loads', 'Average Load Value']:
+        weekly[f"{name} Change %"] = get_change_vs_previous_week(weekly[name])
+    
+    # Long format: one row per week and dispatcher
+    revenue = weekly['Revenue']
+    week_over_week = pd.DataFrame(
+        {name: wide[revenue.columns].to_numpy().ravel() for name, wide in weekly.items()},
+        index=pd.MultiIndex.from_product([revenue.index, revenue.columns], names=['WEEK', 'FC NAME'])
+    )
     
-    # Revenue by Dispatcher for Latest Week
-    col1, col2 = st.columns(2)
-    with col1:
-        revenue_by_fc_latest = latest_week_data.groupby('FC NAME')['BROKER RATE (FC) [$]'].sum().reset_index()
-        
-        # Filter out PAULO BONILLA if toggle is off
-        if not include_paulo:
-            revenue_by_fc_latest = revenue_by_fc_latest[revenue_by_fc_latest['FC NAME'] != 'PAULO BONILLA']
-        
-        revenue_by_fc_latest = revenue_by_fc_latest.sort_values('BROKER RATE (FC) [$]', ascending=False)
-        fig9a = px.bar(revenue_by_fc_latest, x='FC NAME', y='BROKER RATE (FC) [$]', 
-                      title=f"Total Revenue by Dispatcher - Latest Week ({latest_week.strftime('%b %d, %Y')})",
-                      color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
-        st.plotly_chart(fig9a, use_container_width=True)
+    # Week end and ISO week come from the ingest calendar
+    week_calendar = cube.groupby('WEEK')[['WEEK_END', 'ISO_WEEK']].first()
+    return week_over_week.reset_index().join(week_calendar, on='WEEK')
+
+@st.fragment
+def show_additional_metrics():
+    """KPI 9 section; its week, measure and toggle widgets rerun only this section"""
+    st.subheader("9. Additional Performance Metrics")
+
+    # Toggle for PAULO BONILLA
+    include_paulo = st.checkbox("Include PAULO BONILLA in Total Revenue by Dispatcher", value=True)
+
+    # Week-over-week analysis for every week (rolled up from the cube)
+    if 'WEEK' in df.columns and not df.empty and load_cube['WEEK'].notna().any():
+        week_over_week = compute_week_over_week(load_cube)
+        week_totals = week_over_week[week_over_week['FC NAME'] == 'All Dispatchers'].set_index('WEEK')
+        all_weeks = list(week_totals.index)
+
+        # Scrub through history; defaults to the latest week
+        if len(all_weeks) >= 2:
+            selected_week = st.select_slider(
+                "Week to analyze:",
+                options=all_weeks,
+                value=all_weeks[-1],
+                format_func=lambda week: week.strftime('%b %d, %Y'),
+                key="kpi9_week"
+            )
+        else:
+            selected_week = all_weeks[-1]
+        week_label = "Latest Week" if selected_week == all_weeks[-1] else "Week"
+        selected_week_cube = load_cube[load_cube['WEEK'] == selected_week]
+
+        # Week-to-week comparison
+        if selected_week != all_weeks[0]:
+            selected_totals = week_totals.loc[selected_week]
+            st.info(f"""
+            **Week-to-Week Comparison ({week_label}: {selected_week.strftime('%b %d')} - {selected_totals['WEEK_END'].strftime('%b %d, %Y')}, ISO week {selected_totals['ISO_WEEK']})**
+            - **Revenue**: ${selected_totals['Revenue']:,.2f} ({selected_totals['Revenue Change %']:+.1f}% vs previous week)
+            - **Loads**: {selected_totals['Loads']:.0f} ({selected_totals['Loads Change %']:+.1f}% vs previous week)
+            - **Average Load Value**: ${selected_totals['Average Load Value']:,.2f} ({selected_totals['Average Load Value Change %']:+.1f}% vs previous week)
+            """)
 
-    with col2:
-        # Average load value by dispatcher for latest week
-        avg_load_by_fc_latest = latest_week_data.groupby('FC NAME')['BROKER RATE (FC) [$]'].mean().reset_index()
-        avg_load_by_fc_latest = avg_load_by_fc_latest.sort_values('BROKER RATE (FC) [$]', ascending=False)
-        fig9b = px.bar(avg_load_by_fc_latest, x='FC NAME', y='BROKER RATE (FC) [$]', 
-                      title=f"Average Load Value by Dispatcher - Latest Week ({latest_week.strftime('%b %d, %Y')})",
-                      color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
-        st.plotly_chart(fig9b, use_container_width=True)
-    
-    # Week-over-week trend chart
-    if len(df['WEEK'].unique()) >= 2:
-        st.subheader("Week-over-Week Revenue Trend")
-        weekly_revenue = df.groupby('WEEK')['BROKER RATE (FC) [$]'].sum().reset_index()
-        weekly_revenue['WEEK_DISPLAY'] = weekly_revenue['WEEK'].dt.strftime('%b %d, %Y')
-        
-        fig9c = px.line(weekly_revenue, x='WEEK_DISPLAY', y='BROKER RATE (FC) [$]', 
-                       title="Weekly Revenue Trend", markers=True)
-        fig9c.update_layout(xaxis_title="Week", yaxis_title="Total Revenue ($)")
-        st.plotly_chart(fig9c, use_container_width=True)
+        # Revenue by Dispatcher for the selected week
+        col1, col2 = st.columns(2)
+        with col1:
+            revenue_by_fc_latest = selected_week_cube.groupby('FC NAME', observed=True)['BROKER RATE (FC) [$]'].sum().reset_index()
+
+            # Filter out PAULO BONILLA if toggle is off
+            if not include_paulo:
+                revenue_by_fc_latest = revenue_by_fc_latest[revenue_by_fc_latest['FC NAME'] != 'PAULO BONILLA']
+
+            revenue_by_fc_latest = revenue_by_fc_latest.sort_values('BROKER RATE (FC) [$]', ascending=False)
+            revenue_title = f"Total Revenue by Dispatcher - {week_label} ({selected_week.strftime('%b %d, %Y')})"
+            fig9a = get_cached_figure(
+                'kpi9_week_revenue', revenue_by_fc_latest, (revenue_title,),
+                lambda: px.bar(revenue_by_fc_latest, x='FC NAME', y='BROKER RATE (FC) [$]', title=revenue_title,
+                               color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
+            )
+            st.plotly_chart(fig9a, use_container_width=True)
 
-else:
-    # Fallback to overall data if no week information
-    col1, col2 = st.columns(2)
-    with col1:
-        revenue_by_fc = df.groupby('FC NAME')['BROKER RATE (FC) [$]'].sum().reset_index()
-        
-        # Filter out PAULO BONILLA if toggle is off
-        if not include_paulo:
-            revenue_by_fc = revenue_by_fc[revenue_by_fc['FC NAME'] != 'PAULO BONILLA']
-        
-        revenue_by_fc = revenue_by_fc.sort_values('BROKER RATE (FC) [$]', ascending=False)
-        fig9a = px.bar(revenue_by_fc, x='FC NAME', y='BROKER RATE (FC) [$]', title="Total Revenue by Dispatcher (All Data)",
-                      color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
-        st.plotly_chart(fig9a, use_container_width=True)
+        with col2:
+            # Average load value by dispatcher for the selected week
+            avg_load_by_fc_latest = selected_week_cube.groupby('FC NAME', observed=True)[['BROKER RATE (FC) [$]', 'Broker Rate Count']].sum()
+            avg_load_by_fc_latest = (avg_load_by_fc_latest['BROKER RATE (FC) [$]'] / avg_load_by_fc_latest['Broker Rate Count']).reset_index(name='BROKER RATE (FC) [$]')
+            avg_load_by_fc_latest = avg_load_by_fc_latest.sort_values('BROKER RATE (FC) [$]', ascending=False)
+            avg_load_title = f"Average Load Value by Dispatcher - {week_label} ({selected_week.strftime('%b %d, %Y')})"
+            fig9b = get_cached_figure(
+                'kpi9_week_avg_load', avg_load_by_fc_latest, (avg_load_title,),
+                lambda: px.bar(avg_load_by_fc_latest, x='FC NAME', y='BROKER RATE (FC) [$]', title=avg_load_title,
+                               color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
+            )
+            st.plotly_chart(fig9b, use_container_width=True)
+
+        # Week-over-week trend charts
+        if len(all_weeks) >= 2:
+            st.subheader("Week-over-Week Revenue Trend")
+            weekly_revenue = week_totals['Revenue'].rename('BROKER RATE (FC) [$]').reset_index()
+            weekly_revenue['WEEK_DISPLAY'] = weekly_revenue['WEEK'].dt.strftime('%b %d, %Y')
+
+            def build_revenue_trend_figure():
+                fig9c = px.line(weekly_revenue, x='WEEK_DISPLAY', y='BROKER RATE (FC) [$]', 
+                               title="Weekly Revenue Trend", markers=True)
+                fig9c.update_layout(xaxis_title="Week", yaxis_title="Total Revenue ($)")
+                return fig9c
+
+            fig9c = get_cached_figure('kpi9_revenue_trend', weekly_revenue, (), build_revenue_trend_figure)
+            st.plotly_chart(fig9c, use_container_width=True)
+
+            # Change versus the previous week, per dispatcher and in total
+            change_measure = st.radio("Week-over-week change in:", ['Revenue', 'Loads', 'Average Load Value'],
+                                      horizontal=True, key="kpi9_change_measure")
+            weekly_changes = week_over_week[week_over_week['WEEK'] != all_weeks[0]]
+            def build_change_figure():
+                fig9d = px.line(weekly_changes, x='WEEK', y=f"{change_measure} Change %", color='FC NAME', markers=True,
+                                title=f"Week-over-Week {change_measure} Change by Dispatcher")
+                fig9d.add_hline(y=0, line_dash="dot", line_color="gray")
+                fig9d.update_layout(xaxis_title="Week (Tuesday-Monday)", yaxis_title="Change vs Previous Week (%)",
+                                    legend_title="Dispatcher (FC)")
+                return fig9d
+
+            fig9d = get_cached_figure('kpi9_week_over_week', weekly_changes[['WEEK', 'FC NAME', f"{change_measure} Change %"]],
+                                      (change_measure,), build_change_figure)
+            st.plotly_chart(fig9d, use_container_width=True)
+
+            with st.expander("📊 Week-over-Week Changes Table", expanded=False):
+                changes_table = weekly_changes[['WEEK', 'FC NAME', change_measure, f"{change_measure} Change %"]].copy()
+                changes_table['WEEK'] = changes_table['WEEK'].dt.strftime('%b %d, %Y')
+                changes_table[f"{change_measure} Change %"] = changes_table[f"{change_measure} Change %"].round(1)
+                st.dataframe(changes_table, use_container_width=True, hide_index=True)
 
-    with col2:
-        # Average load value by dispatcher
-        avg_load_by_fc = df.groupby('FC NAME')['BROKER RATE (FC) [$]'].mean().reset_index()
-        avg_load_by_fc = avg_load_by_fc.sort_values('BROKER RATE (FC) [$]', ascending=False)
-        fig9b = px.bar(avg_load_by_fc, x='FC NAME', y='BROKER RATE (FC) [$]', title="Average Load Value by Dispatcher (All Data)",
-                      color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
-        st.plotly_chart(fig9b, use_container_width=True)
+    else:
+        # Fallback to overall data if no week information
+        col1, col2 = st.columns(2)
+        with col1:
+            revenue_by_fc = df.groupby('FC NAME', observed=True)['BROKER RATE (FC) [$]'].sum().reset_index()
+
+            # Filter out PAULO BONILLA if toggle is off
+            if not include_paulo:
+                revenue_by_fc = revenue_by_fc[revenue_by_fc['FC NAME'] != 'PAULO BONILLA']
+
+            revenue_by_fc = revenue_by_fc.sort_values('BROKER RATE (FC) [$]', ascending=False)
+            fig9a = px.bar(revenue_by_fc, x='FC NAME', y='BROKER RATE (FC) [$]', title="Total Revenue by Dispatcher (All Data)",
+                          color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
+            st.plotly_chart(fig9a, use_container_width=True)
+
+        with col2:
+            # Average load value by dispatcher
+            avg_load_by_fc = df.groupby('FC NAME', observed=True)['BROKER RATE (FC) [$]'].mean().reset_index()
+            avg_load_by_fc = avg_load_by_fc.sort_values('BROKER RATE (FC) [$]', ascending=False)
+            fig9b = px.bar(avg_load_by_fc, x='FC NAME', y='BROKER RATE (FC) [$]', title="Average Load Value by Dispatcher (All Data)",
+                          color='BROKER RATE (FC) [$]', color_continuous_scale='Greens')
+            st.plotly_chart(fig9b, use_container_width=True)
+
+show_additional_metrics()
 
 # Load Status Distribution
 st.subheader("10. Load Status Distribution")
-if 'LOAD STATUS' in df_with_cancellations.columns:
-    status_counts = df_with_cancellations['LOAD STATUS'].value_counts().reset_index()
+if 'LOAD STATUS' in df_all.columns:
+    status_counts = df_all['LOAD STATUS'].value_counts().reset_index()
     status_counts.columns = ['Status', 'Count']
     fig10 = px.pie(status_counts, values='Count', names='Status', title="Load Status Distribution (Including Cancellations)")
     st.plotly_chart(fig10, use_container_width=True)
@@ -1796,157 +2863,183 @@ with col4:
     st.metric("Total Miles", f"{total_miles:,.0f}")
 
 # Data table for detailed view
-with st.expander("12. Detailed Load Data", expanded=False):
-    if st.checkbox("Show detailed data table"):
-        st.dataframe(df, use_container_width=True)
+@st.fragment
+def show_detailed_load_data():
+    """Detailed load table, read only while it is switched on"""
+    with st.expander("12. Detailed Load Data", expanded=False):
+        if st.checkbox("Show detailed data table"):
+            # Every column of the globally filtered rows, gathered only while the table is shown
+            detailed_loads = read_filter_rows(invoiced_loads, global_filter_rows).assign(RPM=df['RPM'].to_numpy())
+            # Columns outside LOAD_SCHEMA are only read from the raw file when asked for
+            if incremental_mode:
+                st.caption("Only the dashboard's columns are kept in the saved load history.")
+                st.dataframe(detailed_loads, use_container_width=True)
+            elif st.checkbox("Include all export columns", value=False):
+                # Export columns named like a derived column (e.g. WEEK) keep the cleaned value
+                extra_columns = load_extra_columns(file_to_use, content_hash).drop(columns=detailed_loads.columns, errors='ignore')
+                st.dataframe(detailed_loads.join(extra_columns, on='SOURCE_ROW'), use_container_width=True)
+            else:
+                st.dataframe(detailed_loads, use_container_width=True)
+
+show_detailed_load_data()
 
 # Reference Data Information
-if reference_data:
-    with st.expander("13. Reference Data Information", expanded=False):
-        
-        if 'market' in reference_data:
-            st.write("**Market Data:**")
-            st.write(f"- Rows: {len(reference_data['market'])}")
-            st.write(f"- Columns: {list(reference_data['market'].columns)}")
-            if st.checkbox("Show market data preview"):
-                st.dataframe(reference_data['market'].head(), use_container_width=True)
-        
-        if 'dead_zones' in reference_data:
-            st.write("**Dead Zones Data:**")
-            st.write(f"- Rows: {len(reference_data['dead_zones'])}")
-            st.write(f"- Columns: {list(reference_data['dead_zones'].columns)}")
-            if st.checkbox("Show dead zones data preview"):
-                st.dataframe(reference_data['dead_zones'].head(), use_container_width=True)
-        
-        if 'market_rates' in reference_data:
-            st.write("**Market Rates Data:**")
-            st.write(f"- Rows: {len(reference_data['market_rates'])}")
-            st.write(f"- Columns: {list(reference_data['market_rates'].columns)}")
-            if st.checkbox("Show market rates data preview"):
-                st.dataframe(reference_data['market_rates'].head(), use_container_width=True)
-        
-        if 'driver_fc' in reference_data:
-            st.write("**Driver-FC Mapping:**")
-            st.write(f"- Rows: {len(reference_data['driver_fc'])}")
-            st.write(f"- Columns: {list(reference_data['driver_fc'].columns)}")
-            if st.checkbox("Show driver-FC mapping preview"):
-                st.dataframe(reference_data['driver_fc'].head(), use_container_width=True)
-        
-        if 'load_history' in reference_data:
-            st.write("**Load History:**")
-            st.write(f"- Rows: {len(reference_data['load_history'])}")
-            st.write(f"- Columns: {list(reference_data['load_history'].columns)}")
-            if st.checkbox("Show load history preview"):
-                st.dataframe(reference_data['load_history'].head(), use_container_width=True)
+@st.fragment
+def show_reference_data_info():
+    """Reference data summary; the preview checkboxes rerun only this section"""
+    if reference_data:
+        with st.expander("13. Reference Data Information", expanded=False):
+
+            if 'market' in reference_data:
+                st.write("**Market Data:**")
+                st.write(f"- Rows: {len(reference_data['market'])}")
+                st.write(f"- Columns: {list(reference_data['market'].columns)}")
+                if st.checkbox("Show market data preview"):
+                    st.dataframe(reference_data['market'].head(), use_container_width=True)
+
+            if 'dead_zones' in reference_data:
+                st.write("**Dead Zones Data:**")
+                st.write(f"- Rows: {len(reference_data['dead_zones'])}")
+                st.write(f"- Columns: {list(reference_data['dead_zones'].columns)}")
+                if st.checkbox("Show dead zones data preview"):
+                    st.dataframe(reference_data['dead_zones'].head(), use_container_width=True)
+
+            if 'market_rates' in reference_data:
+                st.write("**Market Rates Data:**")
+                st.write(f"- Rows: {len(reference_data['market_rates'])}")
+                st.write(f"- Columns: {list(reference_data['market_rates'].columns)}")
+                if st.checkbox("Show market rates data preview"):
+                    st.dataframe(reference_data['market_rates'].head(), use_container_width=True)
+
+            if 'driver_fc' in reference_data:
+                st.write("**Driver-FC Mapping:**")
+                st.write(f"- Rows: {len(reference_data['driver_fc'])}")
+                st.write(f"- Columns: {list(reference_data['driver_fc'].columns)}")
+                if st.checkbox("Show driver-FC mapping preview"):
+                    st.dataframe(reference_data['driver_fc'].head(), use_container_width=True)
+
+            if 'load_history' in reference_data:
+                st.write("**Load History:**")
+                st.write(f"- Rows: {len(reference_data['load_history'])}")
+                st.write(f"- Columns: {list(reference_data['load_history'].columns)}")
+                if st.checkbox("Show load history preview"):
+                    st.dataframe(reference_data['load_history'].head(), use_container_width=True)
+
+show_reference_data_info()
 
 # --- KPI 14: Trucking Made Successful Market Analysis ---
-if any(key in reference_data for key in ['market', 'dead_zones', 'market_rates']):
-    with st.expander("14. Trucking Made Successful Market Analysis", expanded=False):
-        
-        # Market rate comparison
-        if 'market_rates' in reference_data:
-            try:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write("**Market Rate Comparison**")
-                    market_rates = reference_data['market_rates']
-                    
-                    # Handle Trucking Made Successful format
-                    if 'value' in market_rates.columns:
-                        # Use 'value' as rate and 'name' as state
-                        fig14a = px.bar(market_rates.head(10), x='name', y='value', 
-                                       title="Top 10 States by Market Rate")
-                    elif 'STATE' in market_rates.columns and 'RATE' in market_rates.columns:
-                        # Standard format
-                        fig14a = px.bar(market_rates.head(10), x='STATE', y='RATE', 
-                                       title="Top 10 States by Market Rate")
-                    elif 'STATE' in market_rates.columns and 'value' in market_rates.columns:
-                        # Processed Trucking Made Successful format
-                        fig14a = px.bar(market_rates.head(10), x='STATE', y='value', 
-                                       title="Top 10 States by Market Rate")
-                    elif 'STATE' in market_rates.columns and 'MARKET_RATE' in market_rates.columns:
-                        # Converted files format
-                        fig14a = px.bar(market_rates.head(10), x='STATE', y='MARKET_RATE', 
-                                       title="Top 10 States by Market Rate")
-                    else:
-                        st.info("Market rates data format not recognized")
-                        fig14a = None
-                    
-                    if fig14a is not None:
-                        st.plotly_chart(fig14a, use_container_width=True)
-                
-                with col2:
-                    st.write("**Load Volume Analysis**")
-                    if 'market' in reference_data:
-                        market_data = reference_data['market']
-                        
-                        # Handle Trucking Made Successful format for load data
-                        if 'value' in market_data.columns:
-                            fig14b = px.histogram(market_data, x='value', 
-                                                 title="Load Volume Distribution by State")
-                        elif 'LOAD_TO_TRUCK_RATIO' in market_data.columns:
-                            fig14b = px.histogram(market_data, x='LOAD_TO_TRUCK_RATIO', 
-                                                 title="Load-to-Truck Ratio Distribution")
-                        elif 'STATE' in market_data.columns and 'LOAD_VOLUME' in market_data.columns:
+@st.fragment
+def show_market_analysis():
+    """KPI 14 section, computed only while its charts are switched on"""
+    if any(key in reference_data for key in ['market', 'dead_zones', 'market_rates']):
+        with st.expander("14. Trucking Made Successful Market Analysis", expanded=False):
+            if st.checkbox("Show market analysis charts", key="show_market_analysis"):
+                # Market rate comparison
+                if 'market_rates' in reference_data:
+                    try:
+                        col1, col2 = st.columns(2)
+
+                        with col1:
+                            st.write("**Market Rate Comparison**")
+                            market_rates = reference_data['market_rates']
+
+                            # Handle Trucking Made Successful format
+                            if 'value' in market_rates.columns:
+                                # Use 'value' as rate and 'name' as state
+                                fig14a = px.bar(market_rates.head(10), x='name', y='value', 
+                                               title="Top 10 States by Market Rate")
+                            elif 'STATE' in market_rates.columns and 'RATE' in market_rates.columns:
+                                # Standard format
+                                fig14a = px.bar(market_rates.head(10), x='STATE', y='RATE', 
+                                               title="Top 10 States by Market Rate")
+                            elif 'STATE' in market_rates.columns and 'value' in market_rates.columns:
+                                # Processed Trucking Made Successful format
+                                fig14a = px.bar(market_rates.head(10), x='STATE', y='value', 
+                                               title="Top 10 States by Market Rate")
+                            elif 'STATE' in market_rates.columns and 'MARKET_RATE' in market_rates.columns:
+                                # Converted files format
+                                fig14a = px.bar(market_rates.head(10), x='STATE', y='MARKET_RATE', 
+                                               title="Top 10 States by Market Rate")
+                            else:
+                                st.info("Market rates data format not recognized")
+                                fig14a = None
+
+                            if fig14a is not None:
+                                st.plotly_chart(fig14a, use_container_width=True)
+
+                        with col2:
+                            st.write("**Load Volume Analysis**")
+                            if 'market' in reference_data:
+                                market_data = reference_data['market']
+
+                                # Handle Trucking Made Successful format for load data
+                                if 'value' in market_data.columns:
+                                    fig14b = px.histogram(market_data, x='value', 
+                                                         title="Load Volume Distribution by State")
+                                elif 'LOAD_TO_TRUCK_RATIO' in market_data.columns:
+                                    fig14b = px.histogram(market_data, x='LOAD_TO_TRUCK_RATIO', 
+                                                         title="Load-to-Truck Ratio Distribution")
+                                elif 'STATE' in market_data.columns and 'LOAD_VOLUME' in market_data.columns:
+                                    # Converted files format
+                                    fig14b = px.histogram(market_data, x='LOAD_VOLUME', 
+                                                         title="Load Volume Distribution by State")
+                                else:
+                                    st.info("Load data format not recognized")
+                                    fig14b = None
+
+                                if fig14b is not None:
+                                    st.plotly_chart(fig14b, use_container_width=True)
+
+                    except Exception as e:
+                        st.error(f"Error in market analysis: {e}")
+
+                # Dead zone profitability analysis
+                if 'dead_zones' in reference_data:
+                    try:
+                        st.write("**Dead Zone Analysis**")
+                        dead_zones = reference_data['dead_zones']
+
+                        # Handle different data formats
+                        if 'value' in dead_zones.columns and 'name' in dead_zones.columns:
+                            # Trucking Made Successful format - show state vs value
+                            fig14c = px.scatter(dead_zones, x='name', y='value', 
+                                               title="Dead Zone Analysis by State")
+                        elif 'STATE' in dead_zones.columns and 'value' in dead_zones.columns:
+                            # Processed format
+                            fig14c = px.scatter(dead_zones, x='STATE', y='value', 
+                                               title="Dead Zone Analysis by State")
+                        elif 'STATE' in dead_zones.columns and 'DEAD_DELIVERIES' in dead_zones.columns:
                             # Converted files format
-                            fig14b = px.histogram(market_data, x='LOAD_VOLUME', 
-                                                 title="Load Volume Distribution by State")
+                            fig14c = px.scatter(dead_zones, x='STATE', y='DEAD_DELIVERIES', 
+                                               title="Dead Zone Analysis by State")
+                        elif 'PROFITABILITY_SCORE' in dead_zones.columns:
+                            # Standard format with profitability
+                            fig14c = px.scatter(dead_zones, x='MARKET_RATE', y='PROFITABILITY_SCORE', 
+                                               color='STATE', title="Dead Zone Profitability vs Market Rate")
                         else:
-                            st.info("Load data format not recognized")
-                            fig14b = None
-                        
-                        if fig14b is not None:
-                            st.plotly_chart(fig14b, use_container_width=True)
-            
-            except Exception as e:
-                st.error(f"Error in market analysis: {e}")
-        
-        # Dead zone profitability analysis
-        if 'dead_zones' in reference_data:
-            try:
-                st.write("**Dead Zone Analysis**")
-                dead_zones = reference_data['dead_zones']
-                
-                # Handle different data formats
-                if 'value' in dead_zones.columns and 'name' in dead_zones.columns:
-                    # Trucking Made Successful format - show state vs value
-                    fig14c = px.scatter(dead_zones, x='name', y='value', 
-                                       title="Dead Zone Analysis by State")
-                elif 'STATE' in dead_zones.columns and 'value' in dead_zones.columns:
-                    # Processed format
-                    fig14c = px.scatter(dead_zones, x='STATE', y='value', 
-                                       title="Dead Zone Analysis by State")
-                elif 'STATE' in dead_zones.columns and 'DEAD_DELIVERIES' in dead_zones.columns:
-                    # Converted files format
-                    fig14c = px.scatter(dead_zones, x='STATE', y='DEAD_DELIVERIES', 
-                                       title="Dead Zone Analysis by State")
-                elif 'PROFITABILITY_SCORE' in dead_zones.columns:
-                    # Standard format with profitability
-                    fig14c = px.scatter(dead_zones, x='MARKET_RATE', y='PROFITABILITY_SCORE', 
-                                       color='STATE', title="Dead Zone Profitability vs Market Rate")
-                else:
-                    st.info("Dead zone data format not recognized")
-                    fig14c = None
-                
-                if fig14c is not None:
-                    st.plotly_chart(fig14c, use_container_width=True)
-            except Exception as e:
-                st.error(f"Error in dead zone analysis: {e}")
-        
-        # Show data preview
-        with st.expander("📊 Data Preview", expanded=False):
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if 'market_rates' in reference_data:
-                    st.write("**Market Rates Data Preview**")
-                    st.dataframe(reference_data['market_rates'].head(), use_container_width=True)
-            
-            with col2:
-                if 'market' in reference_data:
-                    st.write("**Market Data Preview**")
-                    st.dataframe(reference_data['market'].head(), use_container_width=True)
+                            st.info("Dead zone data format not recognized")
+                            fig14c = None
+
+                        if fig14c is not None:
+                            st.plotly_chart(fig14c, use_container_width=True)
+                    except Exception as e:
+                        st.error(f"Error in dead zone analysis: {e}")
+
+                # Show data preview
+                with st.expander("📊 Data Preview", expanded=False):
+                    col1, col2 = st.columns(2)
+
+                    with col1:
+                        if 'market_rates' in reference_data:
+                            st.write("**Market Rates Data Preview**")
+                            st.dataframe(reference_data['market_rates'].head(), use_container_width=True)
+
+                    with col2:
+                        if 'market' in reference_data:
+                            st.write("**Market Data Preview**")
+                            st.dataframe(reference_data['market'].head(), use_container_width=True)
+
+show_market_analysis()
 
 # Sidebar information
 st.sidebar.title("ℹ️ Dashboard Info")
@@ -1959,14 +3052,53 @@ st.sidebar.markdown("""
 - Unique Dispatchers: {}
 - Date Range: {} to {}
 """.format(
-    len(df),
-    df['BROKER RATE (FC) [$]'].sum(),
-    df['DRIVER NAME'].nunique(),
-    df['FC NAME'].nunique(),
-    df['DELIVERY DATE'].min().strftime('%Y-%m-%d') if pd.notna(df['DELIVERY DATE'].min()) else 'N/A',
-    df['DELIVERY DATE'].max().strftime('%Y-%m-%d') if pd.notna(df['DELIVERY DATE'].max()) else 'N/A'
+    load_cube['Load Count'].sum(),
+    load_cube['BROKER RATE (FC) [$]'].sum(),
+    load_cube['DRIVER NAME'].nunique(),
+    load_cube['FC NAME'].nunique(),
+    load_cube['FIRST DELIVERY'].min().strftime('%Y-%m-%d') if pd.notna(load_cube['FIRST DELIVERY'].min()) else 'N/A',
+    load_cube['LAST DELIVERY'].max().strftime('%Y-%m-%d') if pd.notna(load_cube['LAST DELIVERY'].max()) else 'N/A'
 ))
 
+def set_lru_cache_ceiling(cache, ceiling_key):
+    """Apply a changed memory ceiling to a shared LRU cache, evicting down to it"""
+    with cache['lock']:
+        cache['max_bytes'] = int(st.session_state[ceiling_key]) * 1024 * 1024
+        trim_lru_cache(cache)
+
+def show_lru_cache_stats(cache, label, ceiling_key):
+    """Memory ceiling input and hit/miss counters for one of the shared LRU caches"""
+    st.markdown(f"**{label}**")
+    # The ceiling is app-wide, so it is only written when this input changes, never on a plain rerun
+    st.number_input(
+        "Memory ceiling (MB, all sessions)",
+        min_value=16,
+        max_value=8192,
+        value=cache['max_bytes'] // (1024 * 1024),
+        step=16,
+        key=ceiling_key,
+        on_change=set_lru_cache_ceiling,
+        args=(cache, ceiling_key),
+        help="Least recently used entries are evicted once the cache grows past this size. "
+             "The ceiling is shared by every session on this server."
+    )
+    with cache['lock']:
+        stats = {name: cache[name] for name in ['hits', 'misses', 'evictions', 'bytes']}
+        entries = len(cache['entries'])
+        max_mb = cache['max_bytes'] // (1024 * 1024)
+    lookups = stats['hits'] + stats['misses']
+    st.markdown(f"""
+- Hits: {stats['hits']:,} / Misses: {stats['misses']:,}
+- Hit rate: {(stats['hits'] / lookups * 100) if lookups else 0:.1f}%
+- Entries: {entries:,} ({stats['bytes'] / (1024 * 1024):.1f} MB of {max_mb:,} MB)
+- Evictions: {stats['evictions']:,}
+""")
+
+# Cache instrumentation (both caches are shared by every session on this server)
+with st.sidebar.expander("⚡ Cache Instrumentation", expanded=False):
+    show_lru_cache_stats(kpi_result_cache, "KPI results", "kpi_cache_max_mb")
+    show_lru_cache_stats(figure_cache, "Figures", "figure_cache_max_mb")
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("**Need Help?**")
 st.sidebar.markdown("Check the README.md file for detailed instructions.") 
\ No newline at end of file